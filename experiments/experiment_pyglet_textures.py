@@ -4,6 +4,8 @@ import pyglet
 import time
 from pyglet.gl import *
 
+from secundus.render import QuadVertices, PygletQuads
+
 
 class World:
     def __init__(self, position, velocity, color, texture):
@@ -25,7 +27,8 @@ def make_world():
     })
     # magical 4 times multiplication to satisfy opengl quads..
     color = [255, 255, 255, 255] * amount * 4
-    texture = gold_image.texture.tex_coords * amount
+    texture = np.array(gold_image.texture.tex_coords * amount,
+                       dtype=np.float32)
     return World(position, velocity, color, texture)
 
 
@@ -39,28 +42,21 @@ gold_image.anchor_x = gold_image.width // 2
 gold_image.anchor_y = gold_image.height // 2
 
 
-def render(w):
-    scaled = w.position * 600
-    x1 = scaled['x'] - gold_image.anchor_x
-    y1 = scaled['y'] - gold_image.anchor_y
-    x2 = x1 + gold_image.width
-    y2 = y1 + gold_image.height
-    df = pd.DataFrame({'a_x': x1, 'a_y': y1,
-                       'b_x': x2, 'b_y': y1,
-                       'c_x': x2, 'c_y': y2,
-                       'd_x': x1, 'd_y': y2},
-                      columns=['a_x', 'a_y', 'b_x', 'b_y',
-                               'c_x', 'c_y', 'd_x', 'd_y'])
-    r = df.values.flatten()
-
+def make_renderer():
+    quads = QuadVertices(gold_image.width, gold_image.height,
+                         gold_image.anchor_x, gold_image.anchor_y, scale=600)
     batch = pyglet.graphics.Batch()
-    texture = gold_image.get_texture()
-    group = pyglet.sprite.SpriteGroup(texture, GL_SRC_ALPHA,
+    group = pyglet.sprite.SpriteGroup(gold_image.get_texture(), GL_SRC_ALPHA,
                                       GL_ONE_MINUS_SRC_ALPHA)
-    batch.add(len(scaled.values) * 4, GL_QUADS, group,
-              ('v2f/dynamic', r),
-              ('c4B', w.color),
-              ('t3f', w.texture))
+    return quads, batch, PygletQuads(quads, batch, group)
+
+
+def render(w, renderer):
+    # the vertex list persists between frames; only its contents change
+    quads, batch, pyglet_quads = renderer
+    quads.update(w.position['x'].to_numpy(), w.position['y'].to_numpy(),
+                 tex_coords=w.texture)
+    pyglet_quads.upload()
     batch.draw()
 
 
@@ -68,11 +64,12 @@ class Window(pyglet.window.Window):
     def __init__(self, *args, **kw):
         super().__init__(*args, **kw)
         self.w = make_world()
+        self.renderer = make_renderer()
         self.fps_display = pyglet.clock.ClockDisplay()
 
     def on_draw(self):
         self.clear()
-        render(self.w)
+        render(self.w, self.renderer)
         self.fps_display.draw()
 
     def animate(self, delta_time):
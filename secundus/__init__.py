@@ -1,2 +1,6 @@
 from .directive import App
-from .registry import DictContainer, DataFrameContainer
+from .registry import (
+    Query, DictContainer, DataFrameContainer, ArrayContainer,
+    SparseSetContainer)
+from .memmap import MemmapContainer
+from .spatial import GridIndex
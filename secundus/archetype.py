@@ -0,0 +1,396 @@
+from functools import partial
+
+import numpy as np
+
+from .commands import CommandBuffer
+from .instrument import Instrumentation
+from .registry import (
+    ArrayContainer, DictContainer, _ChangeCounter, _count, _item_func)
+
+
+class Archetype:
+    """Columnar storage for all entities with the same set of components.
+
+    There is a column for each component. Columns are
+    :class:`ArrayContainer` instances that see exactly the same adds and
+    removes, so their rows stay aligned: row ``n`` of every column
+    belongs to the same entity.
+
+    :param component_ids: the component ids of the entities stored here.
+    :param dtypes: a dict mapping component id to the NumPy dtype of
+      its column.
+    """
+    def __init__(self, component_ids, dtypes):
+        self.component_ids = frozenset(component_ids)
+        self.columns = {component_id: ArrayContainer(dtypes[component_id])
+                        for component_id in self.component_ids}
+
+    def add(self, entity_id, components):
+        """Add an entity with a component for each column.
+        """
+        for component_id, column in self.columns.items():
+            column[entity_id] = components[component_id]
+
+    def add_many(self, entity_ids, columns):
+        """Add many entities at once, with a column of components each.
+        """
+        for component_id, column in self.columns.items():
+            column.add_many(entity_ids, columns[component_id])
+
+    def remove(self, entity_id):
+        """Remove an entity from all columns.
+        """
+        for column in self.columns.values():
+            del column[entity_id]
+
+    def remove_many(self, entity_ids):
+        """Remove many entities from all columns at once.
+        """
+        for column in self.columns.values():
+            column.remove_many(entity_ids)
+
+    def get(self, entity_id, component_id):
+        return self.columns[component_id][entity_id]
+
+    def __len__(self):
+        for column in self.columns.values():
+            return len(column)
+        return 0
+
+    def keys(self):
+        """Entity ids stored in this archetype, in row order.
+        """
+        for column in self.columns.values():
+            return column.keys()
+        return []
+
+
+class ArchetypeRegistry:
+    """Entity component system registry with archetype storage.
+
+    Instead of a container per component, entities that have the
+    same set of components are stored together in an
+    :class:`Archetype`. Adding or removing a component moves the entity
+    to another archetype.
+
+    Systems are :class:`ArchetypeSystem` instances. A system's query is
+    the list of archetypes that have all the components it needs. It is
+    maintained as new archetypes appear, so no per-entity joins
+    are needed during execution.
+
+    It has the entity, command, sync point and instrumentation API of a
+    :class:`Registry`, but not its execution plans, so it can't be used
+    with a :class:`Scheduler`, and it doesn't do snapshots, indexes or
+    fusion. Entity ids are increasing integers that aren't recycled.
+    """
+    def __init__(self):
+        self.dtypes = {}
+        self.archetypes = {}
+        self.entity_archetypes = {}
+        self.systems = []
+        self.entity_id_counter = 0
+        self.change_counter = _ChangeCounter()
+        self.sync_points = set()
+        self.commands = CommandBuffer(self)
+        self.instrumentation = None
+
+    @property
+    def structural_changes(self):
+        """The number of components added and removed by this thread.
+        """
+        return self.change_counter.count
+
+    def register_component(self, component_id, dtype=object):
+        """Register a component.
+
+        :param dtype: the NumPy dtype used for the columns that store this
+          component. By default components are arbitrary Python objects.
+          An :class:`ArrayContainer` or :class:`DictContainer` is accepted
+          too, as made by the ``component`` directive; only its dtype is
+          used.
+        """
+        if isinstance(dtype, ArrayContainer):
+            dtype = dtype.dtype
+        elif isinstance(dtype, DictContainer):
+            dtype = object
+        elif hasattr(dtype, 'value'):
+            raise TypeError(
+                "Archetype storage can't use container: %r" % dtype)
+        self.dtypes[component_id] = dtype
+
+    def register_system(self, system):
+        """Register an :class:`ArchetypeSystem`.
+        """
+        self.systems.append(system)
+        for archetype in self.archetypes.values():
+            system.match(archetype)
+
+    def add_sync_point(self):
+        """Apply recorded commands after the systems registered so far.
+
+        See :meth:`Registry.add_sync_point`.
+        """
+        if self.systems:
+            self.sync_points.add(len(self.systems) - 1)
+
+    def archetype(self, component_ids):
+        """Get the archetype for a set of components, creating it if needed.
+        """
+        component_ids = frozenset(component_ids)
+        archetype = self.archetypes.get(component_ids)
+        if archetype is not None:
+            return archetype
+        archetype = Archetype(component_ids, self.dtypes)
+        self.archetypes[component_ids] = archetype
+        for system in self.systems:
+            system.match(archetype)
+        return archetype
+
+    def has_components(self, entity_id, component_ids):
+        """Check whether an entity has the listed component_ids.
+        """
+        archetype = self.entity_archetypes.get(entity_id)
+        if archetype is None:
+            return False
+        return archetype.component_ids.issuperset(component_ids)
+
+    def get(self, entity_id, component_id):
+        """Get a specific component for an entity.
+
+        KeyError if this component doesn't exist for this entity.
+        """
+        archetype = self.entity_archetypes.get(entity_id)
+        if archetype is None:
+            raise KeyError(entity_id)
+        return archetype.get(entity_id, component_id)
+
+    def create_entity_id(self):
+        """Create a new entity id.
+        """
+        result = self.entity_id_counter
+        self.entity_id_counter += 1
+        return result
+
+    def create_entity_ids(self, n):
+        """Create n new entity ids, as a NumPy array.
+        """
+        start = self.entity_id_counter
+        self.entity_id_counter += n
+        return np.arange(start, self.entity_id_counter, dtype=np.int64)
+
+    def is_alive(self, entity_id):
+        """Check whether entity_id was made by this registry.
+        """
+        return 0 <= entity_id < self.entity_id_counter
+
+    def has_entity(self, entity_id):
+        """Check whether entity_id has components or was made here.
+        """
+        return entity_id in self.entity_archetypes or self.is_alive(entity_id)
+
+    def add_entity(self, **components):
+        """Add a new entity with a bunch of associated components.
+        """
+        entity_id = self.create_entity_id()
+        self.add_components(entity_id, **components)
+        return entity_id
+
+    def add_entities(self, n, **columns):
+        """Add n new entities at once, with columns of components.
+
+        All new entities go into the same archetype, with a single bulk
+        add for each of its columns. Returns a NumPy array with the new
+        entity ids.
+        """
+        for component_id, components in columns.items():
+            count = _count(components)
+            if count != n:
+                raise ValueError(
+                    "Expected %s components for %r, got %s" % (
+                        n, component_id, count))
+        entity_ids = self.create_entity_ids(n)
+        self.add_components_many(entity_ids, **columns)
+        return entity_ids
+
+    def add_components_many(self, entity_ids, **columns):
+        """Add columns of components to new entity ids in bulk.
+
+        The entity ids must not have any components yet.
+        """
+        entity_ids = np.asarray(entity_ids, dtype=np.int64)
+        if not columns:
+            return
+        archetype = self.archetype(columns)
+        archetype.add_many(entity_ids, columns)
+        self.entity_archetypes.update(
+            dict.fromkeys(entity_ids.tolist(), archetype))
+        self.change_counter.count += len(entity_ids) * len(columns)
+
+    def add_components(self, entity_id, **components):
+        """Add a bunch of components for an entity.
+
+        The entity is moved to its new archetype only once.
+        """
+        old = self.entity_archetypes.get(entity_id)
+        added = len(components)
+        if old is not None:
+            added = len(set(components) - old.component_ids)
+            components = dict(
+                {component_id: old.get(entity_id, component_id)
+                 for component_id in old.component_ids},
+                **components)
+        self._move(entity_id, old, self.archetype(components.keys()),
+                   components)
+        self.change_counter.count += added
+
+    def add_component(self, entity_id, component_id, component):
+        """Add a component to an entity.
+
+        This moves the entity to the archetype that includes the
+        component.
+        """
+        self.add_components(entity_id, **{component_id: component})
+
+    def remove_component(self, entity_id, component_id):
+        """Remove a component from an entity.
+
+        This moves the entity to the archetype without the component.
+        """
+        old = self.entity_archetypes.get(entity_id)
+        if old is None or component_id not in old.component_ids:
+            raise KeyError(entity_id)
+        component_ids = old.component_ids - {component_id}
+        self.change_counter.count += 1
+        if not component_ids:
+            old.remove(entity_id)
+            del self.entity_archetypes[entity_id]
+            return
+        components = {component_id: old.get(entity_id, component_id)
+                      for component_id in component_ids}
+        self._move(entity_id, old, self.archetype(component_ids),
+                   components)
+
+    def _move(self, entity_id, old, new, components):
+        # add to the new archetype before removing from the old one, as
+        # the components may be views on the old archetype's rows
+        new.add(entity_id, components)
+        if new is old:
+            return
+        if old is not None:
+            old.remove(entity_id)
+        self.entity_archetypes[entity_id] = new
+
+    def remove_entity(self, entity_id):
+        """Remove an entity with all its components.
+
+        KeyError if there is no such entity.
+        """
+        archetype = self.entity_archetypes.pop(entity_id, None)
+        if archetype is None:
+            if not self.is_alive(entity_id):
+                raise KeyError(entity_id)
+            return
+        archetype.remove(entity_id)
+        self.change_counter.count += len(archetype.component_ids)
+
+    def remove_entities(self, entity_ids):
+        """Remove many entities with all their components at once.
+
+        Each archetype gets a single bulk removal. KeyError if one of
+        the entities doesn't exist.
+        """
+        by_archetype = {}
+        for entity_id in set(np.asarray(entity_ids, dtype=np.int64).tolist()):
+            if not self.has_entity(entity_id):
+                raise KeyError(entity_id)
+            archetype = self.entity_archetypes.pop(entity_id, None)
+            if archetype is not None:
+                by_archetype.setdefault(
+                    archetype.component_ids, (archetype, []))[1].append(
+                        entity_id)
+        for archetype, removed in by_archetype.values():
+            archetype.remove_many(np.array(removed, dtype=np.int64))
+            self.change_counter.count += (
+                len(removed) * len(archetype.component_ids))
+
+    def execute(self, update):
+        """Execute all systems.
+
+        Each system is passed the archetypes that match its query.
+        Recorded commands are applied at the sync points and at the end.
+        """
+        instrumentation = self.instrumentation
+        if instrumentation is not None:
+            instrumentation.start_frame()
+        for i, system in enumerate(self.systems):
+            if instrumentation is None:
+                system.execute(update, self, system.archetypes)
+            else:
+                # archetype columns don't buffer, there is nothing to flush
+                instrumentation.execute(system, update, self,
+                                        system.archetypes, flush=0.0)
+            if i in self.sync_points:
+                self.commands.apply()
+        self.commands.apply()
+        if instrumentation is not None:
+            instrumentation.end_frame()
+
+    def instrument(self, window=120, max_events=100000):
+        """Turn on instrumentation of system execution.
+
+        See :meth:`Registry.instrument`.
+        """
+        self.instrumentation = Instrumentation(self, window, max_events)
+        return self.instrumentation
+
+    def uninstrument(self):
+        """Turn off instrumentation.
+        """
+        self.instrumentation = None
+
+
+class ArchetypeSystem:
+    watches_changes = False
+
+    def __init__(self, func, component_ids):
+        """
+        :param func: a function that takes the update, the registry, the
+          entity ids of a chunk and a column for each component. It is
+          called once for each matching archetype that is not empty.
+        :param component_ids: the component ids that this system cares about.
+        """
+        self.func = func
+        self.component_ids = component_ids
+        self.archetypes = []
+
+    @property
+    def entity_ids(self):
+        """The ids of the entities in the matching archetypes.
+        """
+        return [entity_id for archetype in self.archetypes
+                for entity_id in archetype.keys()]
+
+    def match(self, archetype):
+        """Add archetype to the query if it has all our components.
+        """
+        if archetype.component_ids.issuperset(self.component_ids):
+            self.archetypes.append(archetype)
+
+    def execute(self, update, registry, archetypes):
+        """Execute this system over each non-empty matching archetype.
+
+        Columns are views on the archetype's arrays, so they can be
+        updated in place.
+        """
+        for archetype in archetypes:
+            if not len(archetype):
+                continue
+            columns = [archetype.columns[component_id].value()
+                       for component_id in self.component_ids]
+            self.func(update, registry, archetype.keys(), *columns)
+
+
+def archetype_item_system(func, component_ids):
+    """An archetype system where you update individual items.
+    """
+    return ArchetypeSystem(partial(_item_func, func), component_ids)
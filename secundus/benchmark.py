@@ -0,0 +1,239 @@
+"""Benchmarks for registry churn, system iteration and container memory.
+
+Run with::
+
+  python -m secundus.benchmark --output baseline.json
+
+and later compare against the saved baseline::
+
+  python -m secundus.benchmark --compare baseline.json
+
+Results are JSON. Timings are the best of a number of repeats, in
+seconds; memory is in bytes per entity.
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from .registry import (
+    Registry, System, DictContainer, DataFrameContainer, ArrayContainer,
+    SparseSetContainer, entity_ids_system, item_system)
+from .memmap import MemmapContainer
+
+
+POSITION_DTYPE = [('x', 'f8'), ('y', 'f8')]
+VELOCITY_DTYPE = [('dx', 'f8'), ('dy', 'f8')]
+
+CONTAINERS = {
+    'dict': lambda dtype: DictContainer(),
+    'dataframe': lambda dtype: DataFrameContainer(),
+    'array': lambda dtype: ArrayContainer(dtype),
+    'sparse_set': lambda dtype: SparseSetContainer(dtype),
+    'memmap': lambda dtype: MemmapContainer(dtype),
+}
+
+
+def create_registry(container):
+    factory = CONTAINERS[container]
+    r = Registry()
+    r.register_component('position', factory(POSITION_DTYPE))
+    r.register_component('velocity', factory(VELOCITY_DTYPE))
+    return r
+
+
+def close(r):
+    """Close the containers that hold on to files, such as memory maps.
+    """
+    for component_container in r.components.values():
+        if hasattr(component_container, 'close'):
+            component_container.close()
+
+
+def populate(r, entities):
+    for i in range(entities):
+        r.add_entity(position={'x': float(i), 'y': 0.0},
+                     velocity={'dx': 1.0, 'dy': 0.5})
+
+
+def touch(update, r, entity_ids, positions, velocities):
+    len(positions)
+    len(velocities)
+
+
+def move_all(update, r, entity_ids, positions, velocities):
+    for position, velocity in zip(positions, velocities):
+        position['x'] += velocity['dx']
+
+
+def move(update, r, entity_id, position, velocity):
+    position['x'] += velocity['dx']
+
+
+def best_of(repeat, setup, run):
+    """Time run, after setup, repeat times and return the best time.
+
+    The registry returned by setup is closed afterwards.
+    """
+    best = None
+    for i in range(repeat):
+        r = setup()
+        try:
+            start = time.perf_counter()
+            run(r)
+            elapsed = time.perf_counter() - start
+        finally:
+            close(r)
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+
+def bench_spawn(container, entities, repeat):
+    def setup():
+        return create_registry(container)
+
+    def run(r):
+        populate(r, entities)
+        r.components['position'].value()
+    return best_of(repeat, setup, run)
+
+
+def bench_despawn(container, entities, repeat):
+    def setup():
+        r = create_registry(container)
+        populate(r, entities)
+        return r
+
+    def run(r):
+        for entity_id in range(entities):
+            r.remove_component(entity_id, 'velocity')
+            r.remove_component(entity_id, 'position')
+        r.components['position'].value()
+    return best_of(repeat, setup, run)
+
+
+def bench_system(make_system, container, entities, repeat):
+    def setup():
+        r = create_registry(container)
+        r.register_system(make_system(['position', 'velocity']))
+        populate(r, entities)
+        # the first execution flushes containers and fills caches
+        r.execute(None)
+        return r
+
+    def run(r):
+        r.execute(None)
+    return best_of(repeat, setup, run)
+
+
+def bench_memory(container, entities):
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        r = create_registry(container)
+        populate(r, entities)
+        for component_container in r.components.values():
+            component_container.value()
+        after = tracemalloc.get_traced_memory()[0]
+        close(r)
+    finally:
+        tracemalloc.stop()
+    return (after - before) / entities
+
+
+SYSTEMS = {
+    'system': lambda component_ids: System(touch, component_ids),
+    'entity_ids_system': lambda component_ids: entity_ids_system(
+        move_all, component_ids),
+    'item_system': lambda component_ids: item_system(move, component_ids),
+}
+
+
+def run(entities=10000, repeat=5, containers=None):
+    """Run all benchmarks.
+
+    Returns a dict with information about the environment under
+    ``meta`` and the measurements under ``results``, keyed by
+    ``container/benchmark``.
+    """
+    results = {}
+    for container in containers or CONTAINERS:
+        prefix = container + '/'
+        results[prefix + 'spawn'] = bench_spawn(container, entities, repeat)
+        results[prefix + 'despawn'] = bench_despawn(
+            container, entities, repeat)
+        for name, make_system in SYSTEMS.items():
+            results[prefix + name] = bench_system(
+                make_system, container, entities, repeat)
+        results[prefix + 'memory_per_entity'] = bench_memory(
+            container, entities)
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'entities': entities,
+            'repeat': repeat,
+        },
+        'results': results,
+    }
+
+
+def compare(baseline, current, threshold=0.1):
+    """Compare results against a baseline.
+
+    Returns a list of ``(key, baseline value, current value)`` for the
+    measurements that got worse by more than threshold, a fraction.
+    """
+    regressions = []
+    for key, value in sorted(current['results'].items()):
+        base = baseline['results'].get(key)
+        if base is None:
+            continue
+        if value > base * (1 + threshold):
+            regressions.append((key, base, value))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark secundus registries and containers.")
+    parser.add_argument('--entities', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--container', action='append',
+                        choices=sorted(CONTAINERS),
+                        help="only benchmark this container type")
+    parser.add_argument('--output', help="write results to this file")
+    parser.add_argument('--compare', metavar='BASELINE',
+                        help="flag regressions against saved results")
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help="allowed slowdown as a fraction")
+    args = parser.parse_args(argv)
+
+    current = run(args.entities, args.repeat, args.container)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2, sort_keys=True)
+    else:
+        json.dump(current, sys.stdout, indent=2, sort_keys=True)
+        sys.stdout.write('\n')
+
+    if not args.compare:
+        return 0
+    with open(args.compare) as f:
+        baseline = json.load(f)
+    regressions = compare(baseline, current, args.threshold)
+    for key, base, value in regressions:
+        sys.stderr.write("REGRESSION %s: %.6g -> %.6g\n" % (
+            key, base, value))
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
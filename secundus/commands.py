@@ -0,0 +1,133 @@
+import threading
+
+import numpy as np
+
+
+class CommandBuffer:
+    """Record structural changes to a registry to apply them later.
+
+    Adding or removing components while systems execute changes the
+    containers and the entity ids of systems while they are in use.
+    Systems can instead record these changes here; the registry applies
+    them in one pass at its sync points, see
+    :meth:`Registry.add_sync_point`.
+
+    Entity ids for spawned entities are allocated immediately, so later
+    commands can refer to them. Recording commands is safe from
+    systems that run concurrently.
+
+    :param registry: the :class:`Registry` to apply commands to.
+    """
+    def __init__(self, registry):
+        self.registry = registry
+        self.commands = []
+        self.lock = threading.Lock()
+
+    def spawn(self, **components):
+        """Record the creation of an entity with components.
+
+        Returns the new entity id.
+        """
+        with self.lock:
+            entity_id = self.registry.create_entity_id()
+        self.commands.append(('spawn', entity_id, components))
+        return entity_id
+
+    def spawn_many(self, n, **columns):
+        """Record the creation of n entities with columns of components.
+
+        Returns a NumPy array with the new entity ids.
+        """
+        with self.lock:
+            entity_ids = self.registry.create_entity_ids(n)
+        self.commands.append(('spawn_many', entity_ids, columns))
+        return entity_ids
+
+    def despawn(self, entity_id):
+        """Record the removal of an entity with all its components.
+
+        Its entity id is released, so it is recycled later on.
+        """
+        self.commands.append(('despawn', entity_id, None))
+
+    def add_components(self, entity_id, **components):
+        """Record adding components to an entity.
+        """
+        self.commands.append(('add', entity_id, components))
+
+    def add_component(self, entity_id, component_id, component):
+        """Record adding a component to an entity.
+        """
+        self.add_components(entity_id, **{component_id: component})
+
+    def remove_component(self, entity_id, component_id):
+        """Record removing a component from an entity.
+        """
+        self.commands.append(('remove', entity_id, component_id))
+
+    def __len__(self):
+        return len(self.commands)
+
+    def apply(self):
+        """Apply all recorded commands in order and clear them.
+
+        Consecutive spawns are applied together, through the bulk
+        add path, grouped by the set of components they have.
+        Consecutive despawns are applied together with
+        :meth:`Registry.remove_entities`.
+
+        Systems may record commands for an entity that another system
+        despawns in the same frame. Adding components to an entity that
+        was despawned, or removing a component it no longer has, is
+        skipped.
+        """
+        if not self.commands:
+            return
+        commands, self.commands = self.commands, []
+        registry = self.registry
+        spawns = {}
+        despawns = []
+        despawned = set()
+        for command, entity_id, arguments in commands:
+            if command != 'spawn' and spawns:
+                self._spawn(spawns)
+                spawns = {}
+            if command != 'despawn' and despawns:
+                self._despawn(despawns)
+                despawns = []
+            if command == 'spawn':
+                entity_ids, columns = spawns.setdefault(
+                    frozenset(arguments), ([], {}))
+                entity_ids.append(entity_id)
+                for component_id, component in arguments.items():
+                    columns.setdefault(component_id, []).append(component)
+            elif command == 'despawn':
+                despawns.append(entity_id)
+                despawned.add(entity_id)
+            elif command == 'spawn_many':
+                registry.add_components_many(entity_id, **arguments)
+            elif command == 'add':
+                if (entity_id not in despawned and
+                        registry.has_entity(entity_id)):
+                    registry.add_components(entity_id, **arguments)
+            elif command == 'remove':
+                if registry.has_components(entity_id, [arguments]):
+                    registry.remove_component(entity_id, arguments)
+        if spawns:
+            self._spawn(spawns)
+        if despawns:
+            self._despawn(despawns)
+
+    def _spawn(self, spawns):
+        for entity_ids, columns in spawns.values():
+            if not columns:
+                continue
+            self.registry.add_components_many(
+                np.array(entity_ids, dtype=np.int64), **columns)
+
+    def _despawn(self, entity_ids):
+        registry = self.registry
+        # entities despawned twice are only removed once
+        registry.remove_entities([
+            entity_id for entity_id in set(entity_ids)
+            if registry.has_entity(entity_id)])
@@ -1,6 +1,10 @@
+import heapq
+import inspect
+
 import dectate
 
-from .registry import Registry, System
+from .registry import Registry, System, AsyncSystem
+from .runner import Runner, AsyncRunner
 
 
 class App(dectate.App):
@@ -8,6 +12,37 @@ class App(dectate.App):
     def registry(self):
         return self.config.registry
 
+    @classmethod
+    def commit(cls):
+        """Commit the configuration and resolve the execution plan.
+
+        See :meth:`Registry.execution_plan`.
+        """
+        committed = super().commit()
+        for app_class in committed:
+            app_class.config.registry.execution_plan()
+        return committed
+
+    def run(self, dt=1 / 60, ticks=None, realtime=True, **kw):
+        """Run the registry on a fixed timestep.
+
+        Keyword arguments are passed to :class:`Runner`. Returns the
+        runner after it stops.
+        """
+        runner = Runner(self.registry, dt, **kw)
+        runner.run(ticks, realtime)
+        return runner
+
+    async def run_async(self, dt=1 / 60, ticks=None, realtime=True, **kw):
+        """Run the registry on a fixed timestep in an asyncio event loop.
+
+        Like :meth:`run`, but with an :class:`AsyncRunner`, so that async
+        systems overlap with the other systems.
+        """
+        runner = AsyncRunner(self.registry, dt, **kw)
+        await runner.run(ticks, realtime)
+        return runner
+
 
 @App.directive('component')
 class ComponentAction(dectate.Action):
@@ -27,21 +62,95 @@ class ComponentAction(dectate.Action):
 
 @App.directive('system')
 class SystemAction(dectate.Action):
+    """Register a function as a system.
+
+    Systems are registered in the order of their directives, unless
+    that is changed with before and after. An ``async def`` function
+    becomes an :class:`AsyncSystem`.
+
+    :param component_names: the component ids the system gets, or a
+      :class:`Query`.
+    :param name: the name of the system, used for ordering and to
+      override it in a subclass of the app. By default it is the name of
+      the function.
+    :param before: names of systems this system runs before.
+    :param after: names of systems this system runs after.
+    """
     depends = [ComponentAction]
 
     config = {
-        'registry': Registry
+        'registry': Registry,
+        'system_entries': list,
     }
 
-    def __init__(self, component_names):
+    def __init__(self, component_names, reads=None, writes=None, name=None,
+                 before=(), after=()):
         self.component_names = component_names
-        # XXX needs an ordering principle where systems can depend on another
-        # to control registration order (and thus execution order)
+        self.reads = reads
+        self.writes = writes
+        self.name = name
+        # not self.after, which dectate calls after performing the group
+        self.before_names = before
+        self.after_names = after
 
-    def identifier(self, registry):
-        # XXX this is actually wrong; we could have multiple systems
-        # that affect the same set of components
-        return tuple(sorted(self.component_names))
+    def identifier(self, registry, system_entries):
+        if self.name is not None:
+            return self.name
+        # without a name, the place of the directive identifies it
+        return (self.code_info.path, self.code_info.lineno)
 
-    def perform(self, obj, registry):
-        registry.register_system(System(obj, self.component_names))
+    def perform(self, obj, registry, system_entries):
+        factory = AsyncSystem if inspect.iscoroutinefunction(obj) else System
+        system = factory(obj, self.component_names, self.reads, self.writes)
+        system.name = self.name if self.name is not None else obj.__name__
+        system_entries.append((system, self.before_names, self.after_names))
+
+    @staticmethod
+    def after(registry, system_entries):
+        for system in _ordered(system_entries):
+            registry.register_system(system)
+
+
+def _ordered(entries):
+    """Sort systems so that before and after constraints hold.
+
+    Otherwise systems keep their order.
+    """
+    by_name = {}
+    for i, (system, before, after) in enumerate(entries):
+        by_name.setdefault(system.name, []).append(i)
+    successors = [set() for entry in entries]
+
+    def lookup(name):
+        found = by_name.get(name)
+        if found is None:
+            raise dectate.DirectiveError(
+                "Unknown system in before or after: %r" % name)
+        return found
+
+    for i, (system, before, after) in enumerate(entries):
+        for name in before:
+            successors[i].update(lookup(name))
+        for name in after:
+            for j in lookup(name):
+                successors[j].add(i)
+    predecessors = [0] * len(entries)
+    for following in successors:
+        for j in following:
+            predecessors[j] += 1
+    ready = [i for i, count in enumerate(predecessors) if not count]
+    heapq.heapify(ready)
+    result = []
+    while ready:
+        i = heapq.heappop(ready)
+        result.append(entries[i][0])
+        for j in successors[i]:
+            predecessors[j] -= 1
+            if not predecessors[j]:
+                heapq.heappush(ready, j)
+    if len(result) != len(entries):
+        raise dectate.DirectiveError(
+            "Cycle in before and after of systems: %s" % ', '.join(
+                sorted(entries[i][0].name
+                       for i, count in enumerate(predecessors) if count)))
+    return result
@@ -0,0 +1,199 @@
+from collections import deque
+from functools import partial
+import json
+import threading
+import time
+
+
+def system_name(system):
+    """A name for a system, for reporting.
+    """
+    name = getattr(system, 'name', None)
+    if name:
+        return name
+    func = system.func
+    # look through the partials of the system helpers
+    while isinstance(func, partial):
+        if func.args and callable(func.args[0]):
+            func = func.args[0]
+        else:
+            func = func.func
+    return getattr(func, '__qualname__', None) or repr(system)
+
+
+class SystemRecord:
+    """Measurements of a single system execution.
+
+    Times are in seconds; ``start`` is when the system's function
+    started, relative to the start of the instrumentation. ``wall`` and
+    ``cpu`` are the time of the function itself, ``flush`` the time
+    spent flushing its component containers before it.
+    """
+    def __init__(self, name, frame, start, wall, cpu, flush, entities,
+                 changes, thread_id):
+        self.name = name
+        self.frame = frame
+        self.start = start
+        self.wall = wall
+        self.cpu = cpu
+        self.flush = flush
+        self.entities = entities
+        self.changes = changes
+        self.thread_id = thread_id
+
+
+class Instrumentation:
+    """Collect per system measurements while a registry executes.
+
+    For each system execution a :class:`SystemRecord` is made with
+    the wall time and CPU time of the system, the time spent flushing
+    its component containers before it runs, the number of entities it
+    tracks and the number of structural changes it made.
+
+    The last ``window`` records of each system are kept for rolling
+    statistics, and the last ``max_events`` records overall for export
+    as a Chrome trace.
+
+    Instrumentation is turned on with :meth:`Registry.instrument`; when
+    it is off the registry only checks for its absence once per system.
+    """
+    def __init__(self, registry, window=120, max_events=100000):
+        self.registry = registry
+        self.window = window
+        self.records = {}
+        self.events = deque(maxlen=max_events)
+        self.frames = deque(maxlen=window)
+        self.hooks = []
+        self.frame = 0
+        self.origin = time.perf_counter()
+        self.frame_start = None
+
+    def add_hook(self, hook):
+        """Call hook with each :class:`SystemRecord` as it is made.
+        """
+        self.hooks.append(hook)
+
+    def start_frame(self):
+        self.frame_start = time.perf_counter()
+
+    def end_frame(self):
+        self.frames.append(time.perf_counter() - self.frame_start)
+        self.frame += 1
+
+    def flush(self, component_containers):
+        """Flush component containers; returns the time it took.
+        """
+        start = time.perf_counter()
+        for container in component_containers:
+            container.value()
+        return time.perf_counter() - start
+
+    def execute(self, system, update, registry, component_containers,
+                flush=None):
+        """Execute a system and record measurements.
+
+        :param flush: the time spent flushing the containers, if they
+          were flushed already, as the :class:`Scheduler` does on its
+          own thread before it runs a stage.
+        """
+        if flush is None:
+            flush = self.flush(component_containers)
+        start = time.perf_counter()
+        cpu_start = time.thread_time()
+        # counted per thread, so concurrent systems don't interfere
+        changes = registry.structural_changes
+        system.execute(update, registry, component_containers)
+        end = time.perf_counter()
+        record = SystemRecord(
+            system_name(system), self.frame, start - self.origin,
+            end - start, time.thread_time() - cpu_start, flush,
+            len(system.entity_ids), registry.structural_changes - changes,
+            threading.get_ident())
+        return self._add(record)
+
+    async def execute_async(self, system, update, registry,
+                            component_containers):
+        """Execute an async system and record measurements.
+
+        Other systems run while it waits, so only its wall time is
+        measured; its CPU time and structural changes are recorded as 0.
+        """
+        flush = self.flush(component_containers)
+        start = time.perf_counter()
+        await system.execute_async(update, registry, component_containers)
+        end = time.perf_counter()
+        return self._add(SystemRecord(
+            system_name(system), self.frame, start - self.origin,
+            end - start, 0.0, flush, len(system.entity_ids), 0,
+            threading.get_ident()))
+
+    def _add(self, record):
+        records = self.records.get(record.name)
+        if records is None:
+            records = self.records[record.name] = deque(maxlen=self.window)
+        records.append(record)
+        self.events.append(record)
+        for hook in self.hooks:
+            hook(record)
+        return record
+
+    def stats(self):
+        """Rolling statistics for each system over the window.
+
+        Returns a dict mapping system name to a dict with the number of
+        executions and the mean and max of the measurements.
+        """
+        result = {}
+        for name, records in self.records.items():
+            count = len(records)
+            result[name] = {
+                'count': count,
+                'wall_mean': sum(r.wall for r in records) / count,
+                'wall_max': max(r.wall for r in records),
+                'cpu_mean': sum(r.cpu for r in records) / count,
+                'flush_mean': sum(r.flush for r in records) / count,
+                'entities': records[-1].entities,
+                'changes_mean': sum(r.changes for r in records) / count,
+            }
+        return result
+
+    def frame_stats(self):
+        """Rolling statistics of whole frames over the window.
+        """
+        count = len(self.frames)
+        if not count:
+            return {'count': 0, 'wall_mean': 0.0, 'wall_max': 0.0}
+        return {
+            'count': count,
+            'wall_mean': sum(self.frames) / count,
+            'wall_max': max(self.frames),
+        }
+
+    def trace_events(self):
+        """The recorded system executions as Chrome trace events.
+        """
+        return [{
+            'name': record.name,
+            'cat': 'system',
+            'ph': 'X',
+            'ts': record.start * 1e6,
+            'dur': record.wall * 1e6,
+            'pid': 0,
+            'tid': record.thread_id,
+            'args': {
+                'frame': record.frame,
+                'cpu_us': record.cpu * 1e6,
+                'flush_us': record.flush * 1e6,
+                'entities': record.entities,
+                'changes': record.changes,
+            },
+        } for record in self.events]
+
+    def export_chrome_trace(self, f):
+        """Write the recorded events in Chrome trace JSON format.
+
+        :param f: a file object opened for writing text. The result can
+          be loaded in ``chrome://tracing`` or Perfetto.
+        """
+        json.dump({'traceEvents': self.trace_events(),
+                   'displayTimeUnit': 'ms'}, f)
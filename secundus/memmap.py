@@ -0,0 +1,157 @@
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from .registry import ArrayContainer, _BufferedContainer
+
+
+class MemmapContainer(_BufferedContainer, ArrayContainer):
+    """Component container backed by a memory-mapped file.
+
+    Components are stored as rows of a NumPy array in a file that is
+    memory-mapped, so a world can hold more components than fit in
+    memory; the operating system keeps the pages that are used in its
+    page cache. The file grows by extending and remapping it. Entity
+    ids and the map from entity id to row are kept in memory.
+
+    Like with :class:`DataFrameContainer`, adds and removes are buffered
+    and only applied once the container is accessed, typically before
+    the next system that requires it runs. ``value()`` returns a view on
+    the mapped array, so vectorized systems can work on it directly.
+
+    Call :meth:`close` to unmap the file when you are done.
+
+    :param dtype: the NumPy dtype of a single component. It cannot
+      contain Python objects.
+    :param directory: the directory to put the file in. By default a
+      temporary directory is created, which is removed on close.
+    :param capacity: the number of rows to preallocate.
+    """
+    def __init__(self, dtype, directory=None, capacity=16):
+        if np.dtype(dtype).hasobject:
+            raise ValueError(
+                "Cannot memory-map Python objects: %r" % dtype)
+        self.temporary = directory is None
+        if directory is None:
+            directory = tempfile.mkdtemp(prefix='secundus-')
+        self.directory = directory
+        self.path = None
+        self.files = 0
+        self._clear_buffers()
+        super().__init__(dtype, capacity)
+
+    def _map(self, capacity):
+        with open(self.path, 'r+b') as f:
+            f.truncate(capacity * self.dtype.itemsize)
+        return np.memmap(self.path, dtype=self.dtype, mode='r+',
+                         shape=(capacity,))
+
+    def _allocate(self, capacity):
+        # a new file, as views on the old one may still be around
+        old = self.path
+        self.path = os.path.join(self.directory,
+                                 'components-%s.dat' % self.files)
+        self.files += 1
+        open(self.path, 'wb').close()
+        array = self._map(capacity)
+        if old is not None:
+            os.remove(old)
+        return array
+
+    def _grow(self, needed):
+        capacity = len(self.array)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        # the file only grows, so earlier views on it stay valid
+        self.array.flush()
+        self.array = self._map(capacity)
+        row_entity_ids = np.zeros(capacity, dtype=np.int64)
+        row_entity_ids[:self.size] = self.row_entity_ids[:self.size]
+        self.row_entity_ids = row_entity_ids
+
+    def _adopt(self, array):
+        # restored arrays have to be copied into the file
+        adopted = self._allocate(max(len(array), 1))
+        adopted[:len(array)] = array
+        return adopted
+
+    def add_many(self, entity_ids, components):
+        """Add components for many new entities at once.
+
+        See :meth:`ArrayContainer.add_many`. The rows are converted
+        right away, but only written to the file on the next flush.
+        """
+        entity_ids = np.asarray(entity_ids, dtype=np.int64)
+        values = self._rows_array(components, len(entity_ids))
+        if len(values) != len(entity_ids):
+            raise ValueError("Expected %s components, got %s" % (
+                len(entity_ids), len(values)))
+        self._buffer_frame(entity_ids, (entity_ids, values))
+
+    def _complete(self):
+        if not self._buffered():
+            return
+        # take the buffers first, as the methods used below flush too
+        to_remove, to_add_frames, to_add = (
+            self.to_remove_entity_ids, self.to_add_frames, self.to_add)
+        self._clear_buffers()
+        ArrayContainer.remove_many(self, np.fromiter(
+            to_remove, dtype=np.int64, count=len(to_remove)))
+        for entity_ids, values in to_add_frames:
+            ArrayContainer.add_many(self, entity_ids, values)
+        for entity_id, component in to_add.items():
+            ArrayContainer.__setitem__(self, entity_id, component)
+
+    def __getitem__(self, entity_id):
+        self._complete()
+        return super().__getitem__(entity_id)
+
+    def __len__(self):
+        self._complete()
+        return self.size
+
+    def __iter__(self):
+        self._complete()
+        return super().__iter__()
+
+    def rows(self, entity_ids):
+        self._complete()
+        return super().rows(entity_ids)
+
+    def keys(self):
+        self._complete()
+        return super().keys()
+
+    def snapshot(self, writer):
+        self._complete()
+        return super().snapshot(writer)
+
+    def restore(self, reader, state):
+        self._clear_buffers()
+        super().restore(reader, state)
+
+    def value(self):
+        """Backing value is a view on the live rows of the mapped array.
+
+        Writes to the view update the file. The view is only valid
+        until the next flush.
+        """
+        self._complete()
+        return super().value()
+
+    def flush(self):
+        """Write changes to the mapped array to the file.
+        """
+        self._complete()
+        self.array.flush()
+
+    def close(self):
+        """Unmap the file, and remove it if it is temporary.
+        """
+        self.array = None
+        if self.temporary:
+            shutil.rmtree(self.directory, ignore_errors=True)
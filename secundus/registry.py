@@ -1,6 +1,15 @@
+import asyncio
+from collections import deque
 from functools import partial
+import threading
+import numpy as np
 import pandas as pd
 
+from .commands import CommandBuffer
+from .instrument import Instrumentation
+from .scheduler import ExecutionPlan, check_sync
+from .snapshot import save_snapshot, load_snapshot
+
 # the following functions should be easy:
 
 # a function that just gets all the component collections it requires.
@@ -24,19 +33,129 @@ import pandas as pd
 # a pure function that *returns* a new single instance of each component it
 # requests. This is going to be stored in the collection.
 
+# an entity id packs the index of its slot into the lower bits and the
+# generation of the slot into the higher bits
+INDEX_BITS = 32
+INDEX_MASK = (1 << INDEX_BITS) - 1
+MAX_GENERATION = (1 << (63 - INDEX_BITS)) - 1
+
+
+def pack_entity_id(index, generation):
+    """Make an entity id out of a slot index and a generation.
+
+    With generation 0 the entity id is the index. This works on ints
+    and NumPy arrays.
+    """
+    return (generation << INDEX_BITS) | index
+
+
+def entity_index(entity_id):
+    """Get the slot index of an entity id."""
+    return entity_id & INDEX_MASK
+
+
+def entity_generation(entity_id):
+    """Get the generation of an entity id."""
+    return entity_id >> INDEX_BITS
+
 
 class DictContainer(dict):
     """Component container backed by dict.
 
     This is in fact a Python dict.
     """
+    def add_many(self, entity_ids, components):
+        """Add components for many new entities at once.
+
+        :param entity_ids: a sequence or array of entity ids.
+        :param components: a sequence of components, one for each
+          entity id. A DataFrame contributes one dict per row.
+        """
+        if isinstance(components, pd.DataFrame):
+            components = components.to_dict('records')
+        self.update(zip(_as_list(entity_ids), components))
+
+    def remove_many(self, entity_ids):
+        """Remove the components of many entities at once.
+        """
+        for entity_id in _as_list(entity_ids):
+            del self[entity_id]
+
+    def snapshot(self, writer):
+        """Add the components to a snapshot; returns their description.
+
+        Components are arbitrary Python objects, so they are pickled.
+        """
+        return {'kind': 'dict', 'items': writer.pickle(dict(self))}
+
+    def restore(self, reader, state):
+        """Replace the components with those from a snapshot.
+        """
+        _check_kind(self, state, 'dict')
+        self.clear()
+        self.update(reader.pickle(state['items']))
+
     def value(self):
         """Get the underlying container object.
         """
         return self
 
 
-class DataFrameContainer:
+class _BufferedContainer:
+    """Buffers adds and removes until the container is flushed.
+
+    Subclasses keep a map from entity id to row in ``index`` and
+    implement ``_complete``, which applies the buffers, see
+    :class:`DataFrameContainer`.
+    """
+    def _clear_buffers(self):
+        self.to_add = {}
+        self.to_add_frames = []
+        self.to_add_frame_ids = set()
+        self.to_remove_entity_ids = set()
+
+    def _buffered(self):
+        return bool(self.to_remove_entity_ids or self.to_add or
+                    self.to_add_frames)
+
+    def _buffer_frame(self, entity_ids, frame):
+        self.to_add_frames.append(frame)
+        self.to_add_frame_ids.update(_as_list(entity_ids))
+
+    def __setitem__(self, entity_id, component):
+        self.to_add[entity_id] = component
+
+    def __delitem__(self, entity_id):
+        if entity_id in self.to_add_frame_ids:
+            self._complete()
+        if entity_id not in self:
+            raise KeyError(entity_id)
+        self.to_add.pop(entity_id, None)
+        if entity_id in self.index:
+            self.to_remove_entity_ids.add(entity_id)
+
+    def remove_many(self, entity_ids):
+        """Remove the components of many entities at once.
+
+        Like single removals these are buffered, so all rows are removed
+        together in the next flush.
+        """
+        entity_ids = _as_list(entity_ids)
+        if not self.to_add_frame_ids.isdisjoint(entity_ids):
+            self._complete()
+        for entity_id in entity_ids:
+            del self[entity_id]
+
+    def __contains__(self, entity_id):
+        # cannot call self._complete here as we do not want
+        # to trigger it during tracking checks
+        if entity_id in self.to_add or entity_id in self.to_add_frame_ids:
+            return True
+        return (entity_id in self.index and
+                entity_id not in self.to_remove_entity_ids)
+
+
+class DataFrameContainer(_BufferedContainer):
     """Component container backed by pandas DataFrame.
 
     This can give a performance boost when you have a large
@@ -47,68 +166,633 @@ class DataFrameContainer:
     the container is accessed for its value is the buffer flushed;
     typically this happens before the next system runs that requires
     this component container.
+
+    The columns are kept in NumPy arrays with spare capacity that grows
+    geometrically, like :class:`ArrayContainer`. Rows are kept packed
+    by moving rows from the end into the holes left by removals, and the
+    arrays shrink again when most of their capacity is unused. A flush
+    therefore only writes the rows that were added or removed; the
+    DataFrame returned by ``value()``, including its index, is a view
+    on the arrays.
+
+    ``version`` increases with each flush that changes the rows.
     """
-    def __init__(self):
+    def __init__(self, capacity=16):
         self.df = pd.DataFrame([])
-        self.to_add_entity_ids = []
-        self.to_add_components = []
-        self.to_remove_entity_ids = []
+        self.capacity = max(capacity, 1)
+        self.min_capacity = self.capacity
+        self.columns = {}
+        self.row_entity_ids = np.zeros(self.capacity, dtype=np.int64)
+        self.index = {}
+        self.size = 0
+        self.version = 0
+        self._clear_buffers()
 
-    def __setitem__(self, entity_id, component):
-        self.to_add_entity_ids.append(entity_id)
-        self.to_add_components.append(component)
+    def add_many(self, entity_ids, components):
+        """Add components for many new entities at once.
 
-    def __delitem__(self, entity_id):
-        self.to_remove.append(entity_id)
+        :param entity_ids: a sequence or array of entity ids.
+        :param components: a DataFrame with a row for each entity id, or
+          anything the DataFrame constructor accepts, such as a dict
+          of column arrays or a list of dicts.
+        """
+        if isinstance(components, pd.DataFrame):
+            add_df = components.set_axis(entity_ids, axis=0)
+        else:
+            add_df = self._create(components, entity_ids)
+        self._buffer_frame(entity_ids, add_df)
 
     def _complete(self):
+        if not self._buffered():
+            return
+        self._sync()
         self._complete_remove()
         self._complete_add()
+        self._update_df()
+        self.version += 1
 
-    def _complete_add(self):
-        if not self.to_add_entity_ids:
+    def _sync(self):
+        # systems may have replaced columns of the DataFrame, for
+        # instance when an update changed their dtype; adopt those
+        # before we move rows around. Columns that are still views on
+        # our arrays aren't touched.
+        if len(self.df) != self.size:
             return
-        add_df = self._create(self.to_add_components,
-                              self.to_add_entity_ids)
-        self.df = pd.concat([self.df, add_df])
-        self.to_add_entity_ids = []
-        self.to_add_components = []
+        all_rows = np.arange(self.size)
+        for name in self.df.columns:
+            values = self.df[name].to_numpy()
+            column = self.columns.get(name)
+            if column is None or not np.may_share_memory(values, column):
+                self._write(name, all_rows, values)
 
     def _complete_remove(self):
         if not self.to_remove_entity_ids:
             return
-        self.df = self.df.drop(self.to_remove_entity_ids)
+        removed = np.fromiter(
+            (self.index.pop(entity_id)
+             for entity_id in self.to_remove_entity_ids),
+            dtype=np.intp, count=len(self.to_remove_entity_ids))
+        self.to_remove_entity_ids = set()
+        size = self.size - len(removed)
+        # fill the holes before the new end with the surviving rows
+        # after it
+        holes = removed[removed < size]
+        keep = np.ones(len(removed), dtype=bool)
+        keep[removed[removed >= size] - size] = False
+        movers = np.arange(size, self.size)[keep]
+        for column in self.columns.values():
+            column[holes] = column[movers]
+        self.row_entity_ids[holes] = self.row_entity_ids[movers]
+        self.index.update(zip(self.row_entity_ids[holes].tolist(),
+                             holes.tolist()))
+        self.size = size
+        capacity = self.capacity
+        while self.size < capacity // 4 and capacity > self.min_capacity:
+            capacity //= 2
+        if capacity != self.capacity:
+            self._resize(max(capacity, self.min_capacity))
+
+    def _complete_add(self):
+        frames = self.to_add_frames
+        if self.to_add:
+            frames.append(self._create(list(self.to_add.values()),
+                                       list(self.to_add.keys())))
+        for add_df in frames:
+            self._append(add_df)
+        self._clear_buffers()
+
+    def _append(self, add_df):
+        entity_ids = add_df.index.to_numpy()
+        is_new = np.fromiter(
+            (entity_id not in self.index
+             for entity_id in entity_ids.tolist()),
+            dtype=bool, count=len(entity_ids))
+        new_entity_ids = entity_ids[is_new]
+        start = self.size
+        end = start + len(new_entity_ids)
+        if end > self.capacity:
+            capacity = self.capacity
+            while capacity < end:
+                capacity *= 2
+            self._resize(capacity)
+        new_rows = np.arange(start, end)
+        self.row_entity_ids[start:end] = new_entity_ids
+        self.index.update(zip(new_entity_ids.tolist(), new_rows.tolist()))
+        self.size = end
+        rows = np.empty(len(entity_ids), dtype=np.intp)
+        rows[is_new] = new_rows
+        rows[~is_new] = [self.index[entity_id]
+                         for entity_id in entity_ids[~is_new].tolist()]
+        for name in add_df.columns:
+            self._write(name, rows, add_df[name].to_numpy())
+        missing = np.full(len(new_rows), np.nan)
+        for name in list(self.columns):
+            if name not in add_df.columns:
+                self._write(name, new_rows, missing)
+
+    def _write(self, name, rows, values):
+        column = self.columns.get(name)
+        if column is None:
+            if len(rows) < self.size:
+                # rows that don't have this column yet get NaN
+                column = np.full(
+                    self.capacity, np.nan,
+                    dtype=np.result_type(values.dtype, np.float64))
+            else:
+                column = np.empty(self.capacity, dtype=values.dtype)
+        elif values.dtype != column.dtype:
+            column = column.astype(np.result_type(column.dtype,
+                                                  values.dtype))
+        column[rows] = values
+        self.columns[name] = column
+
+    def _resize(self, capacity):
+        for name, column in self.columns.items():
+            resized = np.empty(capacity, dtype=column.dtype)
+            resized[:self.size] = column[:self.size]
+            self.columns[name] = resized
+        row_entity_ids = np.zeros(capacity, dtype=np.int64)
+        row_entity_ids[:self.size] = self.row_entity_ids[:self.size]
+        self.row_entity_ids = row_entity_ids
+        self.capacity = capacity
+
+    def _update_df(self):
+        # only views are made, so this doesn't depend on the size;
+        # rows moved by a later flush invalidate this DataFrame
+        index = pd.Index(self.row_entity_ids[:self.size], copy=False)
+        self.df = pd.DataFrame(
+            {name: column[:self.size]
+             for name, column in self.columns.items()},
+            index=index, copy=False)
 
     def _create(self, components, entity_ids):
         return pd.DataFrame(components, index=entity_ids)
 
+    def snapshot(self, writer):
+        """Add the columns to a snapshot; returns their description.
+        """
+        self._complete()
+        self._sync()
+        return {
+            'kind': 'dataframe',
+            'columns': [[name, writer.array(column[:self.size])]
+                        for name, column in self.columns.items()],
+            'entity_ids': writer.array(self.row_entity_ids[:self.size]),
+        }
+
+    def restore(self, reader, state):
+        """Replace the rows with those from a snapshot.
+
+        The columns are used as the reader gives them, so with a
+        memory-mapped snapshot they aren't copied until they grow.
+        """
+        _check_kind(self, state, 'dataframe')
+        entity_ids = reader.array(state['entity_ids'])
+        self.size = len(entity_ids)
+        self.capacity = max(self.size, 1)
+        self.row_entity_ids = _padded(entity_ids, self.capacity)
+        self.columns = {name: _padded(reader.array(ref), self.capacity)
+                        for name, ref in state['columns']}
+        self.index = dict(zip(entity_ids.tolist(), range(self.size)))
+        self._clear_buffers()
+        self._update_df()
+        self.version += 1
+
     def __getitem__(self, entity_id):
         self._complete()
         return self.df.loc[entity_id]
 
-    def __contains__(self, entity_id):
-        # cannot call self._complete here as we do not want
-        # to trigger it during tracking checks
-        if entity_id in self.to_remove_entity_ids:
-            return False
-        return (entity_id in self.df.index or
-                entity_id in self.to_add_entity_ids)
+    def __len__(self):
+        self._complete()
+        return self.size
+
+    def rows(self, entity_ids):
+        """Look up the rows of a collection of entity ids at once.
+
+        Returns a NumPy array with the row in ``value()`` of each
+        entity id, like :meth:`ArrayContainer.rows`.
+        """
+        self._complete()
+        return np.fromiter((self.index[entity_id]
+                            for entity_id in _as_list(entity_ids)),
+                           dtype=np.intp, count=len(entity_ids))
 
     def value(self):
         """Backing value is a pandas DataFrame
+
+        Its columns are views on the container's arrays, so it is only
+        valid until the next flush.
         """
         self._complete()
         return self.df
 
 
+class ArrayContainer:
+    """Component container backed by a NumPy structured array.
+
+    Components are stored as rows in a preallocated array that grows
+    geometrically when it runs out of room. A map from entity_id to row
+    is maintained next to it.
+
+    Rows are kept packed: removing a component moves the last row
+    into the hole, so adds and removes are O(1) and the live rows are
+    always contiguous.
+
+    ``version`` increases whenever rows are added, removed or moved, so
+    row numbers looked up earlier are still valid as long as it stays
+    the same.
+
+    :param dtype: the NumPy dtype of a single component, typically a
+      structured dtype such as ``[('x', 'f8'), ('y', 'f8')]``.
+    :param capacity: the number of rows to preallocate.
+    """
+    def __init__(self, dtype, capacity=16):
+        self.dtype = np.dtype(dtype)
+        self.array = self._allocate(max(capacity, 1))
+        self.row_entity_ids = np.zeros(len(self.array), dtype=np.int64)
+        self.index = self._create_index()
+        self.size = 0
+        self.version = 0
+
+    def _create_index(self):
+        return {}
+
+    def _allocate(self, capacity):
+        return np.zeros(capacity, dtype=self.dtype)
+
+    def _adopt(self, array):
+        # arrays restored from a snapshot are used without copying
+        if not len(array):
+            return self._allocate(1)
+        return array
+
+    def _grow(self, needed):
+        capacity = len(self.array)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        array = self._allocate(capacity)
+        array[:self.size] = self.array[:self.size]
+        row_entity_ids = np.zeros(capacity, dtype=np.int64)
+        row_entity_ids[:self.size] = self.row_entity_ids[:self.size]
+        self.array = array
+        self.row_entity_ids = row_entity_ids
+
+    def _row_value(self, component):
+        if self.dtype.names is not None and isinstance(component, dict):
+            return tuple(component[name] for name in self.dtype.names)
+        return component
+
+    def __setitem__(self, entity_id, component):
+        row = self.index.get(entity_id)
+        if row is None:
+            self._grow(self.size + 1)
+            row = self.size
+            self.size += 1
+            self.version += 1
+            self.index[entity_id] = row
+            self.row_entity_ids[row] = entity_id
+        self.array[row] = self._row_value(component)
+
+    def _rows_array(self, components, count):
+        if isinstance(components, pd.DataFrame):
+            components = {name: components[name].to_numpy()
+                          for name in components.columns}
+        if self.dtype.names is not None and isinstance(components, dict):
+            values = np.zeros(count, dtype=self.dtype)
+            for name in self.dtype.names:
+                values[name] = components[name]
+            return values
+        if isinstance(components, np.ndarray) and not self.dtype.hasobject:
+            return components
+        if self.dtype.names is not None:
+            return np.array([self._row_value(component)
+                             for component in components], dtype=self.dtype)
+        values = np.empty(count, dtype=self.dtype)
+        for i, component in enumerate(components):
+            values[i] = component
+        return values
+
+    def _index_many(self, entity_ids, rows):
+        self.index.update(zip(entity_ids.tolist(), rows.tolist()))
+
+    def _unindex_many(self, entity_ids):
+        for entity_id in entity_ids.tolist():
+            del self.index[entity_id]
+
+    def add_many(self, entity_ids, components):
+        """Add components for many new entities at once.
+
+        The rows are appended in one vectorized operation. The entity ids
+        must not be in the container yet.
+
+        :param entity_ids: a sequence or array of entity ids.
+        :param components: the components, one for each entity id. This
+          can be a NumPy array, a DataFrame or dict of column arrays with
+          a column for each field of the dtype, or a sequence of
+          components as accepted by ``__setitem__``.
+        """
+        entity_ids = np.asarray(entity_ids, dtype=np.int64)
+        count = len(entity_ids)
+        values = self._rows_array(components, count)
+        if len(values) != count:
+            raise ValueError(
+                "Expected %s components, got %s" % (count, len(values)))
+        start = self.size
+        self._grow(start + count)
+        self.array[start:start + count] = values
+        self.row_entity_ids[start:start + count] = entity_ids
+        self._index_many(entity_ids, np.arange(start, start + count))
+        self.size += count
+        self.version += 1
+
+    def __delitem__(self, entity_id):
+        row = self.index.pop(entity_id)
+        last = self.size - 1
+        if row != last:
+            moved_entity_id = self.row_entity_ids[last]
+            self.array[row] = self.array[last]
+            self.row_entity_ids[row] = moved_entity_id
+            self.index[int(moved_entity_id)] = row
+        if self.dtype.hasobject:
+            # don't keep removed components alive
+            self.array[last] = np.zeros((), dtype=self.dtype)
+        self.size = last
+        self.version += 1
+
+    def remove_many(self, entity_ids):
+        """Remove the components of many entities at once.
+
+        The holes left before the new end are filled with the surviving
+        rows after it in one vectorized operation. The entity ids must
+        be unique. KeyError if one is not in the container.
+        """
+        entity_ids = np.asarray(entity_ids, dtype=np.int64)
+        if not len(entity_ids):
+            return
+        removed = self.rows(entity_ids)
+        self._unindex_many(entity_ids)
+        size = self.size - len(removed)
+        holes = removed[removed < size]
+        keep = np.ones(len(removed), dtype=bool)
+        keep[removed[removed >= size] - size] = False
+        movers = np.arange(size, self.size)[keep]
+        self.array[holes] = self.array[movers]
+        self.row_entity_ids[holes] = self.row_entity_ids[movers]
+        self._index_many(self.row_entity_ids[holes], holes)
+        if self.dtype.hasobject:
+            # don't keep removed components alive
+            self.array[size:self.size] = np.zeros((), dtype=self.dtype)
+        self.size = size
+        self.version += 1
+
+    def __getitem__(self, entity_id):
+        return self.array[self.index[entity_id]]
+
+    def __contains__(self, entity_id):
+        return entity_id in self.index
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return iter(self.row_entity_ids[:self.size].tolist())
+
+    def rows(self, entity_ids):
+        """Get the rows of a collection of entity ids as an array.
+
+        KeyError if an entity id is not in the container.
+        """
+        return np.fromiter((self.index[entity_id] for entity_id in entity_ids),
+                           dtype=np.intp, count=len(entity_ids))
+
+    def keys(self):
+        """Entity ids of the live rows, in row order.
+
+        This is a view, so it is only valid until the next add or remove.
+        """
+        return self.row_entity_ids[:self.size]
+
+    def snapshot(self, writer):
+        """Add the rows to a snapshot; returns their description.
+        """
+        return {
+            'kind': 'array',
+            'array': writer.array(self.array[:self.size]),
+            'entity_ids': writer.array(self.row_entity_ids[:self.size]),
+        }
+
+    def restore(self, reader, state):
+        """Replace the rows with those from a snapshot.
+
+        The array is used as the reader gives it, so with a
+        memory-mapped snapshot it isn't copied until it grows.
+        """
+        _check_kind(self, state, 'array')
+        array = reader.array(state['array'])
+        if array.dtype != self.dtype:
+            raise ValueError("Snapshot has dtype %r, container has %r" % (
+                array.dtype, self.dtype))
+        entity_ids = reader.array(state['entity_ids'])
+        self.array = self._adopt(array)
+        self.row_entity_ids = _padded(entity_ids, len(self.array))
+        self.size = len(entity_ids)
+        self.index = self._create_index()
+        self._index_many(entity_ids, np.arange(self.size))
+        self.version += 1
+
+    def value(self):
+        """Backing value is a view on the live rows of the NumPy array.
+
+        No data is copied; writes to the view update the container.
+        The view is only valid until the next add or remove.
+        """
+        return self.array[:self.size]
+
+
+class SparseIndex:
+    """Map from non-negative integer entity_id to row, backed by an array.
+
+    This is the sparse half of a sparse set: the array is indexed by
+    the slot index of entity_id (see :func:`entity_index`) directly, so
+    lookups involve no hashing. The full entity id is kept per slot too,
+    in ``slot_entity_ids``, so an entity id of another generation of the
+    slot is not found.
+    Only one generation of a slot can be in the index at a time.
+
+    It supports the subset of the dict API that :class:`ArrayContainer`
+    uses.
+    """
+    def __init__(self, capacity=16):
+        self.sparse = np.full(max(capacity, 1), -1, dtype=np.intp)
+        self.slot_entity_ids = np.full(max(capacity, 1), -1, dtype=np.int64)
+
+    def _grow(self, index):
+        capacity = len(self.sparse)
+        while capacity <= index:
+            capacity *= 2
+        sparse = np.full(capacity, -1, dtype=np.intp)
+        sparse[:len(self.sparse)] = self.sparse
+        slot_entity_ids = np.full(capacity, -1, dtype=np.int64)
+        slot_entity_ids[:len(self.slot_entity_ids)] = self.slot_entity_ids
+        self.sparse = sparse
+        self.slot_entity_ids = slot_entity_ids
+
+    def get(self, entity_id, default=None):
+        index = entity_id & INDEX_MASK
+        if entity_id >= 0 and index < len(self.sparse):
+            row = self.sparse[index]
+            if row >= 0 and self.slot_entity_ids[index] == entity_id:
+                return int(row)
+        return default
+
+    def __getitem__(self, entity_id):
+        row = self.get(entity_id)
+        if row is None:
+            raise KeyError(entity_id)
+        return row
+
+    def __setitem__(self, entity_id, row):
+        if entity_id < 0:
+            raise ValueError(
+                "Entity id must be non-negative, not: %r" % entity_id)
+        index = entity_id & INDEX_MASK
+        if index >= len(self.sparse):
+            self._grow(index)
+        self.sparse[index] = row
+        self.slot_entity_ids[index] = entity_id
+
+    def __contains__(self, entity_id):
+        return self.get(entity_id) is not None
+
+    def assign(self, entity_ids, rows):
+        """Map many entity ids to rows at once.
+        """
+        if not len(entity_ids):
+            return
+        if entity_ids.min() < 0:
+            raise ValueError("Entity ids must be non-negative")
+        indexes = entity_ids & INDEX_MASK
+        largest = indexes.max()
+        if largest >= len(self.sparse):
+            self._grow(largest)
+        self.sparse[indexes] = rows
+        self.slot_entity_ids[indexes] = entity_ids
+
+    def rows(self, entity_ids):
+        """Look up the rows of a collection of entity ids at once.
+        """
+        if not isinstance(entity_ids, np.ndarray):
+            entity_ids = np.fromiter(entity_ids, dtype=np.int64,
+                                     count=len(entity_ids))
+        indexes = entity_ids & INDEX_MASK
+        inside = (entity_ids >= 0) & (indexes < len(self.sparse))
+        if not inside.all():
+            raise KeyError(entity_ids[~inside][0])
+        rows = self.sparse[indexes]
+        missing = (rows < 0) | (self.slot_entity_ids[indexes] != entity_ids)
+        if missing.any():
+            raise KeyError(entity_ids[missing][0])
+        return rows
+
+    def discard_many(self, entity_ids):
+        """Remove many entity ids at once.
+        """
+        indexes = entity_ids & INDEX_MASK
+        self.sparse[indexes] = -1
+        self.slot_entity_ids[indexes] = -1
+
+    def pop(self, entity_id):
+        row = self[entity_id]
+        index = entity_id & INDEX_MASK
+        self.sparse[index] = -1
+        self.slot_entity_ids[index] = -1
+        return row
+
+
+class SparseSetContainer(ArrayContainer):
+    """Component container backed by a sparse set.
+
+    A dense array of entity ids and a dense array of components are kept
+    packed, like :class:`ArrayContainer`. Instead of a dict, a sparse
+    array indexed by entity_id maps to rows, so membership tests, adds
+    and removes are O(1) array operations and iteration over the dense
+    arrays is contiguous.
+
+    Entity ids must be non-negative integers. The sparse array is
+    as large as the largest slot index seen, so with recycled entity ids
+    it stays as small as the number of live entities allows.
+
+    :param dtype: the NumPy dtype of a single component. By default
+      components are arbitrary Python objects.
+    :param capacity: the number of rows to preallocate.
+    """
+    def __init__(self, dtype=object, capacity=16):
+        super().__init__(dtype, capacity)
+
+    def _create_index(self):
+        return SparseIndex()
+
+    def _index_many(self, entity_ids, rows):
+        self.index.assign(entity_ids, rows)
+
+    def _unindex_many(self, entity_ids):
+        self.index.discard_many(entity_ids)
+
+    def rows(self, entity_ids):
+        """Get the rows of a collection of entity ids as an array.
+
+        This is a single vectorized lookup in the sparse array.
+        KeyError if an entity id is not in the container.
+        """
+        return self.index.rows(entity_ids)
+
+
+class _ChangeCounter(threading.local):
+    count = 0
+
+
 class Registry:
     """Entity component system registry.
+
+    Each component id gets a bit, and for each entity the registry
+    maintains a bitmask of the components it has. A system needs all
+    the bits in its own mask, so tracking only involves integer
+    operations, not container lookups.
+
+    The registry also keeps a change version for each component id.
+    Each add, remove or change of a component increases the global
+    version and stores it as the version of the component id.
+
+    Entity ids are generational: an id packs a slot index and the
+    generation of that slot. Ids released with
+    :meth:`release_entity_id` are recycled with the next generation,
+    and the old id becomes stale. Until a slot is recycled its
+    generation is 0, so entity ids are plain increasing integers.
     """
     def __init__(self):
         self.components = {}
         self.systems = []
         self.component_to_systems = {}
+        self.component_to_excluders = {}
+        self.component_to_watchers = {}
+        self.component_to_indexes = {}
+        self.component_bits = {}
+        self.bit_components = {}
+        self.component_versions = {}
+        self.entity_masks = {}
         self.entity_id_counter = 0
+        self.generations = {}
+        self.free_indexes = deque()
+        self.version = 0
+        self.change_counter = _ChangeCounter()
+        self.sync_points = set()
+        self.plan = None
+        self.fusion = False
+        self.fusion_block_size = None
+        self.commands = CommandBuffer(self)
+        self.instrumentation = None
 
     def register_component(self, component_id, container=None):
         """Register a component container that contains components.
@@ -116,15 +800,82 @@ class Registry:
         if container is None:
             container = DictContainer()
         self.components[component_id] = container
+        self.plan = None
         self.component_to_systems[component_id] = []
+        self.component_versions[component_id] = 0
+        self.component_bit(component_id)
+
+    @property
+    def structural_changes(self):
+        """The number of components added and removed by this thread.
+
+        Systems that run concurrently on other threads don't affect it,
+        so the difference before and after a system runs is its own.
+        """
+        return self.change_counter.count
+
+    def component_bit(self, component_id):
+        """Get the bit for a component id.
+        """
+        bit = self.component_bits.get(component_id)
+        if bit is None:
+            bit = self.component_bits[component_id] = (
+                1 << len(self.component_bits))
+            self.bit_components[bit] = component_id
+        return bit
+
+    def component_mask(self, component_ids):
+        """Get the bitmask for a collection of component ids.
+        """
+        mask = 0
+        for component_id in component_ids:
+            mask |= self.component_bit(component_id)
+        return mask
 
     def register_system(self, system):
         """Register a system that processes components.
+
+        The system's :class:`Query` is compiled into bitmasks, which
+        the registry keeps up to date as components are added and
+        removed. Entities that already match are tracked immediately.
         """
-        # XXX add topological sort options so you can design system
-        # execution order where this matters
+        query = getattr(system, 'query', None)
+        if query is None:
+            query = system.query = Query(system.component_ids)
+        query.compile(self)
         self.systems.append(system)
-        self._update_component_to_systems(system, system.component_ids)
+        self.plan = None
+        self._update_component_to_systems(system, query.components)
+        for component_id in query.without:
+            self.component_to_excluders.setdefault(
+                component_id, []).append(system)
+        if system.watches_changes:
+            for component_id in system.component_ids:
+                self.component_to_watchers.setdefault(
+                    component_id, []).append(system)
+        if self.entity_masks:
+            system.track_many(self.matching(query.components, query.without))
+
+    def matching(self, component_ids, without=()):
+        """Get the ids of all entities that have the listed component_ids.
+
+        :param without: component ids the entities must not have.
+
+        The entity masks are compared in one vectorized operation.
+        Returns a NumPy array of entity ids.
+        """
+        query = Query(component_ids, without)
+        query.compile(self)
+        count = len(self.entity_masks)
+        entity_ids = np.fromiter(self.entity_masks.keys(), dtype=np.int64,
+                                 count=count)
+        masks = np.fromiter(self.entity_masks.values(),
+                            dtype=self._mask_dtype(), count=count)
+        return entity_ids[query.matches_many(masks)]
+
+    def _mask_dtype(self):
+        # Python ints are needed once we run out of bits in an uint64
+        return np.uint64 if len(self.component_bits) <= 64 else object
 
     def _update_component_to_systems(self, system, component_ids):
         """Maintain map of component_ids to systems that are interested.
@@ -133,13 +884,61 @@ class Registry:
             self.component_to_systems.setdefault(component_id, []).append(
                 system)
 
+    def add_index(self, component_id, index):
+        """Attach an index, such as a :class:`GridIndex`, to a component.
+
+        The registry keeps the index up to date as entities get, change
+        or lose the component. Entities that already have it are
+        indexed immediately. Returns the index.
+        """
+        index.attach(self.components[component_id])
+        self.component_to_indexes.setdefault(component_id, []).append(index)
+        index.changed_many(self.matching([component_id]))
+        return index
+
+    def _bump(self, component_id):
+        self.version += 1
+        self.component_versions[component_id] = self.version
+
+    def changed_since(self, component_ids, version):
+        """Check whether any of the component_ids changed after version.
+        """
+        for component_id in component_ids:
+            if self.component_versions.get(component_id, 0) > version:
+                return True
+        return False
+
+    def mark_changed(self, entity_id, component_id):
+        """Record that a component was changed in place.
+
+        Call this after updating a component through its container, so
+        that systems watching for changes see the entity.
+        """
+        self._bump(component_id)
+        for index in self.component_to_indexes.get(component_id, ()):
+            index.changed(entity_id)
+        for system in self.component_to_watchers.get(component_id, ()):
+            system.changed(entity_id)
+
+    def mark_changed_many(self, entity_ids, component_id):
+        """Record that the components of many entities were changed.
+
+        Use this after a vectorized update.
+        """
+        self._bump(component_id)
+        for index in self.component_to_indexes.get(component_id, ()):
+            index.changed_many(entity_ids)
+        watchers = self.component_to_watchers.get(component_id)
+        if watchers:
+            entity_ids = _as_list(entity_ids)
+            for system in watchers:
+                system.changed_many(entity_ids)
+
     def has_components(self, entity_id, component_ids):
         """Check whether an entity has the listed component_ids.
         """
-        for component_id in component_ids:
-            if entity_id not in self.components[component_id]:
-                return False
-        return True
+        required = self.component_mask(component_ids)
+        return self.entity_masks.get(entity_id, 0) & required == required
 
     def get(self, entity_id, component_id):
         """Get a specific component for an entity.
@@ -150,11 +949,59 @@ class Registry:
 
     def create_entity_id(self):
         """Create a new entity id.
+
+        Released slots are recycled first, oldest first.
         """
+        if self.free_indexes:
+            index = self.free_indexes.popleft()
+            generation = self.generations[index] = -self.generations[index]
+            return pack_entity_id(index, generation)
         result = self.entity_id_counter
         self.entity_id_counter += 1
         return result
 
+    def release_entity_id(self, entity_id):
+        """Release an entity id so that its slot can be recycled.
+
+        The entity must not have components anymore. The entity id
+        becomes stale: it can't get components again.
+        """
+        if not self.is_alive(entity_id):
+            raise KeyError(entity_id)
+        if entity_id in self.entity_masks:
+            raise ValueError(
+                "Cannot release entity id with components: %r" % entity_id)
+        index = entity_index(entity_id)
+        generation = entity_generation(entity_id) + 1
+        if generation > MAX_GENERATION:
+            # retire the slot rather than wrap around
+            self.generations[index] = -1
+            return
+        # a negative generation marks a free slot
+        self.generations[index] = -generation
+        self.free_indexes.append(index)
+
+    def is_alive(self, entity_id):
+        """Check whether entity_id is a live entity id, not a stale one.
+        """
+        index = entity_index(entity_id)
+        if entity_id < 0 or index >= self.entity_id_counter:
+            return False
+        return self.generations.get(index, 0) == entity_generation(entity_id)
+
+    def has_entity(self, entity_id):
+        """Check whether entity_id has components or is alive.
+
+        These are the entities :meth:`remove_entity` accepts.
+        """
+        return entity_id in self.entity_masks or self.is_alive(entity_id)
+
+    def _check_alive(self, entity_id):
+        generation = self.generations.get(entity_index(entity_id))
+        if (generation is not None and
+                generation != entity_generation(entity_id)):
+            raise KeyError("Stale entity id: %r" % entity_id)
+
     def add_entity(self, **components):
         """Add a new entity with a bunch of associated components.
         """
@@ -168,24 +1015,200 @@ class Registry:
         for component_id, component in components.items():
             self.add_component(entity_id, component_id, component)
 
+    def create_entity_ids(self, n):
+        """Create n new entity ids.
+
+        Released slots are recycled first; the rest is a contiguous
+        range of new entity ids. Returns a NumPy array.
+        """
+        recycled = [self.create_entity_id()
+                    for i in range(min(n, len(self.free_indexes)))]
+        start = self.entity_id_counter
+        self.entity_id_counter += n - len(recycled)
+        fresh = np.arange(start, self.entity_id_counter, dtype=np.int64)
+        if not recycled:
+            return fresh
+        return np.concatenate([np.array(recycled, dtype=np.int64), fresh])
+
+    def add_entities(self, n, **columns):
+        """Add n new entities at once, with columns of components.
+
+        Each keyword argument gives the components for a component id,
+        one for each new entity: a DataFrame, a NumPy array or any other
+        sequence accepted by the container's ``add_many``.
+
+        The new entities get recycled entity ids or else a contiguous
+        range of new ones. Each container gets a single bulk add and
+        each interested system tracks all new entities in one go.
+
+        Returns a NumPy array with the new entity ids.
+        """
+        for component_id, components in columns.items():
+            count = _count(components)
+            if count != n:
+                raise ValueError(
+                    "Expected %s components for %r, got %s" % (
+                        n, component_id, count))
+        entity_ids = self.create_entity_ids(n)
+        self.add_components_many(entity_ids, **columns)
+        return entity_ids
+
+    def add_components_many(self, entity_ids, **columns):
+        """Add columns of components to new entity ids in bulk.
+
+        The entity ids must not have any components yet. See
+        :meth:`add_entities`.
+        """
+        entity_ids = np.asarray(entity_ids, dtype=np.int64)
+        if not columns:
+            # like remove_component, entities without components have
+            # no mask
+            return
+        for component_id, components in columns.items():
+            self.components[component_id].add_many(entity_ids, components)
+            self._bump(component_id)
+            for index in self.component_to_indexes.get(component_id, ()):
+                index.changed_many(entity_ids)
+        self.change_counter.count += len(entity_ids) * len(columns)
+        mask = self.component_mask(columns)
+        self.entity_masks.update(dict.fromkeys(entity_ids.tolist(), mask))
+        systems = {}
+        for component_id in columns:
+            for system in self.component_to_systems[component_id]:
+                systems[id(system)] = system
+        for system in systems.values():
+            if system.query.matches(mask):
+                system.track_many(entity_ids)
+
     def add_component(self, entity_id, component_id, component):
         """Add a component to an entity.
 
-        This makes sure all interested systems track this entity.
+        This makes sure all interested systems track this entity, and
+        that systems that exclude the component forget it.
+        KeyError if entity_id is stale.
         """
+        if self.generations:
+            self._check_alive(entity_id)
         self.components[component_id][entity_id] = component
+        self._bump(component_id)
+        for index in self.component_to_indexes.get(component_id, ()):
+            index.changed(entity_id)
+        bit = self.component_bits[component_id]
+        old_mask = self.entity_masks.get(entity_id, 0)
+        if old_mask & bit:
+            # replacing a component doesn't change what is tracked
+            for system in self.component_to_watchers.get(component_id, ()):
+                system.changed(entity_id)
+            return
+        self.change_counter.count += 1
+        mask = self.entity_masks[entity_id] = old_mask | bit
         for system in self.component_to_systems[component_id]:
-            if self.has_components(entity_id, system.component_ids):
+            if system.query.matches(mask):
                 system.track(entity_id)
+        for system in self.component_to_excluders.get(component_id, ()):
+            if system.query.matches(old_mask):
+                system.forget(entity_id)
 
     def remove_component(self, entity_id, component_id):
         """Remove a component from an entity.
 
-        This makes sure interested systems stop tracking this entity.
+        This makes sure interested systems stop tracking this entity,
+        and that systems that exclude the component start tracking it.
         """
         del self.components[component_id][entity_id]
+        self._bump(component_id)
+        for index in self.component_to_indexes.get(component_id, ()):
+            index.remove(entity_id)
+        self.change_counter.count += 1
+        mask = self.entity_masks.get(entity_id, 0)
         for system in self.component_to_systems[component_id]:
-            system.forget(entity_id)
+            if system.query.matches(mask):
+                system.forget(entity_id)
+        mask &= ~self.component_bits[component_id]
+        if mask:
+            self.entity_masks[entity_id] = mask
+        else:
+            self.entity_masks.pop(entity_id, None)
+        for system in self.component_to_excluders.get(component_id, ()):
+            if system.query.matches(mask):
+                system.track(entity_id)
+
+    def remove_entity(self, entity_id):
+        """Remove an entity with all its components.
+
+        Only the containers of the components the entity has and the
+        systems that track it are involved. The entity id is released,
+        see :meth:`release_entity_id`. KeyError if there is no such
+        entity.
+        """
+        if not self.has_entity(entity_id):
+            raise KeyError(entity_id)
+        mask = self.entity_masks.pop(entity_id, 0)
+        alive = self.is_alive(entity_id)
+        systems = {}
+        remaining = mask
+        while remaining:
+            bit = remaining & -remaining
+            remaining ^= bit
+            component_id = self.bit_components[bit]
+            del self.components[component_id][entity_id]
+            self._bump(component_id)
+            self.change_counter.count += 1
+            for index in self.component_to_indexes.get(component_id, ()):
+                index.remove(entity_id)
+            for system in self.component_to_systems[component_id]:
+                systems[id(system)] = system
+        for system in systems.values():
+            if system.query.matches(mask):
+                system.forget(entity_id)
+        if alive:
+            self.release_entity_id(entity_id)
+
+    def remove_entities(self, entity_ids):
+        """Remove many entities with all their components at once.
+
+        Each container gets a single bulk removal of the entities that
+        have its component, and each system forgets the entities it
+        tracks in one go. Only the containers of components the entities
+        have and the systems interested in those are involved. The
+        entity ids are released. KeyError if one of the entities doesn't
+        exist.
+        """
+        entity_ids = np.unique(np.asarray(entity_ids, dtype=np.int64))
+        id_list = entity_ids.tolist()
+        for entity_id in id_list:
+            if not self.has_entity(entity_id):
+                raise KeyError(entity_id)
+        dtype = self._mask_dtype()
+        masks = np.array([self.entity_masks.pop(entity_id, 0)
+                          for entity_id in id_list], dtype=dtype)
+        systems = {}
+        remaining = int(np.bitwise_or.reduce(masks)) if len(masks) else 0
+        while remaining:
+            bit = remaining & -remaining
+            remaining ^= bit
+            component_id = self.bit_components[bit]
+            for system in self.component_to_systems[component_id]:
+                systems[id(system)] = system
+            removed = entity_ids[(masks & np.array(bit, dtype=dtype)) != 0]
+            container = self.components[component_id]
+            if hasattr(container, 'remove_many'):
+                container.remove_many(removed)
+            else:
+                for entity_id in removed.tolist():
+                    del container[entity_id]
+            self._bump(component_id)
+            self.change_counter.count += len(removed)
+            for index in self.component_to_indexes.get(component_id, ()):
+                for entity_id in removed.tolist():
+                    index.remove(entity_id)
+        for system in systems.values():
+            tracked = entity_ids[system.query.matches_many(masks)]
+            if len(tracked):
+                system.forget_many(tracked)
+        for entity_id in id_list:
+            if self.is_alive(entity_id):
+                self.release_entity_id(entity_id)
 
     def component_containers(self, component_ids):
         """Get component containers.
@@ -193,28 +1216,246 @@ class Registry:
         return [self.components[component_id]
                 for component_id in component_ids]
 
+    def add_sync_point(self):
+        """Apply recorded commands after the systems registered so far.
+
+        Systems registered later see the structural changes recorded in
+        :attr:`commands` by the earlier systems in the same execution.
+        Commands are always applied at the end of :meth:`execute`.
+        """
+        if self.systems:
+            self.sync_points.add(len(self.systems) - 1)
+            self.plan = None
+
+    def enable_fusion(self, block_size=None):
+        """Run adjacent vectorized systems over the same components fused.
+
+        Such systems are run as one :class:`FusedSystem`, which gathers
+        the component columns once, runs each system over blocks of
+        entities that fit in the CPU cache and writes the columns back
+        once. Only enable this when these systems treat each entity on
+        its own.
+
+        :param block_size: the number of entities in a block. By
+          default it depends on the size of the components.
+        """
+        self.fusion = True
+        self.fusion_block_size = block_size
+        self.plan = None
+
+    def disable_fusion(self):
+        """Run every system on its own again.
+        """
+        self.fusion = False
+        self.plan = None
+
+    def execution_plan(self):
+        """Get the :class:`ExecutionPlan` for the registered systems.
+
+        It is made the first time it is needed after systems, components
+        or sync points were registered.
+        """
+        if self.plan is None:
+            self.plan = ExecutionPlan(self)
+        return self.plan
+
     def execute(self, update):
         """Execute all systems.
 
         The update argument is passed through to all systems. It can
         contain information about the current state of the game, including
         an API to add components.
+
+        Structural changes recorded in :attr:`commands` are applied at
+        the sync points and at the end. Systems run in the order of the
+        :meth:`execution_plan`. Async systems can't be executed this
+        way, see :meth:`execute_async`.
+        """
+        plan = self.execution_plan()
+        check_sync(plan)
+        instrumentation = self.instrumentation
+        if instrumentation is not None:
+            instrumentation.start_frame()
+        for system, containers, sync in plan.steps:
+            if instrumentation is None:
+                system.execute(update, self, containers)
+            else:
+                instrumentation.execute(system, update, self, containers)
+            if sync:
+                self.commands.apply()
+        self.commands.apply()
+        if instrumentation is not None:
+            instrumentation.end_frame()
+
+    async def execute_async(self, update):
+        """Execute all systems, awaiting async systems concurrently.
+
+        Like :meth:`execute`, but an :class:`AsyncSystem` is started as a
+        task and the following systems run while it waits for I/O. A
+        system only runs once the async systems it conflicts with, see
+        :meth:`System.conflicts`, are done, so async systems should
+        declare what they write. All async systems are awaited at the
+        sync points, before the commands are applied, and at the end.
+        """
+        instrumentation = self.instrumentation
+        if instrumentation is not None:
+            instrumentation.start_frame()
+        tasks = []
+        try:
+            for system, containers, sync in self.execution_plan().steps:
+                conflicting = [task for other, task in tasks
+                               if other.conflicts(system)]
+                if conflicting:
+                    await asyncio.gather(*conflicting)
+                if getattr(system, 'execute_async', None) is None:
+                    if instrumentation is None:
+                        system.execute(update, self, containers)
+                    else:
+                        instrumentation.execute(
+                            system, update, self, containers)
+                else:
+                    if instrumentation is None:
+                        coroutine = system.execute_async(
+                            update, self, containers)
+                    else:
+                        coroutine = instrumentation.execute_async(
+                            system, update, self, containers)
+                    tasks.append((system, asyncio.ensure_future(coroutine)))
+                    # let it start its I/O before we continue
+                    await asyncio.sleep(0)
+                if sync:
+                    await asyncio.gather(*[task for system, task in tasks])
+                    tasks = []
+                    self.commands.apply()
+            await asyncio.gather(*[task for system, task in tasks])
+        finally:
+            for system, task in tasks:
+                task.cancel()
+        self.commands.apply()
+        if instrumentation is not None:
+            instrumentation.end_frame()
+
+    def instrument(self, window=120, max_events=100000):
+        """Turn on instrumentation of system execution.
+
+        Returns the :class:`Instrumentation` object that collects the
+        measurements. See :meth:`uninstrument` to turn it off again.
+        """
+        self.instrumentation = Instrumentation(self, window, max_events)
+        return self.instrumentation
+
+    def uninstrument(self):
+        """Turn off instrumentation.
+        """
+        self.instrumentation = None
+
+    def snapshot(self, f):
+        """Write a snapshot of all entities to f, a path or binary file.
+
+        The snapshot contains all component containers, the entity id
+        counter and generations, and which entities the systems track.
+        Arrays are written as raw buffers. Commands that haven't been
+        applied yet are not included.
+        """
+        save_snapshot(self, f)
+
+    def restore(self, f, mmap=False):
+        """Restore entities from a snapshot in f, a path or binary file.
+
+        The same components and systems must be registered, in the same
+        order, as in the registry the snapshot was made of.
+
+        :param mmap: if true, the arrays in the snapshot are
+          memory-mapped instead of read, so only the pages that are used
+          get loaded. Writes don't affect the snapshot file.
+        """
+        load_snapshot(self, f, mmap)
+
+
+class Query:
+    """The entities a system gets, by the components they have.
+
+    Entities must have all of components and none of without. Optional
+    components don't affect which entities match, but their containers
+    are passed to the system after those of the required components.
+
+    The registry compiles a query into bitmasks once, when the system
+    is registered, and keeps the entities of the system up to date as
+    components are added and removed, so systems don't have to filter
+    entities themselves.
+
+    :param components: the component ids entities must have.
+    :param without: component ids entities must not have.
+    :param optional: component ids entities may have.
+    """
+    def __init__(self, components, without=(), optional=()):
+        self.components = list(components)
+        self.without = list(without)
+        self.optional = list(optional)
+        self.mask = 0
+        self.exclude_mask = 0
+
+    @property
+    def component_ids(self):
+        """The ids of the components passed to the system."""
+        return self.components + self.optional
+
+    def compile(self, registry):
+        """Compute the bitmasks of the query for registry."""
+        self.mask = registry.component_mask(self.components)
+        self.exclude_mask = registry.component_mask(self.without)
+
+    def matches(self, mask):
+        """Check whether an entity with component mask matches."""
+        return (mask & self.mask == self.mask and
+                not mask & self.exclude_mask)
+
+    def matches_many(self, masks):
+        """Check which of a NumPy array of component masks match.
+
+        Returns a boolean array.
         """
-        for system in self.systems:
-            containers = self.component_containers(system.component_ids)
-            system.execute(update, self, containers)
+        required = np.array(self.mask, dtype=masks.dtype)
+        excluded = np.array(self.exclude_mask, dtype=masks.dtype)
+        return ((masks & required) == required) & ((masks & excluded) == 0)
 
 
 class System:
-    def __init__(self, func, component_ids):
+    watches_changes = False
+
+    def __init__(self, func, component_ids, reads=None, writes=None):
         """
         :param func: a function that takes the update and component
           container arguments and updates the state accordingly.
-        :param component_ids: the component ids that this system cares about.
+        :param component_ids: the component ids that this system cares
+          about, or a :class:`Query`.
+        :param reads: optional component ids that this system only reads.
+          The component ids it is passed are always considered read.
+        :param writes: component ids that this system writes, including
+          components it adds or removes. If not given the system may
+          write anything, so it never runs concurrently with other
+          systems.
         """
+        if isinstance(component_ids, Query):
+            self.query = component_ids
+        else:
+            self.query = Query(component_ids)
         self.func = func
-        self.component_ids = component_ids
+        self.component_ids = self.query.component_ids
         self.entity_ids = set()
+        self.reads = frozenset(self.component_ids).union(reads or ())
+        self.writes = frozenset(writes) if writes is not None else None
+
+    def conflicts(self, other):
+        """Check whether this system and other can't run concurrently.
+
+        This is the case when one system writes a component that the
+        other reads or writes, or when either has not declared its writes.
+        """
+        if self.writes is None or other.writes is None:
+            return True
+        return bool(self.writes & (other.reads | other.writes) or
+                    other.writes & self.reads)
 
     def execute(self, update, registry, component_containers):
         """Execute this system.
@@ -230,20 +1471,322 @@ class System:
         """Track entity_id with this system."""
         self.entity_ids.add(entity_id)
 
+    def track_many(self, entity_ids):
+        """Track many entity ids with this system."""
+        self.entity_ids.update(_as_list(entity_ids))
+
     def forget(self, entity_id):
         """Stop tracking entity_id with this system."""
-        self.entity_ids.remove(entity_id)
+        self.entity_ids.discard(entity_id)
+
+    def forget_many(self, entity_ids):
+        """Stop tracking many entity ids with this system."""
+        for entity_id in _as_list(entity_ids):
+            self.forget(entity_id)
+
+    def reset(self, entity_ids):
+        """Track exactly entity_ids, as when restoring a snapshot."""
+        self.entity_ids = set(_as_list(entity_ids))
+
+
+class ChangedSystem(System):
+    """A system that only gets entities that changed since it last ran.
+
+    Instead of all tracked entity ids, func gets three sets of entity ids
+    after the update and registry: the entities that started being
+    tracked, the entities of which one of the components was changed,
+    and the entities that stopped being tracked since the previous
+    execution. These are followed by the component container values as
+    with :class:`System`.
+
+    Changes made in place must be reported with
+    :meth:`Registry.mark_changed` or :meth:`Registry.mark_changed_many`.
+    If nothing changed, func isn't called at all.
+    """
+    watches_changes = True
+
+    def __init__(self, func, component_ids, reads=None, writes=None):
+        super().__init__(func, component_ids, reads, writes)
+        self.added = set()
+        self.changed_entity_ids = set()
+        self.removed = set()
+        self.last_version = -1
+
+    def execute(self, update, registry, component_containers):
+        """Execute this system if anything changed.
+        """
+        # adding or removing an excluded component changes our entities
+        if not registry.changed_since(
+                self.component_ids + self.query.without, self.last_version):
+            return
+        self.last_version = registry.version
+        if not (self.added or self.changed_entity_ids or self.removed):
+            return
+        added, changed, removed = (
+            self.added, self.changed_entity_ids, self.removed)
+        self.added, self.changed_entity_ids, self.removed = (
+            set(), set(), set())
+        args = ([added, changed, removed] +
+                [container.value() for container in component_containers])
+        self.func(update, registry, *args)
+
+    def track(self, entity_id):
+        super().track(entity_id)
+        self.added.add(entity_id)
+        self.removed.discard(entity_id)
+
+    def track_many(self, entity_ids):
+        entity_ids = _as_list(entity_ids)
+        super().track_many(entity_ids)
+        self.added.update(entity_ids)
+        self.removed.difference_update(entity_ids)
+
+    def forget(self, entity_id):
+        if entity_id not in self.entity_ids:
+            return
+        super().forget(entity_id)
+        self.changed_entity_ids.discard(entity_id)
+        if entity_id in self.added:
+            self.added.discard(entity_id)
+        else:
+            self.removed.add(entity_id)
+
+    def reset(self, entity_ids):
+        """Track exactly entity_ids; they are all reported as added."""
+        super().reset(entity_ids)
+        self.added = set(self.entity_ids)
+        self.changed_entity_ids = set()
+        self.removed = set()
+        self.last_version = -1
+
+    def changed(self, entity_id):
+        """Record a change to a component of entity_id."""
+        if entity_id in self.entity_ids and entity_id not in self.added:
+            self.changed_entity_ids.add(entity_id)
+
+    def changed_many(self, entity_ids):
+        """Record changes to the components of many entity ids."""
+        self.changed_entity_ids.update(
+            self.entity_ids.intersection(entity_ids) - self.added)
+
+
+class AsyncSystem(System):
+    """A system with an ``async def`` function, for systems that do I/O.
+
+    func gets the same arguments as that of a :class:`System`, but the
+    entity ids are a copy, as other systems may run while it waits.
+    It can only be executed by :meth:`Registry.execute_async`, which
+    lets the systems that follow run while it waits.
+    """
+    def execute(self, update, registry, component_containers):
+        """Async systems can't be executed without an event loop.
+        """
+        raise TypeError(
+            "Async system can only be executed with "
+            "Registry.execute_async: %r" % self)
+
+    async def execute_async(self, update, registry, component_containers):
+        """Execute this system, awaiting its function.
+        """
+        args = ([set(self.entity_ids)] +
+                [container.value() for container in component_containers])
+        await self.func(update, registry, *args)
 
 
-def _entity_ids_func(func, update, r, entity_ids, *containers):
-    entity_ids_containers = [
-        [container[entity_id] for entity_id in entity_ids]
-        for container in containers]
-    func(update, r, entity_ids, *entity_ids_containers)
+def async_system(func, component_ids, reads=None, writes=None):
+    """A system where func is an ``async def`` function.
+    """
+    return AsyncSystem(func, component_ids, reads, writes)
+
+
+def _as_list(entity_ids):
+    if isinstance(entity_ids, np.ndarray):
+        return entity_ids.tolist()
+    return entity_ids
+
+
+def _padded(array, capacity):
+    if len(array) >= capacity:
+        return array
+    padded = np.zeros(capacity, dtype=array.dtype)
+    padded[:len(array)] = array
+    return padded
+
+
+def _check_kind(container, state, kind):
+    if state['kind'] != kind:
+        raise ValueError("Cannot restore %s snapshot into %r" % (
+            state['kind'], container))
+
+
+def _count(components):
+    # a dict of column arrays counts its rows, not its columns
+    if isinstance(components, dict):
+        for column in components.values():
+            return len(column)
+        return 0
+    return len(components)
+
+
+class EntityIdsSystem(System):
+    """A system that gets lists of components for the entities it tracks.
+
+    func gets a tuple of the tracked entity ids, not a set like with a
+    plain :class:`System`, followed by a sequence of components for each
+    component id, in the same order. Components that are cached are
+    passed as a tuple too, so func can't change the caches by accident.
+
+    These lists are cached and patched when entities are tracked,
+    forgotten or have their components replaced, so in a steady state
+    little work is done per execution:
+
+    * For dict containers the lists of components are kept as is.
+
+    * For array containers the rows of the entities are cached as an
+      array until the container's rows change. Components are gathered
+      from the rows.
+
+    * Other containers are indexed by entity id on each execution.
+
+    * Optional components are looked up on each execution too; the list
+      has None for entities that don't have the component.
+
+    Components replaced in a dict container without going through the
+    registry should be reported with :meth:`Registry.mark_changed`.
+    """
+    watches_changes = True
+
+    def __init__(self, func, component_ids, reads=None, writes=None):
+        super().__init__(func, component_ids, reads, writes)
+        self.order = []
+        self.positions = {}
+        self.stale = set()
+        self.membership_version = 0
+        self.caches = None
+
+    def track(self, entity_id):
+        if entity_id in self.positions:
+            self.stale.add(entity_id)
+            return
+        super().track(entity_id)
+        self.positions[entity_id] = len(self.order)
+        self.order.append(entity_id)
+        self.stale.add(entity_id)
+        self.membership_version += 1
+        if self.caches is not None:
+            for cache in self.caches:
+                if isinstance(cache, list):
+                    cache.append(None)
+
+    def track_many(self, entity_ids):
+        for entity_id in _as_list(entity_ids):
+            self.track(entity_id)
+
+    def forget(self, entity_id):
+        position = self.positions.pop(entity_id, None)
+        if position is None:
+            return
+        super().forget(entity_id)
+        self.stale.discard(entity_id)
+        self.membership_version += 1
+        last = self.order.pop()
+        if position < len(self.order):
+            self.order[position] = last
+            self.positions[last] = position
+        if self.caches is None:
+            return
+        for cache in self.caches:
+            if isinstance(cache, list):
+                moved = cache.pop()
+                if position < len(cache):
+                    cache[position] = moved
+
+    def reset(self, entity_ids):
+        super().reset(entity_ids)
+        self.order = list(_as_list(entity_ids))
+        self.positions = {entity_id: position
+                          for position, entity_id in enumerate(self.order)}
+        self.stale = set()
+        self.membership_version += 1
+        self.caches = None
+
+    def changed(self, entity_id):
+        """Mark the cached components of entity_id as stale."""
+        if entity_id in self.positions:
+            self.stale.add(entity_id)
+
+    def changed_many(self, entity_ids):
+        """Mark the cached components of many entity ids as stale."""
+        self.stale.update(self.positions.keys() & set(entity_ids))
+
+    def _create_caches(self, component_containers):
+        caches = []
+        required = len(self.query.components)
+        for i, container in enumerate(component_containers):
+            if i >= required:
+                caches.append(_OPTIONAL)
+            elif isinstance(container, dict):
+                caches.append([container[entity_id]
+                               for entity_id in self.order])
+            elif isinstance(container, ArrayContainer):
+                caches.append(_RowsCache())
+            else:
+                caches.append(None)
+        self.caches = caches
+        self.stale.clear()
+
+    def _gather(self, container, cache):
+        if isinstance(cache, list):
+            return tuple(cache)
+        if cache is None:
+            return [container[entity_id] for entity_id in self.order]
+        if cache is _OPTIONAL:
+            return [container[entity_id] if entity_id in container else None
+                    for entity_id in self.order]
+        # getting the value first flushes buffered containers
+        values = container.value()
+        if (cache.container_version != container.version or
+                cache.membership_version != self.membership_version):
+            cache.rows = container.rows(self.order)
+            cache.container_version = container.version
+            cache.membership_version = self.membership_version
+        if values.dtype.names is None and values.dtype.hasobject:
+            # taking rows from an object array keeps the references
+            return values[cache.rows]
+        # structured rows are views that can be updated
+        return [values[row] for row in cache.rows.tolist()]
+
+    def execute(self, update, registry, component_containers):
+        """Execute this system with the gathered components.
+        """
+        if self.caches is None:
+            self._create_caches(component_containers)
+        elif self.stale:
+            for container, cache in zip(component_containers, self.caches):
+                if isinstance(cache, list):
+                    for entity_id in self.stale:
+                        cache[self.positions[entity_id]] = (
+                            container[entity_id])
+            self.stale.clear()
+        lists = [self._gather(container, cache)
+                 for container, cache in zip(component_containers,
+                                             self.caches)]
+        self.func(update, registry, tuple(self.order), *lists)
+
+
+# marks the caches of optional components, which aren't cached
+_OPTIONAL = object()
+
+
+class _RowsCache:
+    def __init__(self):
+        self.rows = None
+        self.container_version = None
+        self.membership_version = None
 
 
-def entity_ids_system(func, component_ids):
-    return System(partial(_entity_ids_func, func), component_ids)
+def entity_ids_system(func, component_ids, reads=None, writes=None):
+    return EntityIdsSystem(func, component_ids, reads, writes)
 
 
 def _item_func(func, update, r, *lists):
@@ -251,8 +1794,8 @@ def _item_func(func, update, r, *lists):
         func(update, r, *items)
 
 
-def item_system(func, component_ids):
+def item_system(func, component_ids, reads=None, writes=None):
     """A system where you update individual items, not collections of them.
     """
-    return System(partial(_entity_ids_func, partial(_item_func, func)),
-                  component_ids)
+    return EntityIdsSystem(partial(_item_func, func), component_ids,
+                           reads, writes)
@@ -0,0 +1,202 @@
+"""Rendering helpers that feed vertex buffers from component arrays.
+
+:class:`QuadVertices` keeps the vertex data of a textured quad per
+entity in persistent NumPy arrays and updates it in place each frame.
+:class:`PygletQuads` copies that data into a persistent pyglet vertex
+list. pyglet is only imported when a vertex list is made, so the rest
+works without it, for instance in tests.
+"""
+import ctypes
+from functools import partial
+
+import numpy as np
+
+from .vectorized import vectorized_system
+
+
+class QuadVertices:
+    """Vertex data for one textured quad per entity.
+
+    Vertex positions, colors and texture coordinates are kept in arrays
+    with room for ``capacity`` quads, laid out as pyglet expects for
+    ``v2f``, ``c4B`` and ``t3f`` data. :meth:`update` writes into them
+    in place; they are only reallocated, with geometric growth, when the
+    number of quads exceeds the capacity.
+
+    :param width: the width of a quad.
+    :param height: the height of a quad.
+    :param anchor_x: the x offset of the position within the quad.
+    :param anchor_y: the y offset of the position within the quad.
+    :param scale: positions are multiplied by this first.
+    :param capacity: the number of quads to preallocate.
+    """
+    def __init__(self, width, height, anchor_x=0, anchor_y=0, scale=1.0,
+                 capacity=16):
+        self.width = width
+        self.height = height
+        self.anchor_x = anchor_x
+        self.anchor_y = anchor_y
+        self.scale = scale
+        self.count = 0
+        self._allocate(max(capacity, 1))
+
+    def _allocate(self, capacity):
+        self.vertices = np.zeros((capacity, 4, 2), dtype=np.float32)
+        self.colors = np.full((capacity, 4, 4), 255, dtype=np.uint8)
+        self.tex_coords = np.zeros((capacity, 4, 3), dtype=np.float32)
+
+    def resize(self, count):
+        """Make room for count quads.
+        """
+        capacity = len(self.vertices)
+        if count > capacity:
+            while capacity < count:
+                capacity *= 2
+            old = (self.vertices, self.colors, self.tex_coords)
+            self._allocate(capacity)
+            for new, existing in zip(
+                    (self.vertices, self.colors, self.tex_coords), old):
+                new[:self.count] = existing[:self.count]
+        self.count = count
+
+    def update(self, x, y, colors=None, tex_coords=None):
+        """Write the quads for the entities at positions x, y.
+
+        :param x: an array of x positions, one for each entity.
+        :param y: an array of y positions.
+        :param colors: optionally a sequence of four arrays, with the
+          red, green, blue and alpha channel of each entity.
+        :param tex_coords: optionally an array with the 12 texture
+          coordinates of each entity's quad, as in a pyglet texture's
+          ``tex_coords``.
+        """
+        count = len(x)
+        self.resize(count)
+        vertices = self.vertices[:count]
+        # corners in the order a, b, c, d: counterclockwise from the
+        # bottom left
+        left, right = vertices[:, 0, 0], vertices[:, 1, 0]
+        np.multiply(x, self.scale, out=left)
+        left -= self.anchor_x
+        np.add(left, self.width, out=right)
+        vertices[:, 2, 0] = right
+        vertices[:, 3, 0] = left
+        bottom, top = vertices[:, 0, 1], vertices[:, 2, 1]
+        np.multiply(y, self.scale, out=bottom)
+        bottom -= self.anchor_y
+        np.add(bottom, self.height, out=top)
+        vertices[:, 1, 1] = bottom
+        vertices[:, 3, 1] = top
+        if colors is not None:
+            for channel, values in enumerate(colors):
+                self.colors[:count, :, channel] = values[:, np.newaxis]
+        if tex_coords is not None:
+            self.tex_coords[:count] = np.reshape(tex_coords, (count, 4, 3))
+
+    def vertex_data(self):
+        """The vertex positions of the quads as a flat array view.
+        """
+        return self.vertices[:self.count].reshape(-1)
+
+    def color_data(self):
+        """The vertex colors of the quads as a flat array view.
+        """
+        return self.colors[:self.count].reshape(-1)
+
+    def tex_coord_data(self):
+        """The texture coordinates of the quads as a flat array view.
+        """
+        return self.tex_coords[:self.count].reshape(-1)
+
+
+class PygletQuads:
+    """A persistent pyglet vertex list for :class:`QuadVertices`.
+
+    The vertex list is created on the first upload and only resized when
+    the number of quads changes. Each upload copies the arrays straight
+    into the vertex list's buffers.
+
+    :param quads: the :class:`QuadVertices` to upload.
+    :param batch: the pyglet batch to add the vertex list to.
+    :param group: the pyglet group, typically a sprite group for the
+      texture.
+    :param mode: the OpenGL primitive mode, ``GL_QUADS`` by default.
+    """
+    def __init__(self, quads, batch, group=None, mode=None):
+        self.quads = quads
+        self.batch = batch
+        self.group = group
+        self.mode = mode
+        self.vertex_list = None
+
+    def upload(self):
+        """Copy the current vertex data into the vertex list.
+        """
+        size = self.quads.count * 4
+        if self.vertex_list is None:
+            if self.mode is None:
+                from pyglet.gl import GL_QUADS
+                self.mode = GL_QUADS
+            self.vertex_list = self.batch.add(
+                size, self.mode, self.group,
+                'v2f/dynamic', 'c4B/dynamic', 't3f/dynamic')
+        elif self.vertex_list.get_size() != size:
+            self.vertex_list.resize(size)
+        _copy(self.vertex_list.vertices, self.quads.vertex_data())
+        _copy(self.vertex_list.colors, self.quads.color_data())
+        _copy(self.vertex_list.tex_coords, self.quads.tex_coord_data())
+
+    def delete(self):
+        """Remove the vertex list from the batch.
+        """
+        if self.vertex_list is not None:
+            self.vertex_list.delete()
+            self.vertex_list = None
+
+
+def _copy(target, data):
+    ctypes.memmove(target, data.ctypes.data, data.nbytes)
+
+
+def _quads_func(quads, upload, position_fields, color_fields, tex_field,
+                update, r, entity_ids, positions, *views):
+    views = list(views)
+    colors = None
+    tex_coords = None
+    if color_fields is not None:
+        color_view = views.pop(0)
+        colors = [color_view[field] for field in color_fields]
+    if tex_field is not None:
+        tex_coords = views.pop(0)[tex_field]
+    x_field, y_field = position_fields
+    quads.update(positions[x_field], positions[y_field], colors, tex_coords)
+    if upload is not None:
+        upload()
+
+
+def quad_system(quads, position='position', color=None, texture=None,
+                upload=None, position_fields=('x', 'y'),
+                color_fields=('r', 'g', 'b', 'a'), tex_field='tex_coords'):
+    """A vectorized system that writes entities into :class:`QuadVertices`.
+
+    :param quads: the :class:`QuadVertices` to write.
+    :param position: the component id of positions.
+    :param color: optionally the component id of colors, with a field
+      for each channel.
+    :param texture: optionally the component id of texture coordinates,
+      with a field of 12 texture coordinates.
+    :param upload: optionally a function to call after the quads have
+      been written, such as :meth:`PygletQuads.upload`.
+    """
+    component_ids = [position]
+    if color is not None:
+        component_ids.append(color)
+    if texture is not None:
+        component_ids.append(texture)
+    func = partial(_quads_func, quads, upload, position_fields,
+                   color_fields if color is not None else None,
+                   tex_field if texture is not None else None)
+    system = vectorized_system(func, component_ids, writes=[])
+    # it writes all quads at once
+    system.fusable = False
+    return system
@@ -0,0 +1,235 @@
+import asyncio
+import time
+
+
+# ticks are due when the accumulator is within this of dt, so that
+# rounding errors don't cause needless waits for a few nanoseconds
+EPSILON = 1e-9
+
+# what the loop of a runner does next
+STEP = 'step'
+ADVANCE = 'advance'
+SLEEP = 'sleep'
+PAUSE = 'pause'
+
+
+class Update:
+    """The update passed to systems by a :class:`Runner`.
+
+    :param dt: the fixed timestep in seconds.
+    :param time: the simulated time at the start of this tick.
+    :param tick: the number of the tick, starting at 0.
+    """
+    def __init__(self, dt, time, tick):
+        self.dt = dt
+        self.time = time
+        self.tick = tick
+
+
+class Runner:
+    """Step a registry on a fixed timestep.
+
+    Elapsed real time is added to an accumulator, and a tick of ``dt``
+    is executed for each ``dt`` in it. To keep a slow simulation from
+    spiraling, at most ``max_steps`` ticks are executed to catch up in a
+    single frame. If a frame budget is given, catching up also stops
+    once the frame has used it. Either way the ticks that are still due
+    are dropped, so that the accumulator stays below ``dt``.
+
+    A tick that takes longer than the budget (or ``dt`` if there is no
+    budget) is an overrun. Overruns are counted and reported to
+    ``on_overrun`` if given, which is called with the runner and the
+    duration of the tick.
+
+    :param executor: what executes the systems for each tick, a
+      :class:`Registry` or a :class:`Scheduler`.
+    :param dt: the fixed timestep in seconds.
+    :param max_steps: the maximum number of ticks per frame.
+    :param budget: the time budget for a frame in seconds.
+    :param on_overrun: optional callback for overruns.
+    :param clock: function returning the current time in seconds.
+    :param sleep: function to sleep a number of seconds.
+    """
+    def __init__(self, executor, dt=1 / 60, max_steps=5, budget=None,
+                 on_overrun=None, clock=time.perf_counter,
+                 sleep=time.sleep):
+        self.executor = executor
+        self.dt = dt
+        self.max_steps = max_steps
+        self.budget = budget
+        self.on_overrun = on_overrun
+        self.clock = clock
+        self.sleep = sleep
+        self.accumulator = 0.0
+        self.time = 0.0
+        self.tick = 0
+        self.overruns = 0
+        self.dropped_ticks = 0
+        self.last_tick_duration = 0.0
+        self.running = False
+
+    def step(self):
+        """Execute a single tick.
+        """
+        start = self.clock()
+        self.executor.execute(Update(self.dt, self.time, self.tick))
+        self._stepped(start)
+
+    def _stepped(self, start):
+        duration = self.clock() - start
+        self.last_tick_duration = duration
+        self.time += self.dt
+        self.tick += 1
+        budget = self.budget if self.budget is not None else self.dt
+        if duration > budget:
+            self.overruns += 1
+            if self.on_overrun is not None:
+                self.on_overrun(self, duration)
+
+    def advance(self, elapsed, limit=None):
+        """Add elapsed real time and execute the ticks that are due.
+
+        :param limit: optionally the maximum number of ticks to execute.
+        Returns the number of ticks executed.
+        """
+        steps = 0
+        for due in self._catch_up(elapsed, limit):
+            self.step()
+            steps += 1
+        return steps
+
+    def _catch_up(self, elapsed, limit):
+        # yields for each tick that is to be executed now
+        self.accumulator += elapsed
+        frame_start = self.clock()
+        max_steps = self._max_steps(limit)
+        steps = 0
+        while self._due(steps, max_steps, frame_start):
+            yield
+            self.accumulator -= self.dt
+            steps += 1
+        self._drop(steps, max_steps)
+
+    def _max_steps(self, limit):
+        if limit is None:
+            return self.max_steps
+        return min(self.max_steps, limit)
+
+    def _due(self, steps, max_steps, frame_start):
+        if self.accumulator + EPSILON < self.dt or steps >= max_steps:
+            return False
+        return not (self.budget is not None and steps and
+                    self.clock() - frame_start >= self.budget)
+
+    def _drop(self, steps, max_steps):
+        if self.accumulator + EPSILON < self.dt:
+            return
+        if steps == max_steps and max_steps < self.max_steps:
+            # stopped by the limit of the caller, the ticks are still due
+            return
+        # catching up stopped early, by max_steps or the budget
+        dropped = int((self.accumulator + EPSILON) // self.dt)
+        self.dropped_ticks += dropped
+        self.accumulator = max(self.accumulator - dropped * self.dt, 0.0)
+
+    def run(self, ticks=None, realtime=True):
+        """Run until stopped, or until ticks ticks have been executed.
+
+        In real time, ticks are executed as real time passes, sleeping
+        in between. Otherwise ticks are executed back to back as fast as
+        possible, which is useful for headless simulation and tests.
+        """
+        for action, argument in self._loop(ticks, realtime):
+            if action == STEP:
+                self.step()
+            elif action == ADVANCE:
+                self.advance(*argument)
+            elif action == SLEEP:
+                self.sleep(argument)
+
+    def _loop(self, ticks, realtime):
+        # yields what run does next, with its argument
+        end = None if ticks is None else self.tick + ticks
+        self.running = True
+        if not realtime:
+            while self.running and (end is None or self.tick < end):
+                yield STEP, None
+                yield PAUSE, None
+            self.running = False
+            return
+        last = self.clock()
+        while self.running and (end is None or self.tick < end):
+            now = self.clock()
+            limit = None if end is None else end - self.tick
+            yield ADVANCE, (now - last, limit)
+            last = now
+            if end is not None and self.tick >= end:
+                break
+            remaining = self.dt - self.accumulator - (self.clock() - now)
+            if remaining > EPSILON:
+                yield SLEEP, remaining
+            else:
+                yield PAUSE, None
+        self.running = False
+
+    def stop(self):
+        """Stop running after the current tick.
+        """
+        self.running = False
+
+
+class AsyncRunner(Runner):
+    """Step a registry on a fixed timestep in an asyncio event loop.
+
+    This works like :class:`Runner`, but its methods are coroutines.
+    Ticks are executed with :meth:`Registry.execute_async` where the
+    executor has it, so I/O of async systems overlaps with the other
+    systems, and it sleeps with :func:`asyncio.sleep`, so other tasks
+    of the game, such as networking, run in between ticks.
+
+    :param sleep: coroutine function to sleep a number of seconds.
+    """
+    def __init__(self, executor, dt=1 / 60, max_steps=5, budget=None,
+                 on_overrun=None, clock=time.perf_counter,
+                 sleep=asyncio.sleep):
+        super().__init__(executor, dt, max_steps, budget, on_overrun,
+                         clock, sleep)
+
+    async def step(self):
+        """Execute a single tick.
+        """
+        start = self.clock()
+        update = Update(self.dt, self.time, self.tick)
+        execute_async = getattr(self.executor, 'execute_async', None)
+        if execute_async is None:
+            self.executor.execute(update)
+        else:
+            await execute_async(update)
+        self._stepped(start)
+
+    async def advance(self, elapsed, limit=None):
+        """Add elapsed real time and execute the ticks that are due.
+
+        See :meth:`Runner.advance`.
+        """
+        steps = 0
+        for due in self._catch_up(elapsed, limit):
+            await self.step()
+            steps += 1
+        return steps
+
+    async def run(self, ticks=None, realtime=True):
+        """Run until stopped, or until ticks ticks have been executed.
+
+        See :meth:`Runner.run`. When it doesn't sleep between ticks it
+        still gives other tasks a chance to run.
+        """
+        for action, argument in self._loop(ticks, realtime):
+            if action == STEP:
+                await self.step()
+            elif action == ADVANCE:
+                await self.advance(*argument)
+            elif action == SLEEP:
+                await self.sleep(argument)
+            else:
+                await asyncio.sleep(0)
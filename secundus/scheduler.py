@@ -0,0 +1,206 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+from functools import partial
+
+
+def dependencies(systems):
+    """Build the dependency DAG for a list of systems.
+
+    A system depends on every earlier system it conflicts with, so
+    conflicting systems keep their registration order.
+
+    Returns a list with for each system the set of indexes of the
+    systems it depends on.
+    """
+    result = []
+    for i, system in enumerate(systems):
+        result.append({j for j in range(i)
+                       if systems[j].conflicts(system)})
+    return result
+
+
+def stages(systems):
+    """Group systems into stages that can each run concurrently.
+
+    A system is placed in the stage after the last stage that contains
+    a system it depends on. Within a stage systems keep their
+    registration order.
+    """
+    levels = []
+    result = []
+    for depends_on in dependencies(systems):
+        level = max((levels[j] + 1 for j in depends_on), default=0)
+        levels.append(level)
+        if level == len(result):
+            result.append([])
+    for system, level in zip(systems, levels):
+        result[level].append(system)
+    return result
+
+
+class ExecutionPlan:
+    """The systems of a registry, resolved for execution.
+
+    The plan fixes the order of the systems, the tuple of component
+    containers passed to each, where commands are applied, and how the
+    systems are grouped into stages between sync points, so that none
+    of this has to be looked up while executing.
+
+    If fusion is enabled on the registry, adjacent systems that can be
+    fused are replaced by a single fused system in the steps and
+    segments, but not in :attr:`systems`.
+
+    A registry makes a new plan when systems, components or sync points
+    are registered after it was made.
+
+    :attr:`async_systems` are the systems that can only be executed with
+    :meth:`Registry.execute_async`.
+
+    :param registry: the :class:`Registry` to make a plan for.
+    """
+    def __init__(self, registry):
+        self.systems = tuple(registry.systems)
+        self.containers = tuple(
+            tuple(registry.component_containers(system.component_ids))
+            for system in self.systems)
+        self.sync_points = frozenset(registry.sync_points)
+        self.async_systems = tuple(
+            system for system in self.systems
+            if getattr(system, 'execute_async', None) is not None)
+        steps = [(system, containers, i in self.sync_points)
+                 for i, (system, containers) in enumerate(
+                     zip(self.systems, self.containers))]
+        if registry.fusion:
+            steps = fused(steps, registry.fusion_block_size)
+        self.steps = tuple(steps)
+        segments = []
+        segment = []
+        for system, containers, sync in self.steps:
+            segment.append((system, containers))
+            if sync:
+                segments.append(segment)
+                segment = []
+        if segment:
+            segments.append(segment)
+        self.segments = tuple(_staged(segment) for segment in segments)
+
+
+def _staged(segment):
+    containers = {id(system): containers for system, containers in segment}
+    return tuple(
+        tuple((system, containers[id(system)]) for system in stage)
+        for stage in stages([system for system, containers in segment]))
+
+
+def fused(steps, block_size=None):
+    """Fuse runs of adjacent steps that can be fused.
+
+    Systems can be fused when they have the same ``fusion_key``, which
+    is not ``None``, and there is no sync point between them; see
+    :class:`secundus.vectorized.FusedSystem`.
+
+    :param steps: a list of (system, containers, sync) tuples.
+    :param block_size: passed on to the fused systems.
+    """
+    groups = []
+    for system, containers, sync in steps:
+        fusion_key = getattr(system, 'fusion_key', None)
+        key = fusion_key() if fusion_key is not None else None
+        if (key is not None and groups and groups[-1][0] == key and
+                not groups[-1][3]):
+            groups[-1][1].append(system)
+            groups[-1][3] = sync
+        else:
+            groups.append([key, [system], containers, sync])
+    result = []
+    for key, systems, containers, sync in groups:
+        if len(systems) > 1:
+            system = systems[0].fuse(systems[1:], block_size)
+        else:
+            system, = systems
+        result.append((system, containers, sync))
+    return result
+
+
+def check_sync(plan):
+    """Raise TypeError if plan has async systems.
+
+    These can't be executed without an event loop, see
+    :meth:`Registry.execute_async`.
+    """
+    if plan.async_systems:
+        raise TypeError(
+            "Async systems can only be executed with "
+            "Registry.execute_async: %r" % (plan.async_systems,))
+
+
+class Scheduler:
+    """Execute the systems of a registry concurrently where possible.
+
+    Systems are grouped into stages using their read and write
+    declarations, see :meth:`System.conflicts`. The systems in a stage
+    run on a thread pool; NumPy and pandas release the GIL for much of
+    their work, so vectorized systems can use multiple cores.
+
+    Component containers are flushed on the calling thread before a
+    stage starts. Systems that run concurrently must not add or remove
+    components directly, but record these changes in the registry's
+    :class:`CommandBuffer`. Sync points of the registry are barriers:
+    stages never cross them, and the recorded commands are applied
+    there.
+
+    :param registry: the :class:`Registry` to execute.
+    :param max_workers: the size of the thread pool.
+    """
+    def __init__(self, registry, max_workers=None):
+        self.registry = registry
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+    def execute(self, update):
+        """Execute all systems, stage by stage.
+
+        Recorded commands are applied at sync points and at the end.
+        """
+        plan = self.registry.execution_plan()
+        check_sync(plan)
+        instrumentation = self.registry.instrumentation
+        if instrumentation is not None:
+            instrumentation.start_frame()
+        for segment in plan.segments:
+            self._execute_stages(update, segment)
+            self.registry.commands.apply()
+        if instrumentation is not None:
+            instrumentation.end_frame()
+
+    def _execute_stages(self, update, segment_stages):
+        registry = self.registry
+        instrumentation = registry.instrumentation
+        for stage in segment_stages:
+            if len(stage) == 1:
+                system, containers = stage[0]
+                if instrumentation is None:
+                    system.execute(update, registry, containers)
+                else:
+                    instrumentation.execute(system, update, registry,
+                                            containers)
+                continue
+            runs = []
+            for system, containers in stage:
+                if instrumentation is None:
+                    for container in containers:
+                        container.value()
+                    runs.append(system.execute)
+                else:
+                    runs.append(partial(
+                        instrumentation.execute, system,
+                        flush=instrumentation.flush(containers)))
+            futures = [
+                self.executor.submit(run, update, registry, containers)
+                for run, (system, containers) in zip(runs, stage)]
+            wait(futures)
+            for future in futures:
+                future.result()
+
+    def shutdown(self):
+        """Shut down the thread pool.
+        """
+        self.executor.shutdown()
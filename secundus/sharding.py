@@ -0,0 +1,210 @@
+import os
+import uuid
+from concurrent.futures import ProcessPoolExecutor, wait
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from .registry import ArrayContainer, System
+
+
+class SharedArrayContainer(ArrayContainer):
+    """Component container backed by a NumPy array in shared memory.
+
+    This works like :class:`ArrayContainer`, but the array lives in a
+    :class:`multiprocessing.shared_memory.SharedMemory` block, so worker
+    processes can attach to it and update components in place without
+    any pickling of component data.
+
+    Growing the array moves it to a new block with a new name. Call
+    :meth:`close` to release the shared memory when you are done.
+
+    :param dtype: the NumPy dtype of a single component. It cannot
+      contain Python objects.
+    :param capacity: the number of rows to preallocate.
+    """
+    def __init__(self, dtype, capacity=16):
+        if np.dtype(dtype).hasobject:
+            raise ValueError(
+                "Cannot put Python objects in shared memory: %r" % dtype)
+        self.uid = uuid.uuid4().hex
+        self.shm = None
+        super().__init__(dtype, capacity)
+
+    def _allocate(self, capacity):
+        self.shm = SharedMemory(create=True,
+                                size=max(capacity * self.dtype.itemsize, 1))
+        array = np.ndarray(capacity, dtype=self.dtype, buffer=self.shm.buf)
+        array[:] = np.zeros((), dtype=self.dtype)
+        return array
+
+    def _grow(self, needed):
+        old = self.shm
+        super()._grow(needed)
+        if self.shm is not old:
+            _release(old)
+
+    def _adopt(self, array):
+        # restored arrays have to be copied into shared memory
+        old = self.shm
+        adopted = self._allocate(max(len(array), 1))
+        adopted[:len(array)] = array
+        _release(old)
+        return adopted
+
+    def spec(self):
+        """Information a worker process needs to attach to the array.
+        """
+        if self.dtype.names is None:
+            dtype = self.dtype.str
+        else:
+            dtype = self.dtype.descr
+        return (self.uid, self.shm.name, dtype, len(self.array))
+
+    def close(self):
+        """Release the shared memory.
+        """
+        self.array = None
+        _release(self.shm)
+
+
+def _release(shm):
+    shm.unlink()
+    try:
+        shm.close()
+    except BufferError:
+        # views on the block are still around; it is unmapped once
+        # they are garbage collected
+        pass
+
+
+# shared memory blocks the current worker process is attached to,
+# by container uid
+_attached = {}
+
+
+def _attach(uid, name, dtype, capacity):
+    attached = _attached.get(uid)
+    if attached is not None and attached[0].name == name:
+        return attached[1]
+    if attached is not None:
+        # the container moved to a new block
+        _detach(uid)
+    # worker processes share the resource tracker of the main process,
+    # so attaching doesn't change who cleans up the block
+    shm = SharedMemory(name=name)
+    array = np.ndarray(capacity, dtype=np.dtype(dtype), buffer=shm.buf)
+    _attached[uid] = (shm, array)
+    return array
+
+
+def _detach(uid):
+    shm, array = _attached.pop(uid)
+    del array
+    try:
+        shm.close()
+    except BufferError:
+        # records passed to func are still around; the block is
+        # unmapped once they are garbage collected
+        pass
+
+
+def _exists(name):
+    try:
+        SharedMemory(name=name).close()
+    except FileNotFoundError:
+        return False
+    return True
+
+
+def _evict(in_use):
+    """Detach from the blocks of containers that were closed.
+
+    :param in_use: the uids of containers that are known to be open.
+    """
+    for uid, (shm, array) in list(_attached.items()):
+        if uid not in in_use and not _exists(shm.name):
+            _detach(uid)
+
+
+def _run_shard(func, update, entity_ids, specs, rows):
+    _evict({spec[0] for spec in specs})
+    arrays = [_attach(*spec) for spec in specs]
+    for i, entity_id in enumerate(entity_ids.tolist()):
+        func(update, entity_id,
+             *[array[container_rows[i]]
+               for array, container_rows in zip(arrays, rows)])
+
+
+class WorkerPool:
+    """A persistent pool of worker processes for sharded systems.
+
+    :param processes: the number of worker processes, by default the
+      number of CPUs.
+    """
+    def __init__(self, processes=None):
+        self.processes = processes or os.cpu_count() or 1
+        self.executor = ProcessPoolExecutor(max_workers=self.processes)
+
+    def shutdown(self):
+        """Shut down the worker processes.
+        """
+        self.executor.shutdown()
+
+
+class ShardedSystem(System):
+    def __init__(self, func, component_ids, pool, reads=None, writes=None):
+        """A system where individual items are updated in worker processes.
+
+        The entity ids tracked by this system are split into a shard for
+        each worker process in the pool. The workers attach to the
+        shared memory of the component containers and call func for each
+        entity in their shard, with the components as NumPy records
+        that write straight into shared memory.
+
+        All component containers must be :class:`SharedArrayContainer`
+        instances with a structured dtype, so that the records func gets
+        are views on shared memory. Only entity ids and row numbers are
+        sent to the workers, so func and update must be picklable, and
+        func has no access to the registry.
+
+        :param func: a function that takes the update, an entity id and
+          a component for each component id.
+        :param component_ids: the component ids that this system cares about.
+        :param pool: the :class:`WorkerPool` to run on.
+        """
+        super().__init__(func, component_ids, reads, writes)
+        self.pool = pool
+
+    def execute(self, update, registry, component_containers):
+        """Execute this system on the worker processes.
+        """
+        if not self.entity_ids:
+            return
+        for container in component_containers:
+            if container.dtype.names is None:
+                # items of a plain array are copies, writes would be lost
+                raise TypeError(
+                    "Sharded systems need containers with a structured "
+                    "dtype, not: %r" % container.dtype)
+            container.value()
+        entity_ids = np.fromiter(self.entity_ids, dtype=np.int64,
+                                 count=len(self.entity_ids))
+        specs = [container.spec() for container in component_containers]
+        futures = []
+        for shard in np.array_split(entity_ids, self.pool.processes):
+            if not len(shard):
+                continue
+            rows = [container.rows(shard)
+                    for container in component_containers]
+            futures.append(self.pool.executor.submit(
+                _run_shard, self.func, update, shard, specs, rows))
+        wait(futures)
+        for future in futures:
+            future.result()
+
+
+def sharded_item_system(func, component_ids, pool, reads=None, writes=None):
+    """A system where items are updated by a pool of worker processes.
+    """
+    return ShardedSystem(func, component_ids, pool, reads, writes)
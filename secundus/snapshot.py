@@ -0,0 +1,211 @@
+"""Compact binary snapshots of registries.
+
+A snapshot file starts with a magic string and the length of a JSON
+header. The header describes the registry and refers to data blocks
+that follow it. Each block is aligned, and NumPy arrays are written as
+their raw buffers, so they can be memory-mapped when the snapshot is
+restored. Python objects that cannot be stored as raw arrays are
+pickled.
+"""
+import json
+import mmap
+import os
+import pickle
+import struct
+from collections import deque
+
+import numpy as np
+from numpy.lib.format import dtype_to_descr, descr_to_dtype
+
+
+MAGIC = b'SECUNDUS'
+ALIGNMENT = 64
+
+
+class SnapshotWriter:
+    """Collect the header and data blocks of a snapshot.
+
+    Blocks are only written out by :meth:`write`, so arrays aren't
+    copied while the snapshot is made.
+    """
+    def __init__(self):
+        self.blocks = []
+        self.offset = 0
+
+    def _block(self, data, nbytes):
+        offset = self.offset
+        self.blocks.append((offset, data))
+        self.offset = _align(offset + nbytes)
+        return offset, nbytes
+
+    def array(self, array):
+        """Add an array as a block; returns a reference for the header.
+
+        Arrays of Python objects are pickled instead.
+        """
+        if array.dtype.hasobject:
+            return self.pickle(array)
+        array = np.ascontiguousarray(array)
+        offset, nbytes = self._block(array, array.nbytes)
+        return {'offset': offset, 'nbytes': nbytes,
+                'dtype': dtype_to_descr(array.dtype),
+                'shape': list(array.shape)}
+
+    def pickle(self, obj):
+        """Add a pickled object as a block; returns a reference.
+        """
+        data = pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL)
+        offset, nbytes = self._block(data, len(data))
+        return {'offset': offset, 'nbytes': nbytes, 'pickle': True}
+
+    def write(self, f, header):
+        """Write the header and all blocks to binary file f.
+        """
+        header = json.dumps(header).encode('utf-8')
+        start = _align(len(MAGIC) + 8 + len(header))
+        f.write(MAGIC)
+        f.write(struct.pack('<Q', len(header)))
+        f.write(header)
+        f.write(b'\0' * (start - len(MAGIC) - 8 - len(header)))
+        position = 0
+        for offset, data in self.blocks:
+            f.write(b'\0' * (offset - position))
+            f.write(memoryview(data.reshape(-1)).cast('B')
+                    if isinstance(data, np.ndarray) else data)
+            position = offset + (data.nbytes if isinstance(data, np.ndarray)
+                                 else len(data))
+
+
+class SnapshotReader:
+    """Read the header and data blocks of a snapshot.
+
+    :param f: a binary file object.
+    :param mmap: if true, arrays are memory-mapped copy-on-write instead
+      of read into memory. Changes to them don't affect the file.
+    """
+    def __init__(self, f, mmap=False):
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("Not a secundus snapshot")
+        length, = struct.unpack('<Q', f.read(8))
+        self.header = json.loads(f.read(length).decode('utf-8'))
+        self.start = _align(len(MAGIC) + 8 + length)
+        if mmap:
+            self.buffer = _map(f)
+        else:
+            f.seek(0)
+            self.buffer = bytearray(f.read())
+
+    def array(self, ref):
+        """Get the array for a reference made by the writer.
+        """
+        if ref.get('pickle'):
+            return self.pickle(ref)
+        dtype = descr_to_dtype(_descr(ref['dtype']))
+        count = int(np.prod(ref['shape'])) if ref['shape'] else 1
+        array = np.frombuffer(self.buffer, dtype=dtype, count=count,
+                              offset=self.start + ref['offset'])
+        return array.reshape(ref['shape'])
+
+    def pickle(self, ref):
+        """Get the object for a reference made by the writer.
+        """
+        start = self.start + ref['offset']
+        return pickle.loads(self.buffer[start:start + ref['nbytes']])
+
+
+def _map(f):
+    return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+
+def _align(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def _descr(descr):
+    # JSON turns the tuples of a structured dtype description into lists
+    if isinstance(descr, list):
+        return [tuple(_descr(part) for part in field) for field in descr]
+    return descr
+
+
+def save_snapshot(registry, f):
+    """Write a snapshot of registry to f, a path or binary file.
+    """
+    if isinstance(f, (str, os.PathLike)):
+        with open(f, 'wb') as opened:
+            return save_snapshot(registry, opened)
+    writer = SnapshotWriter()
+    entity_ids = np.fromiter(registry.entity_masks.keys(), dtype=np.int64,
+                             count=len(registry.entity_masks))
+    if len(registry.component_bits) <= 64:
+        masks = writer.array(np.fromiter(
+            registry.entity_masks.values(), dtype=np.uint64,
+            count=len(registry.entity_masks)))
+    else:
+        masks = writer.pickle(list(registry.entity_masks.values()))
+    header = {
+        'entity_id_counter': registry.entity_id_counter,
+        'generations': writer.array(np.array(
+            list(registry.generations.items()),
+            dtype=np.int64).reshape(-1, 2)),
+        'free_indexes': writer.array(np.array(
+            registry.free_indexes, dtype=np.int64)),
+        'version': registry.version,
+        'component_versions': [
+            [component_id, version]
+            for component_id, version in registry.component_versions.items()],
+        'entity_ids': writer.array(entity_ids),
+        'entity_masks': masks,
+        'components': [
+            [component_id, container.snapshot(writer)]
+            for component_id, container in registry.components.items()],
+        'systems': [
+            writer.array(np.fromiter(system.entity_ids, dtype=np.int64,
+                                     count=len(system.entity_ids)))
+            for system in registry.systems],
+    }
+    writer.write(f, header)
+
+
+def load_snapshot(registry, f, mmap=False):
+    """Restore registry from a snapshot in f, a path or binary file.
+
+    The registry must have the same components and systems registered,
+    in the same order, as the registry the snapshot was made of.
+    """
+    if isinstance(f, (str, os.PathLike)):
+        with open(f, 'rb') as opened:
+            return load_snapshot(registry, opened, mmap)
+    reader = SnapshotReader(f, mmap)
+    header = reader.header
+    component_ids = [component_id
+                     for component_id, state in header['components']]
+    if component_ids != list(registry.components):
+        raise ValueError(
+            "Snapshot has components %r, registry has %r" % (
+                component_ids, list(registry.components)))
+    if len(header['systems']) != len(registry.systems):
+        raise ValueError(
+            "Snapshot has %s systems, registry has %s" % (
+                len(header['systems']), len(registry.systems)))
+    for component_id, state in header['components']:
+        registry.components[component_id].restore(reader, state)
+    registry.entity_id_counter = header['entity_id_counter']
+    registry.generations = {
+        index: generation for index, generation in
+        reader.array(header['generations']).tolist()}
+    registry.free_indexes = deque(
+        reader.array(header['free_indexes']).tolist())
+    registry.version = header['version']
+    registry.component_versions.update(header['component_versions'])
+    entity_ids = reader.array(header['entity_ids']).tolist()
+    masks = reader.array(header['entity_masks'])
+    if isinstance(masks, np.ndarray):
+        masks = masks.tolist()
+    registry.entity_masks = dict(zip(entity_ids, masks))
+    for system, ref in zip(registry.systems, header['systems']):
+        system.reset(reader.array(ref))
+    for component_id, indexes in registry.component_to_indexes.items():
+        for index in indexes:
+            index.reset(registry.matching([component_id]))
+    registry.commands.commands = []
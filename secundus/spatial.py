@@ -0,0 +1,256 @@
+from itertools import product
+
+import numpy as np
+import pandas as pd
+
+
+class GridIndex:
+    """A spatial index over a component, as a uniform grid of cells.
+
+    Attach it to a component, typically ``'position'``, with
+    :meth:`Registry.add_index`. The registry reports entities that get,
+    change or lose the component, including changes made through
+    :meth:`Registry.mark_changed_many` and column writes in vectorized
+    systems. Changed entities are only looked up again when the index is
+    next queried, in one batch, and only entities that move to another
+    cell update the grid.
+
+    Queries return NumPy arrays of entity ids.
+
+    :param cell_size: the size of a grid cell. Queries are cheapest when
+      it is about the radius of typical queries.
+    :param fields: the names of the coordinate fields of the component,
+      one for each dimension.
+    """
+    def __init__(self, cell_size, fields=('x', 'y')):
+        self.cell_size = float(cell_size)
+        self.fields = list(fields)
+        self.container = None
+        self.clear()
+
+    def clear(self):
+        """Remove all entities from the index."""
+        dimensions = len(self.fields)
+        self.entity_ids = np.zeros(16, dtype=np.int64)
+        self.points = np.zeros((16, dimensions))
+        self.cells = np.zeros((16, dimensions), dtype=np.int64)
+        self.rows = {}
+        self.buckets = {}
+        self.size = 0
+        self.pending = set()
+        self.pending_arrays = []
+
+    def attach(self, container):
+        """Read coordinates from container from now on."""
+        self.container = container
+
+    def reset(self, entity_ids):
+        """Index exactly entity_ids, as when restoring a snapshot."""
+        self.clear()
+        self.changed_many(entity_ids)
+
+    def changed(self, entity_id):
+        """Record that entity_id got or changed the component."""
+        self.pending.add(entity_id)
+
+    def changed_many(self, entity_ids):
+        """Record that many entities got or changed the component."""
+        if isinstance(entity_ids, np.ndarray):
+            self.pending_arrays.append(entity_ids)
+        else:
+            self.pending.update(entity_ids)
+
+    def remove(self, entity_id):
+        """Remove entity_id from the index."""
+        self.pending.discard(entity_id)
+        row = self.rows.pop(entity_id, None)
+        if row is None:
+            return
+        self._discard(entity_id, tuple(self.cells[row].tolist()))
+        last = self.size - 1
+        if row != last:
+            moved = int(self.entity_ids[last])
+            self.entity_ids[row] = moved
+            self.points[row] = self.points[last]
+            self.cells[row] = self.cells[last]
+            self.rows[moved] = row
+        self.size = last
+
+    def _discard(self, entity_id, cell):
+        bucket = self.buckets[cell]
+        bucket.discard(entity_id)
+        if not bucket:
+            del self.buckets[cell]
+
+    def _pending_ids(self):
+        arrays = self.pending_arrays
+        if self.pending:
+            arrays.append(np.fromiter(self.pending, dtype=np.int64,
+                                      count=len(self.pending)))
+        entity_ids = np.unique(np.concatenate(arrays))
+        self.pending = set()
+        self.pending_arrays = []
+        # entities removed since they were changed in bulk
+        present = np.fromiter(
+            (entity_id in self.container
+             for entity_id in entity_ids.tolist()),
+            dtype=bool, count=len(entity_ids))
+        return entity_ids[present]
+
+    def refresh(self):
+        """Bring the index up to date with the changes recorded.
+
+        Queries do this automatically.
+        """
+        if not (self.pending or self.pending_arrays):
+            return
+        entity_ids = self._pending_ids()
+        if not len(entity_ids):
+            return
+        points = _read(self.container, entity_ids, self.fields)
+        cells = np.floor(points / self.cell_size).astype(np.int64)
+        rows = np.fromiter(
+            (self.rows.get(entity_id, -1)
+             for entity_id in entity_ids.tolist()),
+            dtype=np.intp, count=len(entity_ids))
+        new = rows < 0
+        count = int(new.sum())
+        self._grow(self.size + count)
+        rows[new] = np.arange(self.size, self.size + count)
+        self.rows.update(zip(entity_ids[new].tolist(), rows[new].tolist()))
+        self.entity_ids[rows[new]] = entity_ids[new]
+        self.size += count
+        moved = new | (self.cells[rows] != cells).any(axis=1)
+        for entity_id, row, is_new, cell in zip(
+                entity_ids[moved].tolist(), rows[moved].tolist(),
+                new[moved].tolist(), cells[moved].tolist()):
+            if not is_new:
+                self._discard(entity_id, tuple(self.cells[row].tolist()))
+            self.buckets.setdefault(tuple(cell), set()).add(entity_id)
+        self.points[rows] = points
+        self.cells[rows] = cells
+
+    def _grow(self, needed):
+        capacity = len(self.entity_ids)
+        if needed <= capacity:
+            return
+        while capacity < needed:
+            capacity *= 2
+        for name in ['entity_ids', 'points', 'cells']:
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def __len__(self):
+        self.refresh()
+        return self.size
+
+    def _candidates(self, cells):
+        entity_ids = [entity_id for cell in cells
+                      for entity_id in self.buckets.get(cell, ())]
+        entity_ids = np.array(entity_ids, dtype=np.int64)
+        rows = np.fromiter((self.rows[entity_id]
+                            for entity_id in entity_ids.tolist()),
+                           dtype=np.intp, count=len(entity_ids))
+        return entity_ids, self.points[rows]
+
+    def _cell_range(self, lower, upper):
+        low = np.floor(np.asarray(lower) / self.cell_size).astype(np.int64)
+        high = np.floor(np.asarray(upper) / self.cell_size).astype(np.int64)
+        count = np.prod(high - low + 1)
+        if count > len(self.buckets):
+            # cheaper to look at the occupied cells
+            return [cell for cell in self.buckets
+                    if all(l <= c <= h
+                           for l, c, h in zip(low.tolist(), cell,
+                                              high.tolist()))]
+        return list(product(*[range(l, h + 1)
+                              for l, h in zip(low.tolist(),
+                                              high.tolist())]))
+
+    def in_box(self, lower, upper):
+        """Get the entities inside a box.
+
+        :param lower: the lowest coordinates of the box.
+        :param upper: the highest coordinates of the box, inclusive.
+        """
+        self.refresh()
+        entity_ids, points = self._candidates(self._cell_range(lower, upper))
+        inside = ((points >= lower) & (points <= upper)).all(axis=1)
+        return entity_ids[inside]
+
+    def within(self, points, radius):
+        """Get the entities within radius of each of a number of points.
+
+        Returns a list with an array of entity ids for each point.
+        """
+        self.refresh()
+        result = []
+        for point in np.atleast_2d(np.asarray(points, dtype=float)):
+            entity_ids, candidates = self._candidates(
+                self._cell_range(point - radius, point + radius))
+            distances = ((candidates - point) ** 2).sum(axis=1)
+            result.append(entity_ids[distances <= radius * radius])
+        return result
+
+    def neighbors(self, entity_ids, radius):
+        """Get the other entities within radius of each of entity_ids.
+
+        Returns a list with an array of entity ids for each entity id.
+        """
+        self.refresh()
+        entity_ids = np.asarray(entity_ids, dtype=np.int64)
+        rows = np.fromiter((self.rows[entity_id]
+                            for entity_id in entity_ids.tolist()),
+                           dtype=np.intp, count=len(entity_ids))
+        return [found[found != entity_id] for entity_id, found in zip(
+            entity_ids.tolist(), self.within(self.points[rows], radius))]
+
+    def pairs(self, radius):
+        """Get all pairs of entities within radius of each other.
+
+        Returns an array with a row of two entity ids for each pair, the
+        smallest entity id first. This is what collision systems need.
+        """
+        self.refresh()
+        reach = int(np.ceil(radius / self.cell_size))
+        offsets = [offset for offset in product(range(-reach, reach + 1),
+                                                repeat=len(self.fields))
+                   if offset > (0,) * len(self.fields)]
+        found = [np.zeros((0, 2), dtype=np.int64)]
+        for cell in self.buckets:
+            entity_ids, points = self._candidates([cell])
+            others, other_points = self._candidates(
+                [tuple(c + o for c, o in zip(cell, offset))
+                 for offset in offsets])
+            # pairs within the cell once, and with forward cells
+            first, second = np.triu_indices(len(entity_ids), 1)
+            found.append(_close(entity_ids[first], points[first],
+                                entity_ids[second], points[second], radius))
+            if not len(others):
+                continue
+            first, second = np.divmod(
+                np.arange(len(entity_ids) * len(others)), len(others))
+            found.append(_close(entity_ids[first], points[first],
+                                others[second], other_points[second],
+                                radius))
+        pairs = np.concatenate(found)
+        return np.sort(pairs, axis=1)
+
+
+def _close(a, a_points, b, b_points, radius):
+    distances = ((a_points - b_points) ** 2).sum(axis=1)
+    close = distances <= radius * radius
+    return np.column_stack([a[close], b[close]])
+
+
+def _read(container, entity_ids, fields):
+    values = container.value()
+    if isinstance(values, pd.DataFrame):
+        return values.loc[entity_ids, fields].to_numpy(dtype=float)
+    if isinstance(values, np.ndarray) and values.dtype.names is not None:
+        rows = container.rows(entity_ids)
+        return np.column_stack([values[field][rows] for field in fields])
+    return np.array([[container[entity_id][field] for field in fields]
+                     for entity_id in entity_ids.tolist()], dtype=float)
@@ -0,0 +1,189 @@
+import numpy as np
+import pytest
+from secundus.archetype import (
+    ArchetypeRegistry, ArchetypeSystem, archetype_item_system)
+from secundus.registry import (
+    ArrayContainer, DictContainer, DataFrameContainer)
+
+
+def test_archetype_registry_chunks():
+    r = ArchetypeRegistry()
+    r.register_component('position', [('x', 'i8')])
+    r.register_component('velocity', [('speed', 'i8')])
+    r.register_component('frozen')
+
+    chunks = []
+
+    def update_position(update, r, entity_ids, positions, velocities):
+        assert update == 'update'
+        chunks.append(sorted(entity_ids.tolist()))
+        positions['x'] += velocities['speed']
+
+    r.register_system(ArchetypeSystem(update_position,
+                                      ['position', 'velocity']))
+
+    r.add_components(1, position={'x': 10}, velocity={'speed': 1})
+    r.add_components(2, position={'x': 20}, velocity={'speed': 5})
+    r.add_components(3, position={'x': 40})
+    r.add_components(4, velocity={'speed': 10})
+    r.add_components(5, position={'x': 0}, velocity={'speed': 2},
+                     frozen=True)
+
+    r.execute('update')
+
+    assert sorted(chunks) == [[1, 2], [5]]
+    assert r.get(1, 'position')['x'] == 11
+    assert r.get(2, 'position')['x'] == 25
+    assert r.get(3, 'position')['x'] == 40
+    assert r.get(5, 'position')['x'] == 2
+    assert r.get(5, 'frozen') is True
+
+
+def test_archetype_registry_move():
+    r = ArchetypeRegistry()
+    r.register_component('position', [('x', 'i8')])
+    r.register_component('velocity', [('speed', 'i8')])
+
+    seen = []
+
+    def update_position(update, r, entity_id, position, velocity):
+        seen.append(entity_id)
+        position['x'] += velocity['speed']
+
+    r.register_system(archetype_item_system(update_position,
+                                            ['position', 'velocity']))
+
+    e0 = r.add_entity(position={'x': 10})
+    e1 = r.add_entity(position={'x': 20})
+    assert r.has_components(e0, ['position'])
+    assert not r.has_components(e0, ['position', 'velocity'])
+
+    r.add_component(e0, 'velocity', {'speed': 3})
+    assert r.has_components(e0, ['position', 'velocity'])
+
+    r.execute('update')
+    assert seen == [e0]
+    assert r.get(e0, 'position')['x'] == 13
+    assert r.get(e1, 'position')['x'] == 20
+
+    r.remove_component(e0, 'velocity')
+    with pytest.raises(KeyError):
+        r.get(e0, 'velocity')
+    assert r.get(e0, 'position')['x'] == 13
+
+    r.remove_component(e0, 'position')
+    with pytest.raises(KeyError):
+        r.get(e0, 'position')
+    with pytest.raises(KeyError):
+        r.remove_component(e0, 'position')
+
+    seen.clear()
+    r.execute('update')
+    assert seen == []
+
+
+def test_archetype_registry_late_system():
+    r = ArchetypeRegistry()
+    r.register_component('position')
+
+    r.add_entity(position={'x': 1})
+
+    seen = []
+
+    def update(update, r, entity_ids, positions):
+        seen.extend(positions)
+
+    r.register_system(ArchetypeSystem(update, ['position']))
+    r.execute('update')
+    assert seen == [{'x': 1}]
+
+
+def test_archetype_registry_add_entities():
+    r = ArchetypeRegistry()
+    r.register_component('position', [('x', 'i8')])
+    r.register_component('name')
+
+    chunks = []
+
+    def update(update, r, entity_ids, positions, names):
+        chunks.append((entity_ids.tolist(), list(names)))
+
+    r.register_system(ArchetypeSystem(update, ['position', 'name']))
+    entity_ids = r.add_entities(3, position={'x': np.arange(3)},
+                                name=['a', 'b', 'c'])
+    assert entity_ids.tolist() == [0, 1, 2]
+    assert r.get(2, 'position')['x'] == 2
+    assert r.get(1, 'name') == 'b'
+    with pytest.raises(ValueError):
+        r.add_entities(2, name=['a'])
+
+    r.execute(None)
+    assert chunks == [([0, 1, 2], ['a', 'b', 'c'])]
+
+
+def test_archetype_registry_remove_entity():
+    r = ArchetypeRegistry()
+    r.register_component('position', [('x', 'i8')])
+    r.register_component('velocity', [('speed', 'i8')])
+    e0 = r.add_entity(position={'x': 1}, velocity={'speed': 1})
+    e1 = r.add_entity(position={'x': 2})
+    e2 = r.add_entity(position={'x': 3}, velocity={'speed': 3})
+
+    r.remove_entity(e0)
+    assert not r.has_components(e0, ['position'])
+    with pytest.raises(KeyError):
+        r.get(e0, 'position')
+    assert r.get(e2, 'position')['x'] == 3
+    with pytest.raises(KeyError):
+        r.remove_entity(100)
+
+    r.remove_entities([e1, e2])
+    for entity_id in [e1, e2]:
+        with pytest.raises(KeyError):
+            r.get(entity_id, 'position')
+    assert all(not len(archetype) for archetype in r.archetypes.values())
+
+
+def test_archetype_registry_commands():
+    r = ArchetypeRegistry()
+    r.register_component('position', [('x', 'i8')])
+    r.register_component('marker')
+
+    def spawn(update, r, entity_ids, positions):
+        for entity_id in entity_ids.tolist():
+            r.commands.add_component(entity_id, 'marker', True)
+            if entity_id == 0:
+                r.commands.despawn(entity_id)
+        r.commands.spawn(position={'x': 10})
+
+    seen = []
+
+    def marked(update, r, entity_ids, markers):
+        seen.append(sorted(entity_ids.tolist()))
+
+    r.register_system(ArchetypeSystem(spawn, ['position']))
+    r.add_sync_point()
+    r.register_system(ArchetypeSystem(marked, ['marker']))
+    r.add_entity(position={'x': 0})
+    r.add_entity(position={'x': 1})
+    instrumentation = r.instrument()
+
+    r.execute(None)
+    # the commands were applied at the sync point
+    assert seen == [[1]]
+    with pytest.raises(KeyError):
+        r.get(0, 'position')
+    assert r.get(2, 'position')['x'] == 10
+    assert r.get(1, 'marker') is True
+    assert instrumentation.frame_stats()['count'] == 1
+
+
+def test_archetype_registry_containers():
+    r = ArchetypeRegistry()
+    r.register_component('position', ArrayContainer([('x', 'i8')]))
+    r.register_component('name', DictContainer())
+    e = r.add_entity(position={'x': 1}, name='one')
+    assert r.get(e, 'position')['x'] == 1
+    assert r.get(e, 'name') == 'one'
+    with pytest.raises(TypeError):
+        r.register_component('size', DataFrameContainer())
@@ -0,0 +1,41 @@
+import json
+
+from secundus import benchmark
+
+
+def test_run():
+    results = benchmark.run(entities=20, repeat=1)
+    assert results['meta']['entities'] == 20
+    keys = set(results['results'])
+    for container in benchmark.CONTAINERS:
+        for name in ['spawn', 'despawn', 'system', 'entity_ids_system',
+                     'item_system', 'memory_per_entity']:
+            assert container + '/' + name in keys
+    assert all(value >= 0 for value in results['results'].values())
+
+
+def test_compare():
+    baseline = {'results': {'dict/spawn': 1.0, 'dict/despawn': 1.0}}
+    current = {'results': {'dict/spawn': 1.05, 'dict/despawn': 1.5,
+                           'array/spawn': 10.0}}
+    assert benchmark.compare(baseline, current, 0.1) == [
+        ('dict/despawn', 1.0, 1.5)]
+
+
+def test_main_compare(tmpdir, capsys):
+    baseline = tmpdir.join('baseline.json')
+    assert benchmark.main(['--entities', '10', '--repeat', '1',
+                           '--container', 'array',
+                           '--output', str(baseline)]) == 0
+    saved = json.loads(baseline.read())
+    assert sorted(saved['results']) == [
+        'array/despawn', 'array/entity_ids_system', 'array/item_system',
+        'array/memory_per_entity', 'array/spawn', 'array/system']
+
+    for key in saved['results']:
+        saved['results'][key] = 0.0
+    baseline.write(json.dumps(saved))
+    assert benchmark.main(['--entities', '10', '--repeat', '1',
+                           '--container', 'array',
+                           '--compare', str(baseline)]) == 1
+    assert 'REGRESSION array/spawn' in capsys.readouterr().err
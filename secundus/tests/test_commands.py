@@ -0,0 +1,122 @@
+import pytest
+
+from secundus.registry import (
+    Registry, System, ArrayContainer, DataFrameContainer)
+from secundus.scheduler import Scheduler
+
+
+def test_command_buffer_apply():
+    r = Registry()
+    r.register_component('position', ArrayContainer([('x', 'f8')]))
+    r.register_component('size', DataFrameContainer())
+    r.register_component('debris')
+
+    s = System(lambda update, r, entity_ids, p, d: None,
+               ['position', 'debris'])
+    r.register_system(s)
+
+    e0 = r.add_entity(position={'x': 0.0}, size={'s': 1})
+
+    c = r.commands
+    e1 = c.spawn(position={'x': 1.0}, debris=True)
+    e2 = c.spawn(position={'x': 2.0}, size={'s': 2})
+    e3 = c.spawn(position={'x': 3.0}, debris=True)
+    c.add_component(e1, 'size', {'s': 10})
+    c.remove_component(e0, 'size')
+    c.despawn(e2)
+    more = c.spawn_many(2, position=[{'x': 4.0}, {'x': 5.0}],
+                        debris=[True, False])
+
+    assert (e1, e2, e3) == (1, 2, 3)
+    assert more.tolist() == [4, 5]
+    assert len(c) == 7
+    with pytest.raises(KeyError):
+        r.get(e1, 'position')
+    assert s.entity_ids == set()
+
+    c.apply()
+
+    assert len(c) == 0
+    assert s.entity_ids == set([e1, e3, 4, 5])
+    assert r.get(e1, 'size')['s'] == 10
+    assert r.get(e3, 'position')['x'] == 3.0
+    assert not r.has_components(e0, ['size'])
+    assert e2 not in r.entity_masks
+    with pytest.raises(KeyError):
+        r.get(e2, 'position')
+
+
+def test_registry_sync_points():
+    r = Registry()
+    r.register_component('position')
+    r.register_component('bullet')
+
+    seen = []
+
+    def fire(update, r, entity_ids, positions):
+        for entity_id in list(entity_ids):
+            r.commands.spawn(bullet={'x': positions[entity_id]['x']})
+
+    def count(update, r, entity_ids, bullets):
+        seen.append(len(entity_ids))
+
+    r.register_system(System(fire, ['position'], writes=['bullet']))
+    r.register_system(System(count, ['bullet'], writes=[]))
+
+    r.add_entity(position={'x': 0})
+
+    # without a sync point the bullet is only there at the next execution
+    r.execute('update')
+    assert seen == [0]
+    r.execute('update')
+    assert seen == [0, 1]
+
+    r2 = Registry()
+    r2.register_component('position')
+    r2.register_component('bullet')
+    r2.register_system(System(fire, ['position'], writes=['bullet']))
+    r2.add_sync_point()
+    r2.register_system(System(count, ['bullet'], writes=[]))
+    r2.add_entity(position={'x': 0})
+
+    seen[:] = []
+    r2.execute('update')
+    assert seen == [1]
+
+    scheduler = Scheduler(r2)
+    try:
+        scheduler.execute('update')
+    finally:
+        scheduler.shutdown()
+    assert seen == [1, 2]
+
+
+def test_command_buffer_despawned_in_same_frame():
+    r = Registry()
+    r.register_component('position')
+    r.register_component('tag')
+
+    e = r.add_entity(position={'x': 0}, tag=1)
+    f = r.add_entity(position={'x': 1})
+
+    c = r.commands
+    c.despawn(e)
+    c.remove_component(e, 'tag')
+    c.add_component(e, 'tag', 2)
+    c.remove_component(f, 'tag')
+    c.add_component(f, 'tag', 3)
+
+    c.apply()
+
+    assert len(c) == 0
+    assert not r.has_entity(e)
+    assert e not in r.entity_masks
+    assert r.get(f, 'tag') == 3
+
+    # a stale entity id in a later frame is skipped as well
+    c.add_component(e, 'tag', 4)
+    c.add_component(f, 'position', {'x': 2})
+    c.apply()
+
+    assert e not in r.entity_masks
+    assert r.get(f, 'position') == {'x': 2}
@@ -0,0 +1,115 @@
+import io
+import json
+import threading
+
+from secundus.registry import (
+    Registry, System, DataFrameContainer, item_system)
+from secundus.scheduler import Scheduler
+
+
+def spawn(update, r, entity_ids, positions):
+    for entity_id in list(entity_ids):
+        r.add_component(entity_id, 'marker', True)
+
+
+def move(update, r, entity_id, marker):
+    assert marker
+
+
+def make_registry():
+    r = Registry()
+    r.register_component('position', DataFrameContainer())
+    r.register_component('marker')
+    r.register_system(System(spawn, ['position']))
+    r.register_system(item_system(move, ['marker']))
+    r.add_entity(position={'x': 0})
+    r.add_entity(position={'x': 1})
+    return r
+
+
+def test_instrumentation_stats():
+    r = make_registry()
+    seen = []
+    instrumentation = r.instrument(window=2)
+    instrumentation.add_hook(seen.append)
+
+    r.execute('update')
+    r.execute('update')
+    r.execute('update')
+
+    assert [record.name for record in seen] == ['spawn', 'move'] * 3
+    assert [record.frame for record in seen] == [0, 0, 1, 1, 2, 2]
+    assert seen[0].changes == 2
+    assert seen[2].changes == 0
+    assert seen[0].flush > 0
+
+    stats = instrumentation.stats()
+    assert sorted(stats) == ['move', 'spawn']
+    assert stats['spawn']['count'] == 2
+    assert stats['spawn']['entities'] == 2
+    assert stats['spawn']['changes_mean'] == 0
+    assert stats['move']['wall_max'] >= stats['move']['wall_mean'] > 0
+    assert instrumentation.frame_stats()['count'] == 2
+
+    r.uninstrument()
+    r.execute('update')
+    assert len(seen) == 6
+
+
+def test_instrumentation_chrome_trace():
+    r = make_registry()
+    instrumentation = r.instrument()
+    scheduler = Scheduler(r)
+    try:
+        scheduler.execute('update')
+    finally:
+        scheduler.shutdown()
+
+    f = io.StringIO()
+    instrumentation.export_chrome_trace(f)
+    trace = json.loads(f.getvalue())
+    events = trace['traceEvents']
+    assert [event['name'] for event in events] == ['spawn', 'move']
+    assert events[0]['ph'] == 'X'
+    assert events[0]['args']['entities'] == 2
+    assert events[1]['ts'] >= events[0]['ts'] + events[0]['dur']
+
+
+def test_instrumentation_concurrent_changes():
+    r = Registry()
+    r.register_component('position', DataFrameContainer())
+    r.register_component('marker')
+    barrier = threading.Barrier(2, timeout=5)
+
+    def mark(update, r, entity_ids, positions):
+        barrier.wait()
+        for entity_id in list(entity_ids):
+            r.add_component(entity_id, 'marker', True)
+        barrier.wait()
+
+    def wait(update, r, entity_ids, positions):
+        # runs while mark makes its changes
+        barrier.wait()
+        barrier.wait()
+
+    r.register_system(System(mark, ['position'], writes=['marker']))
+    r.register_system(System(wait, ['position'], writes=[]))
+    for x in range(3):
+        r.add_entity(position={'x': x})
+
+    seen = []
+    instrumentation = r.instrument()
+    instrumentation.add_hook(seen.append)
+    scheduler = Scheduler(r)
+    try:
+        scheduler.execute('update')
+    finally:
+        scheduler.shutdown()
+
+    records = {record.name.split('.')[-1]: record for record in seen}
+    assert records['mark'].changes == 3
+    assert records['wait'].changes == 0
+    # the pending rows were flushed before the stage, and that is
+    # reported separately from the time of the function
+    assert records['mark'].flush > 0
+    assert records['mark'].wall > 0
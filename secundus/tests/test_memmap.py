@@ -0,0 +1,75 @@
+import os
+
+import numpy as np
+import pytest
+
+from secundus.memmap import MemmapContainer
+from secundus.registry import Registry, item_system
+from secundus.vectorized import vectorized_system
+
+
+def test_memmap_container_buffered(tmp_path):
+    c = MemmapContainer([('x', 'f8'), ('y', 'f8')], str(tmp_path),
+                        capacity=2)
+    try:
+        c[1] = {'x': 1.0, 'y': 1.5}
+        c.add_many([2, 3, 4], {'x': np.array([2.0, 3.0, 4.0]),
+                               'y': np.zeros(3)})
+        assert 3 in c
+        assert c.size == 0
+        del c[3]
+        assert 3 not in c
+        assert len(c) == 3
+        assert isinstance(c.value(), np.ndarray)
+        assert sorted(c.value()['x'].tolist()) == [1.0, 2.0, 4.0]
+
+        c[5] = {'x': 5.0, 'y': 0.0}
+        del c[1]
+        assert 1 not in c
+        assert 5 in c
+        assert c.size == 3
+        assert sorted(c) == [2, 4, 5]
+        assert c[5]['x'] == 5.0
+
+        # writes to the view go to the file
+        c.value()['y'] = 7.0
+        c.flush()
+        on_disk = np.memmap(c.path, dtype=c.dtype, mode='r')
+        assert on_disk['y'][:3].tolist() == [7.0, 7.0, 7.0]
+    finally:
+        c.close()
+    assert tmp_path.exists()
+
+
+def test_memmap_container_no_objects():
+    with pytest.raises(ValueError):
+        MemmapContainer(object)
+
+
+def test_memmap_container_systems():
+    dtype = [('x', 'f8')]
+    r = Registry()
+    r.register_component('position', MemmapContainer(dtype))
+    r.register_component('velocity', MemmapContainer(dtype))
+
+    def integrate(update, r, entity_ids, positions, velocities):
+        positions['x'] += velocities['x']
+
+    def double(update, r, entity_id, position, velocity):
+        velocity['x'] *= 2
+
+    r.register_system(vectorized_system(integrate,
+                                        ['position', 'velocity']))
+    r.register_system(item_system(double, ['position', 'velocity']))
+    r.add_entities(100, position={'x': np.zeros(100)},
+                   velocity={'x': np.ones(100)})
+    r.execute(None)
+    r.add_entity(position={'x': 0.0}, velocity={'x': 1.0})
+    r.execute(None)
+    assert r.get(0, 'position')['x'] == 3.0
+    assert r.get(100, 'position')['x'] == 1.0
+    assert r.get(100, 'velocity')['x'] == 2.0
+    directory = r.components['position'].directory
+    for container in r.components.values():
+        container.close()
+    assert not os.path.exists(directory)
@@ -1,7 +1,12 @@
+import asyncio
+
+import numpy as np
+import pandas as pd
 import pytest
 from secundus.registry import (
-    Registry, System, entity_ids_system, item_system,
-    DataFrameContainer)
+    Registry, System, entity_ids_system, item_system, async_system,
+    DataFrameContainer, ArrayContainer, SparseSetContainer, ChangedSystem,
+    Query, pack_entity_id, entity_index, entity_generation)
 
 
 def test_registry_system_dict_container():
@@ -449,3 +454,714 @@ def test_registry_collision_df():
 
 #     assert r.get(1, 'position').x == 11
 #     assert r.get(2, 'position').x == 25
+
+
+def test_array_container():
+    c = ArrayContainer([('x', 'f8'), ('y', 'f8')], capacity=2)
+
+    c[10] = {'x': 1.0, 'y': 2.0}
+    c[11] = (3.0, 4.0)
+    c[12] = {'x': 5.0, 'y': 6.0}
+
+    assert len(c) == 3
+    assert 11 in c
+    assert list(c) == [10, 11, 12]
+    assert c[11]['x'] == 3.0
+    assert c.value()['y'].tolist() == [2.0, 4.0, 6.0]
+
+    del c[10]
+
+    # last row was moved into the hole
+    assert 10 not in c
+    assert list(c) == [12, 11]
+    assert c.keys().tolist() == [12, 11]
+    assert c.value()['x'].tolist() == [5.0, 3.0]
+    assert c[12]['y'] == 6.0
+
+    with pytest.raises(KeyError):
+        del c[10]
+
+
+def test_array_container_value_is_view():
+    c = ArrayContainer([('x', 'f8')])
+    c[1] = {'x': 1.0}
+    c[2] = {'x': 2.0}
+
+    c.value()['x'] += 10.0
+
+    assert c[1]['x'] == 11.0
+    assert c[2]['x'] == 12.0
+
+
+def test_registry_system_array():
+    r = Registry()
+    dtype = [('x', 'i8')]
+    r.register_component('position', ArrayContainer(dtype))
+    r.register_component('velocity', ArrayContainer([('speed', 'i8')]))
+
+    def update_position(update, r, entity_ids, positions, velocities):
+        position_container = r.components['position']
+        velocity_container = r.components['velocity']
+        for entity_id in entity_ids:
+            p = position_container.index[entity_id]
+            v = velocity_container.index[entity_id]
+            positions['x'][p] += velocities['speed'][v]
+
+    r.register_system(System(update_position, ['position', 'velocity']))
+
+    r.add_component(1, 'position', {'x': 10})
+    r.add_component(2, 'position', {'x': 20})
+    r.add_component(3, 'position', {'x': 40})
+
+    r.add_component(1, 'velocity', {'speed': 1})
+    r.add_component(2, 'velocity', {'speed': 5})
+    r.add_component(4, 'velocity', {'speed': 10})
+
+    r.execute('update')
+
+    assert r.get(1, 'position')['x'] == 11
+    assert r.get(2, 'position')['x'] == 25
+    assert r.get(3, 'position')['x'] == 40
+
+
+def test_sparse_set_container():
+    c = SparseSetContainer()
+
+    c[3] = {'x': 3}
+    c[100] = {'x': 100}
+    c[7] = {'x': 7}
+
+    assert 3 in c
+    assert 4 not in c
+    assert 1000 not in c
+    assert list(c) == [3, 100, 7]
+    assert c[100] == {'x': 100}
+
+    del c[3]
+
+    assert 3 not in c
+    assert list(c) == [7, 100]
+    assert c.value().tolist() == [{'x': 7}, {'x': 100}]
+
+    with pytest.raises(KeyError):
+        c[3]
+    with pytest.raises(KeyError):
+        del c[3]
+    with pytest.raises(ValueError):
+        c[-1] = {'x': -1}
+
+
+def test_registry_system_sparse_set():
+    r = Registry()
+    r.register_component('position', SparseSetContainer())
+    r.register_component('velocity', SparseSetContainer())
+
+    def update_position(update, r, entity_ids, positions, velocities):
+        for entity_id in entity_ids:
+            position_row = r.components['position'].index[entity_id]
+            velocity_row = r.components['velocity'].index[entity_id]
+            positions[position_row]['x'] += velocities[velocity_row]['speed']
+
+    s = System(update_position, ['position', 'velocity'])
+    r.register_system(s)
+
+    e0 = r.add_entity(position={'x': 10}, velocity={'speed': 1})
+    e1 = r.add_entity(position={'x': 20})
+    r.add_component(e1, 'velocity', {'speed': 5})
+    assert s.entity_ids == set([e0, e1])
+
+    r.remove_component(e0, 'velocity')
+    assert s.entity_ids == set([e1])
+
+    r.execute('update')
+
+    assert r.get(e0, 'position')['x'] == 10
+    assert r.get(e1, 'position')['x'] == 25
+
+
+def test_registry_add_entities():
+    r = Registry()
+    r.register_component('position', ArrayContainer([('x', 'f8')]))
+    r.register_component('velocity', SparseSetContainer([('speed', 'f8')]))
+    r.register_component('name')
+    r.register_component('size', DataFrameContainer())
+
+    s = System(lambda update, r, entity_ids, p, v: None,
+               ['position', 'velocity'])
+    r.register_system(s)
+    t = System(lambda update, r, entity_ids, p, n: None,
+               ['position', 'name'])
+    r.register_system(t)
+
+    r.add_entity(position={'x': 0.0})
+
+    entity_ids = r.add_entities(
+        3,
+        position=pd.DataFrame({'x': [1.0, 2.0, 3.0]}),
+        velocity={'speed': [0.1, 0.2, 0.3]},
+        size=pd.DataFrame({'s': [5, 6, 7]}))
+
+    assert entity_ids.tolist() == [1, 2, 3]
+    assert s.entity_ids == set([1, 2, 3])
+    assert t.entity_ids == set()
+
+    more_entity_ids = r.add_entities(2, position=[{'x': 4.0}, {'x': 5.0}],
+                                     name=['a', 'b'])
+    assert more_entity_ids.tolist() == [4, 5]
+    assert s.entity_ids == set([1, 2, 3])
+    assert t.entity_ids == set([4, 5])
+
+    assert r.get(2, 'position')['x'] == 2.0
+    assert r.get(3, 'velocity')['speed'] == 0.3
+    assert r.get(1, 'size')['s'] == 5
+    assert r.get(5, 'name') == 'b'
+    assert r.create_entity_id() == 6
+
+    with pytest.raises(ValueError):
+        r.add_entities(2, position=[{'x': 6.0}])
+
+
+def test_registry_add_entities_without_components():
+    r = Registry()
+    r.register_component('position')
+
+    entity_ids = r.add_entities(2)
+    spawned = r.commands.spawn_many(2)
+    r.commands.apply()
+
+    assert r.entity_masks == {}
+    assert r.matching([]).tolist() == []
+    for entity_id in entity_ids.tolist() + spawned.tolist():
+        assert r.is_alive(entity_id)
+        r.release_entity_id(entity_id)
+
+
+def test_registry_component_masks():
+    r = Registry()
+    r.register_component('position')
+    r.register_component('velocity')
+    r.register_component('frozen')
+
+    assert r.component_mask(['position', 'velocity']) == 0b011
+    assert r.component_mask(['frozen']) == 0b100
+
+    e0 = r.add_entity(position={'x': 0}, velocity={'speed': 1})
+    e1 = r.add_entity(position={'x': 0}, frozen=True)
+    e2 = r.add_entity(velocity={'speed': 1}, frozen=True)
+
+    assert r.entity_masks == {e0: 0b011, e1: 0b101, e2: 0b110}
+    assert r.has_components(e1, ['position', 'frozen'])
+    assert not r.has_components(e1, ['velocity'])
+    assert sorted(r.matching(['position']).tolist()) == [e0, e1]
+    assert sorted(r.matching(['frozen']).tolist()) == [e1, e2]
+
+    r.remove_component(e1, 'position')
+    r.remove_component(e1, 'frozen')
+    assert e1 not in r.entity_masks
+
+
+def test_registry_late_system_tracks_existing():
+    r = Registry()
+    r.register_component('position')
+    r.register_component('velocity')
+
+    e0 = r.add_entity(position={'x': 0}, velocity={'speed': 1})
+    r.add_entity(position={'x': 0})
+
+    s = System(lambda update, r, entity_ids, p, v: None,
+               ['position', 'velocity'])
+    r.register_system(s)
+    assert s.entity_ids == set([e0])
+
+
+def test_system_forget_untracked():
+    s = System(lambda update, r, entity_ids: None, [])
+    s.forget(1)
+    assert s.entity_ids == set()
+
+
+def test_data_frame_container_buffered():
+    c = DataFrameContainer(capacity=2)
+
+    c[1] = {'x': 1}
+    c[2] = {'x': 2}
+    c[3] = {'x': 3}
+    assert 2 in c
+    assert len(c.df) == 0
+
+    df = c.value()
+    assert sorted(df.index) == [1, 2, 3]
+    assert c.capacity == 4
+
+    del c[1]
+    assert 1 not in c
+    c[4] = {'x': 4, 'y': 1.5}
+    c[2] = {'x': 20}
+    del c[4]
+    assert 4 not in c
+    with pytest.raises(KeyError):
+        del c[4]
+
+    df = c.value()
+    assert sorted(df.index) == [2, 3]
+    assert df.loc[2, 'x'] == 20
+    assert df.loc[3, 'x'] == 3
+    assert not c.to_remove_entity_ids
+    assert not c.to_add
+
+
+def test_data_frame_container_value_is_view():
+    c = DataFrameContainer()
+    c.add_many([1, 2, 3], pd.DataFrame({'x': [1.0, 2.0, 3.0]}))
+
+    df = c.value()
+    df.loc[[1, 3], 'x'] += 10.0
+    assert c.value() is df
+
+    # an update that changes the dtype replaces the column; it's adopted
+    # on the next flush
+    df.loc[[2], 'x'] = 'two'
+    del c[1]
+    c[4] = {'x': 4.0}
+
+    df = c.value()
+    assert df.loc[2, 'x'] == 'two'
+    assert df.loc[3, 'x'] == 13.0
+    assert df.loc[4, 'x'] == 4.0
+
+
+def test_data_frame_container_incremental_flush():
+    c = DataFrameContainer(capacity=16)
+    c.add_many([1, 2, 3], pd.DataFrame({'x': [1.0, 2.0, 3.0],
+                                        'y': [4, 5, 6]}))
+    c.value()
+    columns = dict(c.columns)
+    row_entity_ids = c.row_entity_ids
+
+    c[4] = {'x': 4.0, 'y': 7}
+    c[2] = {'x': 20.0, 'y': 5}
+    df = c.value()
+    # the rows are written into the existing arrays, nothing is copied
+    for name, column in columns.items():
+        assert c.columns[name] is column
+        assert np.shares_memory(df[name].to_numpy(), column)
+    assert c.row_entity_ids is row_entity_ids
+    assert np.shares_memory(df.index.to_numpy(), row_entity_ids)
+    assert df.loc[4, 'y'] == 7
+    assert df.loc[2, 'x'] == 20.0
+    assert df.loc[2, 'y'] == 5
+
+    del c[1]
+    df = c.value()
+    assert sorted(df.index) == [2, 3, 4]
+    for name, column in columns.items():
+        assert c.columns[name] is column
+    assert np.shares_memory(df.index.to_numpy(), row_entity_ids)
+
+
+def test_data_frame_container_shrinks():
+    c = DataFrameContainer(capacity=4)
+    c.add_many(list(range(100)), {'x': list(range(100))})
+    c.value()
+    assert c.capacity == 128
+
+    for entity_id in range(95):
+        del c[entity_id]
+    df = c.value()
+    assert sorted(df.index) == [95, 96, 97, 98, 99]
+    assert sorted(df['x']) == [95, 96, 97, 98, 99]
+    assert c.capacity == 16
+    assert c.index == {entity_id: row
+                       for row, entity_id in enumerate(df.index)}
+    assert c.rows([99, 95]).tolist() == [
+        df.index.get_loc(99), df.index.get_loc(95)]
+
+
+def test_registry_changed_system():
+    r = Registry()
+    r.register_component('position')
+    r.register_component('velocity')
+
+    calls = []
+
+    def update(update, r, added, changed, removed, positions, velocities):
+        calls.append((sorted(added), sorted(changed), sorted(removed)))
+
+    s = ChangedSystem(update, ['position', 'velocity'])
+    r.register_system(s)
+
+    e0 = r.add_entity(position={'x': 0}, velocity={'speed': 1})
+    e1 = r.add_entity(position={'x': 0}, velocity={'speed': 1})
+    r.add_entity(position={'x': 0})
+
+    r.execute('update')
+    assert calls == [([e0, e1], [], [])]
+
+    # idle world, the function isn't called
+    r.execute('update')
+    assert len(calls) == 1
+
+    r.add_component(e0, 'position', {'x': 5})
+    r.get(e1, 'velocity')['speed'] = 2
+    r.mark_changed(e1, 'velocity')
+    r.execute('update')
+    assert calls[-1] == ([], [e0, e1], [])
+
+    r.remove_component(e0, 'velocity')
+    r.mark_changed_many([e0, e1], 'position')
+    r.execute('update')
+    assert calls[-1] == ([], [e1], [e0])
+
+    # added and removed again before the system ran
+    r.add_component(e0, 'velocity', {'speed': 1})
+    r.remove_component(e0, 'velocity')
+    r.execute('update')
+    assert len(calls) == 3
+
+
+def test_registry_changed_system_without():
+    r = Registry()
+    r.register_component('a')
+    r.register_component('b')
+
+    calls = []
+
+    def update(update, r, added, changed, removed, a):
+        calls.append((sorted(added), sorted(changed), sorted(removed)))
+
+    s = ChangedSystem(update, Query(['a'], without=['b']))
+    r.register_system(s)
+
+    e0 = r.add_entity(a=1)
+    r.execute('update')
+    assert calls == [([e0], [], [])]
+
+    r.add_component(e0, 'b', 2)
+    r.execute('update')
+    assert calls[-1] == ([], [], [e0])
+    assert s.removed == set()
+
+    r.remove_component(e0, 'b')
+    r.execute('update')
+    assert calls[-1] == ([e0], [], [])
+
+
+def test_registry_component_versions():
+    r = Registry()
+    r.register_component('position')
+    r.register_component('velocity')
+
+    assert r.component_versions == {'position': 0, 'velocity': 0}
+    e0 = r.add_entity(position={'x': 0})
+    version = r.version
+    assert r.component_versions['position'] == version
+    assert not r.changed_since(['position', 'velocity'], version)
+    r.add_entities(1, velocity=[{'speed': 1}])
+    assert r.changed_since(['velocity'], version)
+    assert not r.changed_since(['position'], version)
+    r.remove_component(e0, 'position')
+    assert r.component_versions['position'] == r.version
+
+
+def test_registry_entity_ids_system_cache():
+    r = Registry()
+    r.register_component('position')
+    r.register_component('velocity', SparseSetContainer([('speed', 'i8')]))
+
+    gathered = []
+
+    def update_position(update, r, entity_ids, positions, velocities):
+        gathered.append(list(zip(entity_ids, positions)))
+        for position, velocity in zip(positions, velocities):
+            position['x'] += velocity['speed']
+
+    s = entity_ids_system(update_position, ['position', 'velocity'])
+    r.register_system(s)
+
+    e0 = r.add_entity(position={'x': 0}, velocity={'speed': 1})
+    e1 = r.add_entity(position={'x': 0}, velocity={'speed': 2})
+    e2 = r.add_entity(position={'x': 0}, velocity={'speed': 3})
+
+    r.execute('update')
+    positions = s.caches[0]
+
+    # the cache is patched, not rebuilt
+    r.remove_component(e0, 'velocity')
+    new_position = {'x': 100}
+    r.add_component(e1, 'position', new_position)
+    r.execute('update')
+
+    assert s.caches[0] is positions
+    assert dict(gathered[-1]) == {e1: new_position, e2: {'x': 6}}
+    assert r.get(e0, 'position')['x'] == 1
+    assert r.get(e1, 'position')['x'] == 102
+    assert r.get(e2, 'position')['x'] == 6
+
+    r.add_component(e0, 'velocity', {'speed': 10})
+    r.execute('update')
+    assert r.get(e0, 'position')['x'] == 11
+    assert r.get(e2, 'position')['x'] == 9
+
+
+def test_registry_entity_ids_system_arguments_are_tuples():
+    r = Registry()
+    r.register_component('position')
+
+    def update_position(update, r, entity_ids, positions):
+        assert isinstance(entity_ids, tuple)
+        assert isinstance(positions, tuple)
+        with pytest.raises(AttributeError):
+            entity_ids.append(100)
+
+    s = entity_ids_system(update_position, ['position'])
+    r.register_system(s)
+    e0 = r.add_entity(position={'x': 0})
+    r.execute('update')
+    r.execute('update')
+    assert s.order == [e0]
+    assert len(s.caches[0]) == 1
+
+
+def test_registry_item_system_array():
+    r = Registry()
+    r.register_component('position', ArrayContainer([('x', 'i8')]))
+    r.register_component('velocity', ArrayContainer([('speed', 'i8')]))
+
+    def update_position(update, r, entity_id, position, velocity):
+        position['x'] += velocity['speed']
+
+    r.register_system(item_system(update_position, ['position', 'velocity']))
+
+    e0 = r.add_entity(position={'x': 10}, velocity={'speed': 1})
+    e1 = r.add_entity(position={'x': 20}, velocity={'speed': 5})
+    e2 = r.add_entity(position={'x': 40})
+
+    r.execute('update')
+    # rows move around
+    r.remove_component(e0, 'velocity')
+    r.add_component(e2, 'velocity', {'speed': 2})
+    r.execute('update')
+
+    assert r.get(e0, 'position')['x'] == 11
+    assert r.get(e1, 'position')['x'] == 30
+    assert r.get(e2, 'position')['x'] == 42
+
+
+def test_generational_entity_ids():
+    r = Registry()
+    r.register_component('position', SparseSetContainer([('x', 'f8')]))
+    r.register_component('name')
+    s = System(lambda update, r, entity_ids, positions: None, ['position'])
+    r.register_system(s)
+
+    e0 = r.add_entity(position={'x': 0.0})
+    e1 = r.add_entity(position={'x': 1.0}, name='one')
+    assert (e0, e1) == (0, 1)
+
+    r.remove_component(e0, 'position')
+    with pytest.raises(ValueError):
+        r.release_entity_id(e1)
+    r.release_entity_id(e0)
+    assert not r.is_alive(e0)
+    with pytest.raises(KeyError):
+        r.release_entity_id(e0)
+
+    e2 = r.add_entity(position={'x': 2.0})
+    assert e2 != e0
+    assert entity_index(e2) == entity_index(e0)
+    assert entity_generation(e2) == 1
+    assert e2 == pack_entity_id(0, 1)
+    assert r.is_alive(e2)
+    assert r.get(e2, 'position')['x'] == 2.0
+    assert s.entity_ids == {e1, e2}
+
+    # the stale id doesn't find the component of the new generation
+    assert e0 not in r.components['position']
+    with pytest.raises(KeyError):
+        r.get(e0, 'position')
+    with pytest.raises(KeyError):
+        r.add_component(e0, 'name', 'stale')
+    assert r.components['position'].rows([e2, e1]).tolist() == [1, 0]
+
+    r.remove_component(e2, 'position')
+    r.release_entity_id(e2)
+    ids = r.create_entity_ids(3)
+    assert ids.tolist() == [pack_entity_id(0, 2), 2, 3]
+
+
+@pytest.mark.parametrize('container', [
+    lambda: DataFrameContainer(),
+    lambda: ArrayContainer([('x', 'f8')]),
+    lambda: SparseSetContainer([('x', 'f8')]),
+])
+def test_remove_entities(container):
+    r = Registry()
+    r.register_component('position', container())
+    r.register_component('velocity', container())
+    r.register_component('name')
+    moving = ChangedSystem(lambda update, r, a, c, d, p, v: None,
+                           ['position', 'velocity'])
+    named = System(lambda update, r, entity_ids, names: None, ['name'])
+    r.register_system(moving)
+    r.register_system(named)
+
+    entity_ids = r.add_entities(6, position=[{'x': float(i)}
+                                             for i in range(6)],
+                                velocity=[{'x': 1.0}] * 6)
+    r.add_component(0, 'name', 'zero')
+    r.add_component(4, 'name', 'four')
+    e6 = r.add_entity(name='six')
+    r.execute(None)
+
+    r.remove_entity(1)
+    r.remove_entities([0, 3, 5, e6, 5])
+    assert not r.is_alive(0)
+    assert sorted(r.entity_masks) == [2, 4]
+    assert moving.entity_ids == {2, 4}
+    assert moving.removed == {0, 1, 3, 5}
+    assert named.entity_ids == {4}
+    assert len(r.components['position']) == 2
+    assert r.get(4, 'position')['x'] == 4.0
+    assert r.get(2, 'position')['x'] == 2.0
+    assert dict(r.components['name']) == {4: 'four'}
+    with pytest.raises(KeyError):
+        r.remove_entity(1)
+    with pytest.raises(KeyError):
+        r.remove_entities([2, 3])
+    assert r.has_components(2, ['position'])
+
+    # the released slots are recycled
+    assert entity_index(r.create_entity_id()) == 1
+
+
+def test_remove_entities_only_involves_their_components():
+    r = Registry()
+    r.register_component('position')
+    r.register_component('name')
+    forgotten = []
+
+    class Recording(System):
+        def forget_many(self, entity_ids):
+            forgotten.append((self.component_ids, list(entity_ids)))
+            super().forget_many(entity_ids)
+
+    r.register_system(Recording(lambda update, r, entity_ids, p: None,
+                                ['position']))
+    r.register_system(Recording(lambda update, r, entity_ids, n: None,
+                                ['name']))
+    r.add_entity(position={'x': 0})
+    r.add_entity(name='one')
+    r.remove_entities([0])
+    assert forgotten == [(['position'], [0])]
+    assert r.has_components(1, ['name'])
+
+
+def test_array_container_remove_many():
+    c = ArrayContainer([('x', 'f8')])
+    c.add_many(range(10), {'x': [float(i) for i in range(10)]})
+    c.remove_many([0, 8, 9, 4])
+    assert sorted(c) == [1, 2, 3, 5, 6, 7]
+    for entity_id in c:
+        assert c[entity_id]['x'] == float(entity_id)
+    with pytest.raises(KeyError):
+        c.remove_many([8])
+
+
+def test_query_without_and_optional():
+    r = Registry()
+    r.register_component('position')
+    r.register_component('frozen')
+    r.register_component('name', ArrayContainer(object))
+
+    seen = []
+
+    def record(update, r, entity_ids, positions, names):
+        seen.append(sorted(zip(entity_ids, names)))
+
+    s = entity_ids_system(
+        record, Query(['position'], without=['frozen'], optional=['name']))
+    plain = System(lambda update, r, entity_ids, positions, frozen: None,
+                   Query(['position', 'frozen']))
+    r.add_entity(position=0, frozen=True)
+    r.register_system(s)
+    r.register_system(plain)
+    assert s.component_ids == ['position', 'name']
+    assert s.entity_ids == set()
+
+    e1 = r.add_entity(position=1)
+    e2 = r.add_entity(position=2, name='two')
+    r.add_entities(2, position=[3, 4], frozen=[True, True])
+    assert s.entity_ids == {e1, e2}
+
+    r.add_component(e1, 'frozen', True)
+    assert s.entity_ids == {e2}
+    r.remove_component(0, 'frozen')
+    assert s.entity_ids == {0, e2}
+    assert plain.entity_ids == {e1, 3, 4}
+
+    r.execute(None)
+    assert seen == [[(0, None), (e2, 'two')]]
+    r.add_component(0, 'name', 'zero')
+    r.execute(None)
+    assert seen[-1] == [(0, 'zero'), (e2, 'two')]
+
+    r.remove_entities([e2, 3])
+    assert s.entity_ids == {0}
+    assert plain.entity_ids == {e1, 4}
+
+
+def test_execute_async():
+    r = Registry()
+    r.register_component('position')
+    r.register_component('velocity')
+    r.register_component('log')
+    log = []
+
+    async def save(update, r, entity_ids, positions):
+        # only done once the next system ran
+        await asyncio.wait_for(update['saved'].wait(), 1)
+        log.append(('save', sorted(entity_ids)))
+
+    def simulate(update, r, entity_ids, velocities):
+        log.append(('simulate', sorted(entity_ids)))
+        update['saved'].set()
+
+    def report(update, r, entity_ids, logs):
+        log.append(('report', sorted(entity_ids)))
+
+    r.register_system(async_system(save, ['position'], writes=['log']))
+    r.register_system(System(simulate, ['velocity'], writes=['velocity']))
+    r.register_system(System(report, ['log'], writes=[]))
+    r.add_entity(position={'x': 0}, velocity={'dx': 1}, log=[])
+
+    async def main():
+        await r.execute_async({'saved': asyncio.Event()})
+
+    asyncio.run(main())
+    assert log == [('simulate', [0]), ('save', [0]), ('report', [0])]
+
+
+def test_async_system_execute():
+    r = Registry()
+    r.register_component('position')
+    seen = []
+
+    async def save(update, r, entity_ids, positions):
+        await asyncio.sleep(0)
+        seen.append(sorted(entity_ids))
+
+    r.register_system(System(lambda update, r, entity_ids, positions:
+                             seen.append('sync'), ['position']))
+    r.register_system(async_system(save, ['position']))
+    r.add_entity(position={'x': 0})
+    # refused before any system runs, also from within an event loop
+    with pytest.raises(TypeError):
+        r.execute(None)
+
+    async def main():
+        with pytest.raises(TypeError):
+            r.execute(None)
+        await r.execute_async(None)
+
+    asyncio.run(main())
+    assert seen == ['sync', [0]]
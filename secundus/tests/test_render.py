@@ -0,0 +1,92 @@
+import ctypes
+
+import numpy as np
+
+from secundus.registry import Registry, ArrayContainer
+from secundus.render import QuadVertices, PygletQuads, quad_system
+
+
+TEX_COORDS = [0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 1.0, 1.0, 0.0, 0.0, 1.0, 0.0]
+
+
+class FakeVertexList:
+    def __init__(self, size):
+        self.resize(size)
+        self.resized = 0
+
+    def get_size(self):
+        return self.size
+
+    def resize(self, size):
+        self.size = size
+        self.vertices = (ctypes.c_float * (size * 2))()
+        self.colors = (ctypes.c_ubyte * (size * 4))()
+        self.tex_coords = (ctypes.c_float * (size * 3))()
+        self.resized = getattr(self, 'resized', -1) + 1
+
+
+class FakeBatch:
+    def __init__(self):
+        self.added = []
+
+    def add(self, size, mode, group, *formats):
+        self.added.append((size, mode, group, formats))
+        return FakeVertexList(size)
+
+
+def test_quad_vertices():
+    quads = QuadVertices(10, 20, anchor_x=5, anchor_y=10, scale=2.0,
+                         capacity=1)
+    quads.update(np.array([1.0, 2.0]), np.array([3.0, 4.0]),
+                 [np.array([1, 2]), np.array([3, 4]), np.array([5, 6]),
+                  np.array([7, 8])],
+                 np.array([TEX_COORDS, TEX_COORDS]))
+    assert quads.count == 2
+    assert quads.vertex_data().tolist() == [
+        -3, -4, 7, -4, 7, 16, -3, 16,
+        -1, -2, 9, -2, 9, 18, -1, 18]
+    assert quads.color_data().tolist() == [1, 3, 5, 7] * 4 + [2, 4, 6, 8] * 4
+    assert quads.tex_coord_data().tolist() == TEX_COORDS * 2
+
+    vertices = quads.vertices
+    quads.update(np.array([0.0]), np.array([0.0]))
+    assert quads.vertices is vertices
+    assert quads.vertex_data().tolist() == [-5, -10, 5, -10, 5, 10, -5, 10]
+
+
+def test_quad_system_upload():
+    r = Registry()
+    r.register_component('position', ArrayContainer([('x', 'f8'),
+                                                     ('y', 'f8')]))
+    r.register_component('color', ArrayContainer(
+        [('r', 'u1'), ('g', 'u1'), ('b', 'u1'), ('a', 'u1')]))
+    r.register_component('texture', ArrayContainer(
+        [('tex_coords', 'f4', 12)]))
+    quads = QuadVertices(2, 2)
+    batch = FakeBatch()
+    pyglet_quads = PygletQuads(quads, batch, mode=7)
+    r.register_system(quad_system(quads, color='color', texture='texture',
+                                  upload=pyglet_quads.upload))
+    for i in range(3):
+        r.add_entity(position={'x': float(i), 'y': 0.0},
+                     color={'r': i, 'g': 0, 'b': 0, 'a': 255},
+                     texture={'tex_coords': TEX_COORDS})
+
+    r.execute(None)
+    assert len(batch.added) == 1
+    assert batch.added[0][:2] == (12, 7)
+    vertex_list = pyglet_quads.vertex_list
+    assert list(vertex_list.vertices)[:8] == [0, 0, 2, 0, 2, 2, 0, 2]
+    assert list(vertex_list.colors)[32:36] == [2, 0, 0, 255]
+    assert list(vertex_list.tex_coords)[:12] == TEX_COORDS
+
+    r.execute(None)
+    assert vertex_list.resized == 0
+    r.add_entity(position={'x': 5.0, 'y': 5.0},
+                 color={'r': 0, 'g': 0, 'b': 0, 'a': 0},
+                 texture={'tex_coords': TEX_COORDS})
+    r.execute(None)
+    assert len(batch.added) == 1
+    assert vertex_list.resized == 1
+    assert vertex_list.get_size() == 16
+    assert list(vertex_list.vertices)[24:] == [5, 5, 7, 5, 7, 7, 5, 7]
@@ -0,0 +1,119 @@
+import asyncio
+
+from secundus.registry import Registry, System, async_system
+from secundus.runner import Runner, AsyncRunner
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def create_registry(ticks, cost=0.0, clock=None):
+    r = Registry()
+    r.register_component('position')
+
+    def tick(update, r, entity_ids, positions):
+        ticks.append((update.tick, update.time, update.dt))
+        if clock is not None:
+            clock.now += cost
+
+    r.register_system(System(tick, ['position']))
+    return r
+
+
+def test_runner_headless():
+    ticks = []
+    runner = Runner(create_registry(ticks), dt=0.5)
+    runner.run(ticks=3, realtime=False)
+    assert ticks == [(0, 0.0, 0.5), (1, 0.5, 0.5), (2, 1.0, 0.5)]
+    assert runner.tick == 3
+
+
+def test_runner_accumulator():
+    ticks = []
+    clock = FakeClock()
+    runner = Runner(create_registry(ticks), dt=0.1, clock=clock)
+    assert runner.advance(0.05) == 0
+    assert runner.advance(0.06) == 1
+    assert runner.advance(0.25) == 2
+    assert len(ticks) == 3
+    assert abs(runner.accumulator - 0.06) < 1e-9
+
+
+def test_runner_bounded_catch_up():
+    ticks = []
+    clock = FakeClock()
+    runner = Runner(create_registry(ticks), dt=0.1, max_steps=3,
+                    clock=clock)
+    assert runner.advance(1.05) == 3
+    assert runner.dropped_ticks == 7
+    assert runner.accumulator < 0.1
+
+
+def test_runner_budget_overrun():
+    ticks = []
+    overruns = []
+    clock = FakeClock()
+    r = create_registry(ticks, cost=0.03, clock=clock)
+    runner = Runner(r, dt=0.01, max_steps=10, budget=0.02, clock=clock,
+                    on_overrun=lambda runner, duration: overruns.append(
+                        duration))
+    # the first tick uses up the budget, so catching up stops
+    assert runner.advance(0.05) == 1
+    assert runner.overruns == 1
+    assert overruns == [0.03]
+
+
+def test_runner_budget_bounds_accumulator():
+    ticks = []
+    clock = FakeClock()
+    r = create_registry(ticks, cost=0.03, clock=clock)
+    runner = Runner(r, dt=0.01, max_steps=10, budget=0.02, clock=clock)
+    # every frame takes longer than dt, and the budget cuts it short
+    for frame in range(20):
+        assert runner.advance(0.05) == 1
+        assert runner.accumulator < runner.dt
+    assert runner.dropped_ticks == 20 * 4
+
+
+def test_runner_realtime():
+    ticks = []
+    clock = FakeClock()
+    runner = Runner(create_registry(ticks, cost=0.001, clock=clock),
+                    dt=0.1, clock=clock, sleep=clock.sleep)
+    runner.run(ticks=5)
+    assert [tick for tick, time, dt in ticks] == [0, 1, 2, 3, 4]
+    assert runner.overruns == 0
+    assert 0.5 <= clock.now < 0.51
+
+
+def test_async_runner():
+    ticks = []
+    saved = []
+    clock = FakeClock()
+    r = create_registry(ticks)
+
+    async def save(update, r, entity_ids, positions):
+        await asyncio.sleep(0)
+        saved.append(update.tick)
+
+    r.register_system(async_system(save, ['position'], writes=[]))
+
+    async def sleep(seconds):
+        clock.sleep(seconds)
+
+    runner = AsyncRunner(r, dt=0.1, clock=clock, sleep=sleep)
+    asyncio.run(runner.run(ticks=3))
+    assert [tick for tick, time, dt in ticks] == [0, 1, 2]
+    assert saved == [0, 1, 2]
+    assert abs(clock.now - 0.3) < 1e-9
+
+    asyncio.run(runner.run(ticks=2, realtime=False))
+    assert saved == [0, 1, 2, 3, 4]
@@ -0,0 +1,88 @@
+import threading
+
+from secundus.registry import Registry, System
+from secundus.scheduler import Scheduler, stages
+
+
+def noop(update, r, entity_ids, *values):
+    pass
+
+
+def test_stages():
+    move = System(noop, ['position', 'velocity'], writes=['position'])
+    damp = System(noop, ['velocity'], writes=['velocity'])
+    spin = System(noop, ['rotation'], writes=['rotation'])
+    render = System(noop, ['position', 'rotation'], writes=[])
+    log = System(noop, ['position'], writes=[])
+    anything = System(noop, ['position'])
+
+    assert stages([move, damp, spin, render, log]) == [
+        [move, spin], [damp, render, log]]
+    assert stages([render, log, anything, spin]) == [
+        [render, log], [anything], [spin]]
+
+
+def test_scheduler_execute():
+    r = Registry()
+    r.register_component('position')
+    r.register_component('velocity')
+    r.register_component('rotation')
+
+    barrier = threading.Barrier(2, timeout=5)
+    threads = set()
+
+    def move(update, r, entity_ids, positions, velocities):
+        barrier.wait()
+        threads.add(threading.get_ident())
+        for entity_id in entity_ids:
+            positions[entity_id]['x'] += velocities[entity_id]['speed']
+
+    def spin(update, r, entity_ids, rotations):
+        barrier.wait()
+        threads.add(threading.get_ident())
+        for entity_id in entity_ids:
+            rotations[entity_id]['angle'] += 1
+
+    def check(update, r, entity_ids, positions, rotations):
+        for entity_id in entity_ids:
+            assert positions[entity_id]['x'] == 11
+            assert rotations[entity_id]['angle'] == 1
+
+    r.register_system(System(move, ['position', 'velocity'],
+                             writes=['position']))
+    r.register_system(System(spin, ['rotation'], writes=['rotation']))
+    r.register_system(System(check, ['position', 'rotation'], writes=[]))
+
+    e = r.add_entity(position={'x': 10}, velocity={'speed': 1},
+                     rotation={'angle': 0})
+
+    scheduler = Scheduler(r, max_workers=2)
+    try:
+        scheduler.execute('update')
+    finally:
+        scheduler.shutdown()
+
+    # both systems waited for each other, so they ran concurrently
+    assert len(threads) == 2
+    assert r.get(e, 'position')['x'] == 11
+    assert r.get(e, 'rotation')['angle'] == 1
+
+
+def test_execution_plan():
+    r = Registry()
+    r.register_component('a')
+    r.register_component('b')
+    first = System(lambda update, r, entity_ids, a: None, ['a'], writes=['a'])
+    second = System(lambda update, r, entity_ids, b: None, ['b'],
+                    writes=['b'])
+    r.register_system(first)
+    plan = r.execution_plan()
+    assert r.execution_plan() is plan
+    r.add_sync_point()
+    r.register_system(second)
+    plan = r.execution_plan()
+    assert plan.systems == (first, second)
+    assert plan.steps[0] == (first, (r.components['a'],), True)
+    assert plan.segments == (
+        (((first, (r.components['a'],)),),),
+        (((second, (r.components['b'],)),),))
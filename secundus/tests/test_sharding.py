@@ -0,0 +1,99 @@
+import os
+
+import pytest
+
+from secundus.registry import Registry
+from secundus.sharding import (
+    SharedArrayContainer, WorkerPool, sharded_item_system, _attach,
+    _attached, _detach, _evict)
+
+
+def update_position(update, entity_id, position, velocity):
+    position['x'] += velocity['speed'] * update
+    position['pid'] = os.getpid()
+
+
+def test_shared_array_container_grow():
+    c = SharedArrayContainer([('x', 'f8')], capacity=1)
+    try:
+        c[1] = {'x': 1.0}
+        name = c.shm.name
+        c[2] = {'x': 2.0}
+        assert c.shm.name != name
+        assert c.value()['x'].tolist() == [1.0, 2.0]
+    finally:
+        c.close()
+
+
+def test_shared_array_container_no_objects():
+    with pytest.raises(ValueError):
+        SharedArrayContainer(object)
+
+
+def test_sharded_item_system():
+    r = Registry()
+    position = SharedArrayContainer([('x', 'f8'), ('pid', 'i8')])
+    velocity = SharedArrayContainer([('speed', 'f8')])
+    r.register_component('position', position)
+    r.register_component('velocity', velocity)
+
+    pool = WorkerPool(2)
+    try:
+        r.register_system(sharded_item_system(
+            update_position, ['position', 'velocity'], pool))
+
+        entity_ids = r.add_entities(
+            100,
+            position={'x': [float(i) for i in range(100)], 'pid': [0] * 100},
+            velocity={'speed': [1.0] * 100})
+        r.add_entity(position={'x': -1.0, 'pid': 0})
+
+        r.execute(2.0)
+        # the array grows and moves to a new block between executions
+        r.add_entities(100, position={'x': [0.0] * 100, 'pid': [0] * 100})
+        r.execute(1.0)
+
+        for entity_id in entity_ids.tolist():
+            assert r.get(entity_id, 'position')['x'] == entity_id + 3.0
+        assert r.get(100, 'position')['x'] == -1.0
+        pids = set(position.value()['pid'][:100].tolist())
+        assert os.getpid() not in pids
+        assert 0 not in pids
+    finally:
+        pool.shutdown()
+        position.close()
+        velocity.close()
+
+
+def test_worker_detaches_closed_containers():
+    c = SharedArrayContainer([('x', 'f8')])
+    other = SharedArrayContainer([('x', 'f8')])
+    try:
+        c[1] = {'x': 1.0}
+        other[1] = {'x': 2.0}
+        # attach in this process as a worker would
+        _attach(*c.spec())
+        _attach(*other.spec())
+        c.close()
+        _evict({other.uid})
+        assert c.uid not in _attached
+        assert other.uid in _attached
+    finally:
+        _detach(other.uid)
+        other.close()
+
+
+def test_sharded_system_needs_structured_dtype():
+    r = Registry()
+    position = SharedArrayContainer('f8')
+    r.register_component('position', position)
+    pool = WorkerPool(1)
+    try:
+        r.register_system(sharded_item_system(
+            update_position, ['position'], pool))
+        r.add_entity(position=1.0)
+        with pytest.raises(TypeError):
+            r.execute(1.0)
+    finally:
+        pool.shutdown()
+        position.close()
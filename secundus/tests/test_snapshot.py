@@ -0,0 +1,134 @@
+import pytest
+
+from secundus.registry import (
+    Registry, System, ChangedSystem, DictContainer, DataFrameContainer,
+    ArrayContainer, SparseSetContainer, entity_ids_system)
+from secundus.vectorized import vectorized_system
+
+
+def create_registry():
+    r = Registry()
+    r.register_component('position', ArrayContainer([('x', 'f8'),
+                                                     ('y', 'f8')]))
+    r.register_component('velocity', SparseSetContainer([('dx', 'f8')]))
+    r.register_component('size', DataFrameContainer())
+    r.register_component('name', DictContainer())
+    return r
+
+
+def move(update, r, entity_ids, positions, velocities):
+    positions['x'] += velocities['dx']
+
+
+def register_systems(r):
+    systems = [
+        System(lambda update, r, entity_ids, names: None, ['name']),
+        ChangedSystem(lambda update, r, a, c, d, sizes: None, ['size']),
+        entity_ids_system(lambda update, r, entity_ids, positions: None,
+                          ['position']),
+        vectorized_system(move, ['position', 'velocity']),
+    ]
+    for system in systems:
+        r.register_system(system)
+    return systems
+
+
+@pytest.mark.parametrize('mmap', [False, True])
+def test_snapshot_restore(tmp_path, mmap):
+    r = create_registry()
+    register_systems(r)
+    for i in range(10):
+        r.add_entity(position={'x': float(i), 'y': 0.0},
+                     velocity={'dx': 1.0}, size={'s': i},
+                     name='e%s' % i)
+    r.remove_component(3, 'velocity')
+    r.remove_component(4, 'size')
+    r.remove_component(5, 'name')
+    r.execute(None)
+
+    path = tmp_path / 'world.snapshot'
+    r.snapshot(path)
+
+    restored = create_registry()
+    systems = register_systems(restored)
+    restored.restore(path, mmap=mmap)
+
+    assert restored.entity_id_counter == 10
+    assert restored.add_entity(name='new') == 10
+    assert restored.get(0, 'position')['x'] == 1.0
+    assert restored.get(3, 'position')['x'] == 3.0
+    assert restored.get(9, 'velocity')['dx'] == 1.0
+    assert 3 not in restored.components['velocity']
+    assert restored.get(7, 'size')['s'] == 7
+    assert 4 not in restored.components['size']
+    assert restored.get(6, 'name') == 'e6'
+    assert restored.has_components(3, ['position', 'size'])
+    assert not restored.has_components(3, ['velocity'])
+
+    assert systems[0].entity_ids == set(range(11)) - {5}
+    assert systems[1].added == set(range(10)) - {4}
+    assert sorted(systems[2].order) == list(range(10))
+    assert systems[3].entity_ids == set(range(10)) - {3}
+
+    restored.execute(None)
+    assert restored.get(0, 'position')['x'] == 2.0
+    assert restored.get(3, 'position')['x'] == 3.0
+
+    # the snapshot itself isn't changed by the restored registry
+    again = create_registry()
+    register_systems(again)
+    again.restore(path, mmap=mmap)
+    assert again.get(0, 'position')['x'] == 1.0
+
+    # restored containers still grow and shrink
+    for i in range(100):
+        restored.add_entity(position={'x': 0.0, 'y': 0.0}, size={'s': 0})
+    restored.remove_component(0, 'position')
+    assert len(restored.components['position']) == 109
+    assert len(restored.components['size']) == 109
+
+
+def test_restore_empty(tmp_path):
+    r = create_registry()
+    path = tmp_path / 'empty.snapshot'
+    r.snapshot(path)
+    restored = create_registry()
+    restored.restore(path)
+    restored.add_entity(position={'x': 1.0, 'y': 2.0}, size={'s': 1})
+    assert restored.get(0, 'position')['y'] == 2.0
+    assert restored.get(0, 'size')['s'] == 1
+
+
+def test_restore_mismatch(tmp_path):
+    r = create_registry()
+    path = tmp_path / 'world.snapshot'
+    r.snapshot(path)
+
+    other = Registry()
+    other.register_component('position', ArrayContainer([('x', 'f8')]))
+    with pytest.raises(ValueError):
+        other.restore(path)
+
+    other = create_registry()
+    register_systems(other)
+    with pytest.raises(ValueError):
+        other.restore(path)
+
+
+def test_snapshot_generations(tmp_path):
+    r = create_registry()
+    e0 = r.add_entity(name='zero')
+    e1 = r.add_entity(name='one')
+    r.remove_component(e0, 'name')
+    r.release_entity_id(e0)
+    r.remove_component(e1, 'name')
+    r.release_entity_id(e1)
+    e2 = r.add_entity(name='two')
+
+    path = tmp_path / 'world.snapshot'
+    r.snapshot(path)
+    restored = create_registry()
+    restored.restore(path)
+    assert restored.is_alive(e2)
+    assert not restored.is_alive(e0)
+    assert restored.create_entity_id() == r.create_entity_id()
@@ -0,0 +1,77 @@
+import numpy as np
+
+from secundus.registry import (
+    Registry, ArrayContainer, DataFrameContainer, DictContainer)
+from secundus.spatial import GridIndex
+from secundus.vectorized import vectorized_system
+
+
+def brute_pairs(points, radius):
+    result = []
+    for i in range(len(points)):
+        for j in range(i + 1, len(points)):
+            if ((points[i] - points[j]) ** 2).sum() <= radius * radius:
+                result.append((i, j))
+    return sorted(result)
+
+
+def test_grid_index_queries():
+    r = Registry()
+    r.register_component('position', ArrayContainer([('x', 'f8'),
+                                                     ('y', 'f8')]))
+    grid = r.add_index('position', GridIndex(1.0))
+    rng = np.random.default_rng(0)
+    points = rng.uniform(-5, 5, size=(200, 2))
+    r.add_entities(200, position={'x': points[:, 0], 'y': points[:, 1]})
+    assert len(grid) == 200
+
+    found = sorted(map(tuple, grid.pairs(0.7).tolist()))
+    assert found == brute_pairs(points, 0.7)
+
+    inside = grid.in_box((-1, -2), (2, 1))
+    expected = np.nonzero(((points >= (-1, -2)) &
+                           (points <= (2, 1))).all(axis=1))[0]
+    assert sorted(inside.tolist()) == expected.tolist()
+
+    near, = grid.within([(0.0, 0.0)], 1.5)
+    expected = np.nonzero((points ** 2).sum(axis=1) <= 1.5 ** 2)[0]
+    assert sorted(near.tolist()) == expected.tolist()
+
+    neighbors = grid.neighbors([0, 1], 2.0)
+    for entity_id, found in zip([0, 1], neighbors):
+        distances = ((points - points[entity_id]) ** 2).sum(axis=1)
+        expected = set(np.nonzero(distances <= 4.0)[0].tolist())
+        assert set(found.tolist()) == expected - {entity_id}
+
+
+def test_grid_index_incremental():
+    r = Registry()
+    r.register_component('position', DataFrameContainer())
+    r.register_component('velocity', DataFrameContainer())
+    r.add_entity(position={'x': 0.5, 'y': 0.5})
+    grid = r.add_index('position', GridIndex(1.0))
+    r.add_entity(position={'x': 10.5, 'y': 0.5}, velocity={'x': -10.0})
+    assert grid.in_box((0, 0), (1, 1)).tolist() == [0]
+
+    def move(update, r, entity_ids, positions, velocities):
+        positions['x'] += velocities['x']
+
+    r.register_system(vectorized_system(move, ['position', 'velocity']))
+    r.execute(None)
+    assert sorted(grid.in_box((0, 0), (1, 1)).tolist()) == [0, 1]
+    assert grid.pairs(0.1).tolist() == [[0, 1]]
+
+    r.remove_component(0, 'position')
+    assert grid.in_box((0, 0), (1, 1)).tolist() == [1]
+    assert len(grid.buckets) == 1
+
+
+def test_grid_index_dict_container():
+    r = Registry()
+    r.register_component('position', DictContainer())
+    grid = r.add_index('position', GridIndex(2.0))
+    e = r.add_entity(position={'x': 1.0, 'y': 1.0})
+    r.components['position'][e]['x'] = 5.0
+    r.mark_changed(e, 'position')
+    assert grid.in_box((0, 0), (2, 2)).tolist() == []
+    assert grid.in_box((4, 0), (6, 2)).tolist() == [e]
@@ -0,0 +1,223 @@
+import numpy as np
+import pytest
+
+from secundus.registry import (
+    Registry, ArrayContainer, SparseSetContainer, DataFrameContainer, Query)
+from secundus.vectorized import vectorized_system, ColumnsView
+
+
+def update_position(update, r, entity_ids, positions, velocities):
+    positions['x'] += velocities['speed'] * update
+
+
+@pytest.mark.parametrize('container', [
+    lambda dtype: ArrayContainer(dtype),
+    lambda dtype: SparseSetContainer(dtype),
+    lambda dtype: DataFrameContainer(),
+])
+def test_vectorized_system(container):
+    r = Registry()
+    r.register_component('position', container([('x', 'f8')]))
+    r.register_component('velocity', container([('speed', 'f8')]))
+
+    s = vectorized_system(update_position, ['position', 'velocity'])
+    r.register_system(s)
+
+    r.add_component(3, 'velocity', {'speed': 3.0})
+    r.add_component(1, 'position', {'x': 10.0})
+    r.add_component(2, 'position', {'x': 20.0})
+    r.add_component(3, 'position', {'x': 30.0})
+    r.add_component(1, 'velocity', {'speed': 1.0})
+    r.add_component(4, 'velocity', {'speed': 4.0})
+
+    r.execute(2.0)
+
+    assert s.sorted_index().tolist() == [1, 3]
+    assert r.get(1, 'position')['x'] == 12.0
+    assert r.get(2, 'position')['x'] == 20.0
+    assert r.get(3, 'position')['x'] == 36.0
+
+    r.add_component(2, 'velocity', {'speed': 2.0})
+    r.remove_component(1, 'velocity')
+    r.execute(1.0)
+
+    assert s.sorted_index().tolist() == [2, 3]
+    assert r.get(1, 'position')['x'] == 12.0
+    assert r.get(2, 'position')['x'] == 22.0
+    assert r.get(3, 'position')['x'] == 39.0
+
+
+def test_vectorized_system_without():
+    r = Registry()
+    r.register_component('position', ArrayContainer([('x', 'f8')]))
+    r.register_component('velocity', ArrayContainer([('speed', 'f8')]))
+    r.register_component('frozen')
+
+    s = vectorized_system(update_position, Query(
+        ['position', 'velocity'], without=['frozen']))
+    r.register_system(s)
+
+    r.add_entities(3, position={'x': np.zeros(3)},
+                   velocity={'speed': np.ones(3)})
+    r.add_component(1, 'frozen', True)
+    r.execute(1.0)
+
+    assert s.sorted_index().tolist() == [0, 2]
+    assert r.get(0, 'position')['x'] == 1.0
+    assert r.get(1, 'position')['x'] == 0.0
+
+    r.remove_component(1, 'frozen')
+    r.add_component(2, 'frozen', True)
+    r.execute(1.0)
+
+    assert s.sorted_index().tolist() == [0, 1]
+    assert r.get(0, 'position')['x'] == 2.0
+    assert r.get(1, 'position')['x'] == 1.0
+    assert r.get(2, 'position')['x'] == 1.0
+
+
+def test_vectorized_system_contiguous_rows():
+    r = Registry()
+    r.register_component('position', ArrayContainer([('x', 'f8')]))
+    r.register_component('velocity', ArrayContainer([('speed', 'f8')]))
+
+    s = vectorized_system(update_position, ['position', 'velocity'])
+    r.register_system(s)
+
+    r.add_entities(5, position={'x': np.zeros(5)},
+                   velocity={'speed': np.arange(5.0)})
+    r.execute(1.0)
+
+    positions, velocities = s.views(r.component_containers(s.component_ids))
+    assert positions.rows == slice(0, 5)
+    assert len(positions) == 5
+    assert r.components['position'].value()['x'].tolist() == [
+        0.0, 1.0, 2.0, 3.0, 4.0]
+
+
+def test_columns_view_write_back():
+    values = np.zeros(4, dtype=[('x', 'f8')])
+    view = ColumnsView(values, np.array([3, 1]))
+    view['x'] = [1.0, 2.0]
+    view['x'] *= 10
+    assert values['x'].tolist() == [0.0, 20.0, 0.0, 10.0]
+
+
+def test_vectorized_system_dict_container():
+    r = Registry()
+    r.register_component('position')
+    r.register_system(vectorized_system(update_position, ['position']))
+    r.add_entity(position={'x': 1.0})
+    with pytest.raises(TypeError):
+        r.execute(1.0)
+
+
+def integrate(update, r, entity_ids, positions, velocities):
+    positions['x'] += velocities['speed'] * update
+
+
+def damp(update, r, entity_ids, positions, velocities):
+    velocities['speed'] *= 0.5
+
+
+def clamp(update, r, entity_ids, positions, velocities):
+    positions['x'] = np.minimum(positions['x'], 100.0)
+
+
+@pytest.mark.parametrize('container', [
+    lambda dtype: ArrayContainer(dtype),
+    lambda dtype: SparseSetContainer(dtype),
+    lambda dtype: DataFrameContainer(),
+])
+@pytest.mark.parametrize('block_size', [None, 3])
+def test_fused_systems(container, block_size):
+    def create():
+        r = Registry()
+        r.register_component('position', container([('x', 'f8')]))
+        r.register_component('velocity', container([('speed', 'f8')]))
+        for func in [integrate, damp, clamp]:
+            r.register_system(
+                vectorized_system(func, ['position', 'velocity']))
+        for i in range(10):
+            r.add_entity(position={'x': i * 10.0},
+                         velocity={'speed': i * 2.0})
+        # entities that aren't in contiguous rows
+        r.add_component(20, 'position', {'x': 5.0})
+        r.remove_component(4, 'velocity')
+        return r
+
+    plain = create()
+    fused = create()
+    fused.enable_fusion(block_size)
+    steps = fused.execution_plan().steps
+    assert len(steps) == 1
+    assert steps[0][0].systems == list(fused.systems)
+    for update in [1.0, 2.0]:
+        plain.execute(update)
+        fused.execute(update)
+    for entity_id in list(range(10)) + [20]:
+        assert (fused.get(entity_id, 'position')['x'] ==
+                plain.get(entity_id, 'position')['x'])
+        if entity_id in plain.components['velocity']:
+            assert (fused.get(entity_id, 'velocity')['speed'] ==
+                    plain.get(entity_id, 'velocity')['speed'])
+    assert fused.get(9, 'position')['x'] == 100.0
+
+    fused.disable_fusion()
+    assert len(fused.execution_plan().steps) == 3
+
+
+def test_fusion_boundaries():
+    r = Registry()
+    r.register_component('position', ArrayContainer([('x', 'f8')]))
+    r.register_component('velocity', ArrayContainer([('speed', 'f8')]))
+    systems = [
+        vectorized_system(integrate, ['position', 'velocity']),
+        vectorized_system(damp, ['position', 'velocity']),
+        vectorized_system(clamp, ['position', 'velocity']),
+        vectorized_system(lambda update, r, entity_ids, positions: None,
+                          ['position']),
+        vectorized_system(integrate, ['position', 'velocity']),
+    ]
+    for system in systems[:2]:
+        r.register_system(system)
+    r.add_sync_point()
+    for system in systems[2:]:
+        r.register_system(system)
+    r.enable_fusion()
+    steps = r.execution_plan().steps
+    # the sync point after the second system ends the first fusion
+    assert steps[0][0].systems == systems[:2]
+    assert steps[0][2]
+    assert [step[0] for step in steps[1:]] == systems[2:]
+    r.register_system(vectorized_system(clamp, ['position', 'velocity']))
+    assert r.execution_plan().steps[-1][0].systems == r.systems[-2:]
+    systems[4].fusable = False
+    r.plan = None
+    assert r.execution_plan().steps[-1][0] is r.systems[-1]
+
+
+def test_fused_systems_without_entities():
+    r = Registry()
+    r.register_component('position', ArrayContainer([('x', 'f8')]))
+    r.register_component('velocity', ArrayContainer([('speed', 'f8')]))
+    calls = []
+
+    def record(update, r, entity_ids, positions, velocities):
+        calls.append(len(entity_ids))
+
+    for i in range(2):
+        r.register_system(vectorized_system(record,
+                                            ['position', 'velocity']))
+    r.add_entity(position={'x': 1.0})
+    r.enable_fusion()
+    fused = r.execution_plan().steps[0][0]
+    assert fused.func is not None
+    assert fused.reads == {'position', 'velocity'}
+    r.execute(1.0)
+    assert calls == []
+
+    r.add_component(0, 'velocity', {'speed': 1.0})
+    r.execute(1.0)
+    assert calls == [1, 1]
+    assert len(fused.entity_ids) == 1
@@ -0,0 +1,335 @@
+from functools import partial
+
+import numpy as np
+import pandas as pd
+
+from .instrument import system_name
+from .registry import System
+
+
+# about the size of a level 2 cache
+BLOCK_BYTES = 256 * 1024
+
+
+class ColumnsView:
+    """Columns of a component container for the entities of a system.
+
+    Getting a column gives a NumPy array with the values for the
+    entities of the system, in the order of its sorted entity ids.
+    Setting a column writes the values back into the container, so
+    augmented assignment works::
+
+      positions['x'] += velocities['speed'] * update.dt
+
+    When the entities occupy a contiguous range of rows the arrays are
+    views on the container; otherwise the rows are taken.
+
+    :param values: the container value, a NumPy structured array or a
+      DataFrame.
+    :param rows: the rows of the entities in values, as an array or a
+      slice.
+    :param on_write: optional function called after a column is set.
+    """
+    def __init__(self, values, rows, on_write=None):
+        self.values = values
+        self.rows = rows
+        self.on_write = on_write
+
+    def _column(self, name):
+        if isinstance(self.values, pd.DataFrame):
+            return self.values[name].to_numpy()
+        return self.values[name]
+
+    def __getitem__(self, name):
+        return self._column(name)[self.rows]
+
+    def __setitem__(self, name, value):
+        self._write(name, value)
+        if self.on_write is not None:
+            self.on_write()
+
+    def _write(self, name, value):
+        column = self._column(name)
+        if isinstance(self.rows, slice):
+            target = column[self.rows]
+            if _same_memory(target, value):
+                # updated in place through the view
+                return
+        if column.flags.writeable:
+            column[self.rows] = value
+            return
+        # a DataFrame that doesn't give us a writeable view
+        self.values.iloc[self.rows, self.values.columns.get_loc(name)] = value
+
+    def __len__(self):
+        if isinstance(self.rows, slice):
+            return self.rows.stop - self.rows.start
+        return len(self.rows)
+
+
+def _same_memory(a, b):
+    return (isinstance(b, np.ndarray) and
+            a.__array_interface__['data'] == b.__array_interface__['data'] and
+            a.strides == b.strides and a.shape == b.shape)
+
+
+class _Rows:
+    def __init__(self):
+        self.rows = None
+        self.container_version = None
+        self.index_version = None
+
+
+class VectorizedSystem(System):
+    """A system that works on columns of NumPy arrays.
+
+    The entities tracked by the system are kept as a sorted NumPy array
+    of entity ids. For each component container the rows of these
+    entities are looked up once and cached until either the system's
+    entities or the container's rows change.
+
+    func gets the update, the registry, the sorted entity id array and a
+    :class:`ColumnsView` for each component id. The containers must be
+    array containers or DataFrame containers. A :class:`Query` can
+    exclude components, but it can't have optional ones.
+
+    Set ``fusable`` to false for a system that must see all its
+    entities at once; see :class:`FusedSystem`.
+    """
+    fusable = True
+
+    def __init__(self, func, component_ids, reads=None, writes=None):
+        super().__init__(func, component_ids, reads, writes)
+        if self.query.optional:
+            raise ValueError(
+                "Vectorized systems cannot have optional components")
+        self.index = np.zeros(0, dtype=np.int64)
+        self.index_version = 0
+        self.index_dirty = False
+        self.cached_rows = [_Rows() for component_id in self.component_ids]
+
+    def track(self, entity_id):
+        if entity_id not in self.entity_ids:
+            super().track(entity_id)
+            self.index_dirty = True
+
+    def track_many(self, entity_ids):
+        super().track_many(entity_ids)
+        self.index_dirty = True
+
+    def forget(self, entity_id):
+        if entity_id in self.entity_ids:
+            super().forget(entity_id)
+            self.index_dirty = True
+
+    def reset(self, entity_ids):
+        super().reset(entity_ids)
+        self.index_dirty = True
+
+    def sorted_index(self):
+        """The tracked entity ids as a sorted NumPy array.
+        """
+        if self.index_dirty:
+            self.index = np.sort(np.fromiter(
+                self.entity_ids, dtype=np.int64, count=len(self.entity_ids)))
+            self.index_version += 1
+            self.index_dirty = False
+        return self.index
+
+    def rows(self, i, container, values):
+        """Get the rows of our entities in values of the i-th container.
+
+        Returns an array of rows, or a slice if the rows are contiguous.
+        """
+        index = self.sorted_index()
+        cached = self.cached_rows[i]
+        version = container.version
+        if (cached.container_version != version or
+                cached.index_version != self.index_version):
+            if isinstance(values, pd.DataFrame):
+                rows = values.index.get_indexer(index)
+                if (rows < 0).any():
+                    raise KeyError(index[rows < 0][0])
+            else:
+                rows = container.rows(index)
+            cached.rows = _contiguous(rows)
+            cached.container_version = version
+            cached.index_version = self.index_version
+        return cached.rows
+
+    def views(self, component_containers, registry=None):
+        """Get a :class:`ColumnsView` for each container.
+
+        If registry is given, writes to columns of components that have
+        indexes or watchers are reported with
+        :meth:`Registry.mark_changed_many`.
+        """
+        result = []
+        for i, container in enumerate(component_containers):
+            if not hasattr(container, 'version'):
+                raise TypeError(
+                    "Vectorized systems need array or DataFrame "
+                    "containers, not: %r" % container)
+            values = container.value()
+            result.append(ColumnsView(values,
+                                      self.rows(i, container, values),
+                                      self.on_write(registry, i)))
+        return result
+
+    def on_write(self, registry, i):
+        """Get what to call after a write to the i-th component, if any.
+        """
+        if registry is None:
+            return None
+        component_id = self.component_ids[i]
+        if not (registry.component_to_indexes.get(component_id) or
+                registry.component_to_watchers.get(component_id)):
+            return None
+        return partial(registry.mark_changed_many, self.sorted_index(),
+                       component_id)
+
+    def execute(self, update, registry, component_containers):
+        """Execute this system with column views.
+        """
+        views = self.views(component_containers, registry)
+        self.func(update, registry, self.sorted_index(), *views)
+
+    def fusion_key(self):
+        """Systems with the same key can be fused, see :class:`FusedSystem`.
+        """
+        if not self.fusable:
+            return None
+        return (type(self), tuple(self.component_ids),
+                tuple(self.query.without))
+
+    def fuse(self, systems, block_size=None):
+        """Fuse this system with the systems that follow it.
+        """
+        return FusedSystem([self] + list(systems), block_size)
+
+
+class FusedSystem(System):
+    """Vectorized systems over the same components, run as one pass.
+
+    The component views are gathered once for all systems. The entities
+    are then split into blocks small enough to stay in the CPU cache,
+    and each system runs over a block before the next block is done.
+    Columns that are written are written back into the containers once
+    at the end.
+
+    Because a system only sees one block at a time, fusion is only
+    correct for systems that treat each entity on its own, like most
+    integration, damping and clamping systems do. Fusion is turned on
+    with :meth:`Registry.enable_fusion`.
+
+    :param systems: vectorized systems with the same
+      :meth:`VectorizedSystem.fusion_key`, in execution order.
+    :param block_size: the number of entities in a block. By default
+      this is based on the size of a row of all components together.
+    """
+    def __init__(self, systems, block_size=None):
+        first = systems[0]
+        if any(system.writes is None for system in systems):
+            writes = None
+        else:
+            writes = frozenset().union(
+                *[system.writes for system in systems])
+        super().__init__(
+            partial(_call_all, [system.func for system in systems]),
+            first.query, frozenset().union(
+                *[system.reads for system in systems]), writes)
+        self.systems = systems
+        self.block_size = block_size
+        self.name = '+'.join(system_name(system) for system in systems)
+        # the fused systems track the entities, not this one
+        self.entity_ids = first.entity_ids
+
+    def execute(self, update, registry, component_containers):
+        """Execute all fused systems block by block.
+
+        func calls the function of each fused system on a block.
+        """
+        first = self.systems[0]
+        self.entity_ids = first.entity_ids
+        index = first.sorted_index()
+        count = len(index)
+        if not count:
+            return
+        gathered = []
+        row_bytes = 0
+        for i, container in enumerate(component_containers):
+            if not hasattr(container, 'version'):
+                raise TypeError(
+                    "Vectorized systems need array or DataFrame "
+                    "containers, not: %r" % container)
+            values = container.value()
+            rows = first.rows(i, container, values)
+            if isinstance(rows, slice):
+                # blocks can be views on the container itself
+                data, offset = values, rows.start
+            else:
+                data, offset = _gather(values, rows), 0
+            gathered.append((values, rows, data, offset))
+            row_bytes += _row_bytes(values)
+        block_size = self.block_size
+        if block_size is None:
+            block_size = max(1, BLOCK_BYTES // max(row_bytes, 1))
+        written = [False] * len(gathered)
+        for start in range(0, count, block_size):
+            end = min(start + block_size, count)
+            views = [
+                ColumnsView(data, slice(offset + start, offset + end),
+                            partial(written.__setitem__, i, True))
+                for i, (values, rows, data, offset) in enumerate(gathered)]
+            self.func(update, registry, index[start:end], *views)
+        for i, (values, rows, data, offset) in enumerate(gathered):
+            if not written[i]:
+                continue
+            if data is not values:
+                _scatter(values, rows, data)
+            on_write = first.on_write(registry, i)
+            if on_write is not None:
+                on_write()
+
+
+def _call_all(funcs, update, registry, entity_ids, *views):
+    for func in funcs:
+        func(update, registry, entity_ids, *views)
+
+
+def _gather(values, rows):
+    if isinstance(values, pd.DataFrame):
+        return {name: values[name].to_numpy()[rows]
+                for name in values.columns}
+    return values[rows]
+
+
+def _scatter(values, rows, data):
+    if isinstance(values, pd.DataFrame):
+        view = ColumnsView(values, rows)
+        for name, column in data.items():
+            view._write(name, column)
+        return
+    values[rows] = data
+
+
+def _row_bytes(values):
+    if isinstance(values, pd.DataFrame):
+        return sum(dtype.itemsize for dtype in values.dtypes)
+    return values.dtype.itemsize
+
+
+def _contiguous(rows):
+    if not len(rows):
+        return slice(0, 0)
+    start = int(rows[0])
+    if (rows[-1] - start == len(rows) - 1 and
+            (np.diff(rows) == 1).all()):
+        return slice(start, start + len(rows))
+    return rows
+
+
+def vectorized_system(func, component_ids, reads=None, writes=None):
+    """A system where you update components with NumPy arithmetic.
+    """
+    return VectorizedSystem(func, component_ids, reads, writes)
@@ -20,6 +20,7 @@ setup(
         'setuptools',
         'pyglet',
         'dectate',
+        'numpy',
         'pandas',
     ],
     extras_require=dict(